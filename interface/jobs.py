@@ -0,0 +1,128 @@
+import os
+import time
+import uuid
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+
+from .utils.timing_utils import run_timed, log_timings
+
+# Finished jobs are forgotten after this many seconds
+JOB_RETENTION_SECONDS = 3600
+
+_jobs = {}
+_lock = threading.Lock()
+_process_pool = None
+_runner = ThreadPoolExecutor(max_workers=4, thread_name_prefix='conversion-job')
+
+
+def _get_process_pool():
+    """
+    Returns the shared process pool for conversions, created on first use.
+    -> spawn instead of fork, the Django process has running threads
+    """
+    global _process_pool
+    with _lock:
+        if _process_pool is None:
+            workers = getattr(settings, 'CONVERSION_WORKERS', None) or os.cpu_count()
+            _process_pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _process_pool
+
+
+def _reset_process_pool():
+    """
+    Drops a broken pool (a worker crashed, e.g. out of memory), the next job starts a new one.
+    """
+    global _process_pool
+    with _lock:
+        _process_pool = None
+
+
+def _update_job(job_id, **fields):
+    with _lock:
+        _jobs[job_id].update(fields)
+
+
+def _prune_jobs():
+    """
+    Removes finished jobs older than JOB_RETENTION_SECONDS (lock must be held).
+    """
+    now = time.time()
+    for job_id in [j['id'] for j in _jobs.values()
+                   if j['state'] in ('done', 'failed') and now - j['finished'] > JOB_RETENTION_SECONDS]:
+        del _jobs[job_id]
+
+
+def _run_job(job_id, steps):
+    """
+    Runs the steps of a job one after another in the process pool.
+    The stages timed inside a step (see timing_utils.stage) are added to the job as timings.
+    """
+    _update_job(job_id, state='running', started=time.time())
+    timings = []
+    try:
+        for number, (label, func, args, kwargs) in enumerate(steps):
+            _update_job(job_id, step=label)
+            start = time.perf_counter()
+            stages, peak_mb = _get_process_pool().submit(run_timed, func, args, kwargs).result()
+            timings.append({'name': label, 'bytes': None, 'ms': round((time.perf_counter() - start) * 1000, 2),
+                            'peak_mb': peak_mb})
+            timings.extend({**s, 'name': f'{label}/{s["name"]}'} for s in stages)
+            _update_job(job_id, progress=(number + 1) / len(steps), timings=list(timings))
+        _update_job(job_id, state='done', step=None, finished=time.time())
+        log_timings('job', timings, job=job_id, name=get_job(job_id)['name'])
+    except BrokenProcessPool as exc:
+        _reset_process_pool()
+        print(f"[ERROR] job {job_id} failed: {exc}")
+        _update_job(job_id, state='failed', error=str(exc), finished=time.time())
+    except Exception as exc:
+        print(f"[ERROR] job {job_id} failed: {exc}")
+        _update_job(job_id, state='failed', error=str(exc), finished=time.time())
+
+
+def submit_job(name, steps, outputs=None):
+    """
+    Queues a conversion job and returns its id immediately.
+
+    Args:
+        name (str): Short description of the job.
+        steps (list[tuple]): (label, func, args, kwargs) per step. func has to be
+            a module level function, it runs in a separate process.
+        outputs (list[str]): Artifacts (paths relative to the case workspace) the job produces.
+
+    Returns:
+        str: Job id.
+    """
+    job_id = uuid.uuid4().hex
+    with _lock:
+        _prune_jobs()
+        _jobs[job_id] = {
+            'id': job_id,
+            'name': name,
+            'state': 'queued',
+            'step': None,
+            'progress': 0.0,
+            'outputs': outputs or [],
+            'error': None,
+            'timings': [],
+            'created': time.time(),
+            'started': None,
+            'finished': None,
+        }
+    _runner.submit(_run_job, job_id, steps)
+    return job_id
+
+
+def get_job(job_id):
+    """
+    Returns a copy of the job status, or None for an unknown job id.
+    """
+    with _lock:
+        job = _jobs.get(job_id)
+        return dict(job) if job else None
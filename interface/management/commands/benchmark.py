@@ -0,0 +1,242 @@
+import os
+import io
+import json
+import time
+import shutil
+import platform
+import tempfile
+import tracemalloc
+import contextlib
+import statistics
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from interface.utils.dicom_utils import convert_dicom_to_nifti, convert_dicom_to_binary
+from interface.utils.nifti_utils import convert_nifti_to_binary, write_volume_meta
+from interface.utils.seg_utils import convert_segnifti_to_binary
+from interface.utils.landmarks_utils import (
+    read_json_information,
+    apply_axis_permutation,
+    transform_landmarks_to_voxel_space,
+    landmarks_to_point_set,
+    convert_landmarks_to_volume_binary
+)
+from interface.utils.synthetic_utils import (
+    SYNTHETIC_SIZES,
+    synthetic_volume,
+    synthetic_labels,
+    write_synthetic_nifti,
+    write_synthetic_dicom,
+    write_synthetic_landmarks
+)
+
+REPORT_VERSION = 1
+# Relative slowdown (or memory growth) against the baseline that counts as regression
+DEFAULT_TOLERANCE = 0.25
+
+
+def generate_inputs(size, folder):
+    """
+    Writes the synthetic inputs of one size: DICOM series, NIfTI, label map,
+    reference meta and landmark JSON.
+
+    Returns:
+        dict: Paths and input size in bytes.
+    """
+    config = SYNTHETIC_SIZES[size]
+    shape, spacing = config['shape'], list(config['spacing'])
+    origin = [0.0, 0.0, 0.0]
+
+    volume = synthetic_volume(shape)
+    inputs = {
+        'dicom': os.path.join(folder, 'dicom'),
+        'nifti': os.path.join(folder, 'volume.nii.gz'),
+        'labels': os.path.join(folder, 'labels.nii.gz'),
+        'reference_meta': os.path.join(folder, 'volume_base.meta.json'),
+        'landmarks': os.path.join(folder, 'landmarks'),
+        'bytes': volume.nbytes,
+    }
+    write_synthetic_dicom(volume, spacing, inputs['dicom'], origin)
+    write_synthetic_nifti(volume, spacing, inputs['nifti'], origin)
+    write_synthetic_nifti(synthetic_labels(shape), spacing, inputs['labels'], origin)
+    write_volume_meta(shape, spacing, origin, inputs['reference_meta'])
+
+    os.makedirs(inputs['landmarks'], exist_ok=True)
+    write_synthetic_landmarks(config['landmarks'], list(shape), spacing, origin,
+                              os.path.join(inputs['landmarks'], 'landmarks.json'))
+    return inputs
+
+
+def run_landmark_pipeline(landmark_folder, reference_meta_path, out):
+    """
+    Same steps as run_landmarks + landmark_volume in the views.
+    """
+    with open(reference_meta_path, encoding='utf-8') as f:
+        meta = json.load(f)
+    spacing, origin, dims = meta['spacing'], meta['origin'], meta['dims']
+
+    landmarks = apply_axis_permutation(read_json_information(landmark_folder), order=[2, 1, 0])
+    voxel_landmarks = transform_landmarks_to_voxel_space(landmarks, origin, spacing, dims)
+    landmarks_to_point_set(voxel_landmarks, dims, spacing, origin)
+    convert_landmarks_to_volume_binary(voxel_landmarks, dims, spacing, origin,
+                                       os.path.join(out, 'landmarks.bin'), os.path.join(out, 'landmarks.meta.json'))
+
+
+def benchmark_cases(inputs):
+    """
+    Returns the benchmarked conversions as (name, func(out_folder)).
+    """
+    return [
+        ('dicom_to_nifti', lambda out: convert_dicom_to_nifti(
+            inputs['dicom'], os.path.join(out, 'volume_dicom.nii.gz'))),
+        ('dicom_to_binary', lambda out: convert_dicom_to_binary(
+            inputs['dicom'], os.path.join(out, 'volume_dicom.bin'), os.path.join(out, 'volume_dicom.meta.json'))),
+        ('nifti_to_binary', lambda out: convert_nifti_to_binary(
+            inputs['nifti'], os.path.join(out, 'volume_nifti.bin'), os.path.join(out, 'volume_nifti.meta.json'))),
+        ('segnifti_to_binary', lambda out: convert_segnifti_to_binary(
+            inputs['labels'], os.path.join(out, 'segmentation_result.bin'),
+            os.path.join(out, 'segmentation_result.meta.json'), inputs['reference_meta'])),
+        ('landmarks', lambda out: run_landmark_pipeline(inputs['landmarks'], inputs['reference_meta'], out)),
+    ]
+
+
+def measure(func, folder, repeat, profile_memory=True):
+    """
+    Runs func `repeat` times in fresh output folders and once more under tracemalloc
+    (tracing slows allocations down, so it is not part of the timed runs).
+
+    Returns:
+        dict: seconds per run, best, median and peak traced memory in MB.
+    """
+    seconds = []
+    for n in range(repeat + int(profile_memory)):
+        out = os.path.join(folder, f'run{n}')
+        os.makedirs(out)
+        tracing = n == repeat
+        if tracing:
+            tracemalloc.start()
+        start = time.perf_counter()
+        func(out)
+        elapsed = time.perf_counter() - start
+        if tracing:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        else:
+            seconds.append(elapsed)
+        shutil.rmtree(out)
+
+    return {
+        'seconds': [round(s, 4) for s in seconds],
+        'best': round(min(seconds), 4),
+        'median': round(statistics.median(seconds), 4),
+        'peak_mb': round(peak / 2**20, 2) if profile_memory else None,
+    }
+
+
+def compare_reports(report, baseline, tolerance):
+    """
+    Compares the results with a baseline report (matched by case and size).
+
+    Returns:
+        list: One dict per matched result with ratios and a regression flag.
+    """
+    previous = {(r['case'], r['size']): r for r in baseline.get('results', [])}
+    comparison = []
+    for result in report['results']:
+        old = previous.get((result['case'], result['size']))
+        if old is None:
+            continue
+        time_ratio = result['median'] / old['median'] if old['median'] else None
+        memory_ratio = None
+        if result.get('peak_mb') and old.get('peak_mb'):
+            memory_ratio = result['peak_mb'] / old['peak_mb']
+        comparison.append({
+            'case': result['case'],
+            'size': result['size'],
+            'time_ratio': round(time_ratio, 3) if time_ratio else None,
+            'memory_ratio': round(memory_ratio, 3) if memory_ratio else None,
+            'regression': any(r is not None and r > 1 + tolerance for r in (time_ratio, memory_ratio)),
+        })
+    return comparison
+
+
+class Command(BaseCommand):
+    help = ("Benchmarks the conversions (DICOM, NIfTI, segmentation, landmarks) on synthetic "
+            "cases and writes a JSON report, optionally compared against a baseline report.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', default=['small', 'medium'], choices=sorted(SYNTHETIC_SIZES))
+        parser.add_argument('--cases', nargs='+', help='Only run these cases (default: all).')
+        parser.add_argument('--repeat', type=int, default=3, help='Timed runs per case.')
+        parser.add_argument('--no-memory', action='store_true', help='Skip the memory profiled run.')
+        parser.add_argument('--output', default='benchmark_report.json', help='Path of the JSON report.')
+        parser.add_argument('--baseline', help='Baseline report to compare against.')
+        parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                            help='Allowed relative slowdown/memory growth before a case counts as regression.')
+        parser.add_argument('--workdir', help='Folder for inputs and outputs (default: temporary folder).')
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('--repeat has to be at least 1')
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as f:
+                baseline = json.load(f)
+
+        workdir = options['workdir'] or tempfile.mkdtemp(prefix='apos-benchmark-')
+        os.makedirs(workdir, exist_ok=True)
+        report = {
+            'version': REPORT_VERSION,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'machine': {
+                'platform': platform.platform(),
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'cpus': os.cpu_count(),
+            },
+            'repeat': options['repeat'],
+            'results': [],
+        }
+
+        try:
+            for size in options['sizes']:
+                size_dir = os.path.join(workdir, size)
+                os.makedirs(size_dir, exist_ok=True)
+                self.stdout.write(f"[INFO] Generating {size} inputs {SYNTHETIC_SIZES[size]['shape']}")
+                inputs = generate_inputs(size, size_dir)
+
+                for name, func in benchmark_cases(inputs):
+                    if options['cases'] and name not in options['cases']:
+                        continue
+                    # the converters log every step, keep the benchmark output readable
+                    quiet = contextlib.redirect_stdout(io.StringIO()) if options['verbosity'] < 2 else contextlib.nullcontext()
+                    with quiet:
+                        result = measure(func, os.path.join(size_dir, name), options['repeat'],
+                                         profile_memory=not options['no_memory'])
+                    result.update({'case': name, 'size': size, 'input_mb': round(inputs['bytes'] / 2**20, 2)})
+                    report['results'].append(result)
+                    self.stdout.write(f"[INFO] {name:<20} {size:<8} median {result['median']:.3f}s "
+                                      f"best {result['best']:.3f}s peak {result['peak_mb']} MB")
+        finally:
+            if not options['workdir']:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+        if baseline is not None:
+            report['baseline'] = {
+                'created': baseline.get('created'),
+                'tolerance': options['tolerance'],
+                'comparison': compare_reports(report, baseline, options['tolerance']),
+            }
+
+        with open(options['output'], 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        self.stdout.write(f"[INFO] Report written to {options['output']}")
+
+        if baseline is not None:
+            regressions = [c for c in report['baseline']['comparison'] if c['regression']]
+            for c in report['baseline']['comparison']:
+                self.stdout.write(f"[INFO] {c['case']:<20} {c['size']:<8} time x{c['time_ratio']} memory x{c['memory_ratio']}"
+                                  + ('  REGRESSION' if c['regression'] else ''))
+            if regressions:
+                raise CommandError(f"{len(regressions)} case(s) slower or larger than the baseline")
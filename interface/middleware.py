@@ -0,0 +1,31 @@
+from django.conf import settings
+
+from .utils.timing_utils import start_timing, stop_timing, stage, server_timing_header, log_timings
+
+
+class ServerTimingMiddleware:
+    """
+    Collects the timed stages of a request (see timing_utils.stage), returns
+    them in the Server-Timing header and logs them as JSON.
+    -> static media is skipped, it would only add noise to the log
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.path.startswith(settings.STATIC_URL):
+            return self.get_response(request)
+
+        token = start_timing()
+        try:
+            with stage('total'):
+                response = self.get_response(request)
+        finally:
+            stages = stop_timing(token)
+
+        response['Server-Timing'] = server_timing_header(stages)
+        if len(stages) > 1 or stages[0]['ms'] > 1000:   # only requests that did measurable work
+            log_timings('request', stages, method=request.method, path=request.path,
+                        status=response.status_code)
+        return response
@@ -0,0 +1,22 @@
+// ======================================== //
+// JOBS.JS                                  //
+// Shared by upload, viewer and segmarks    //
+// ======================================== //
+
+// ===== CONVERSION JOBS =====
+// Polls /jobs/<id>/ until the background conversion is done (resolve) or failed (reject)
+function waitForJob(jobId, interval = 500) {
+  return new Promise((resolve, reject) => {
+    const poll = () => {
+      fetch(`/jobs/${jobId}/`)
+        .then(response => response.json())
+        .then(job => {
+          if (job.state === 'done') return resolve(job);
+          if (job.state === 'failed' || job.error) return reject(new Error(job.error || 'Conversion failed'));
+          setTimeout(poll, interval);
+        })
+        .catch(reject);
+    };
+    poll();
+  });
+}
@@ -23,6 +23,160 @@ function addLog(message) {
   logList.scrollTop = logList.scrollHeight;
 }
 
+// ===== SURFACE MESHES =====
+// Fetches the label meshes of the segmentation (/meshes/), the X-Mesh header lists per label
+// its vertex/triangle counts and byte offset: float32 vertices (x, y, z world) then uint32 triangles
+function fetchMeshes() {
+  return fetch('/meshes/?t=' + new Date().getTime())
+    .then(response => {
+      if (!response.ok) throw new Error('Meshes not found.');
+      const index = JSON.parse(response.headers.get('X-Mesh'));
+      return response.arrayBuffer().then(buffer => ({ index, buffer }));
+    })
+    .then(({ index, buffer }) => index.labels.map(({ label, vertices, triangles, offset }) => {
+      const points = new Float32Array(buffer, offset, vertices * 3);
+      const faces = new Uint32Array(buffer, offset + vertices * 12, triangles * 3);
+      // vtk cell array: 3, a, b, c per triangle
+      const polys = new Uint32Array(triangles * 4);
+      for (let i = 0; i < triangles; i++) {
+        polys[4 * i] = 3;
+        polys.set(faces.subarray(3 * i, 3 * i + 3), 4 * i + 1);
+      }
+      return { label, points, polys };
+    }));
+}
+
+// Replaces the volume rendering of a segmentation in the 3D viewer by its label meshes
+function addMeshesToViewer(meshes, datasetId) {
+  const { renderer, renderWindow, actors } = viewerManagers['viewer-3d'];
+  if (!renderer) return;
+  if (actors[datasetId]) {
+    renderer.removeViewProp(actors[datasetId]);
+    delete actors[datasetId];
+  }
+
+  const entry = segmentationLabels[datasetId];
+  meshes.forEach(({ label, points, polys }, i) => {
+    const polyData = vtk.Common.DataModel.vtkPolyData.newInstance();
+    polyData.getPoints().setData(points, 3);
+    polyData.getPolys().setData(polys);
+
+    const normals = vtk.Filters.Core.vtkPolyDataNormals.newInstance();
+    normals.setInputData(polyData);
+    const mapper = vtk.Rendering.Core.vtkMapper.newInstance();
+    mapper.setInputConnection(normals.getOutputPort());
+    const actor = vtk.Rendering.Core.vtkActor.newInstance();
+    actor.setMapper(mapper);
+    actor.getProperty().setColor(...LABEL_COLORS[i % LABEL_COLORS.length]);
+    actor.setVisibility(!(entry && entry.hidden.has(label)));
+
+    renderer.addActor(actor);
+    actors[`${datasetId}-mesh-${label}`] = actor;
+  });
+  renderer.resetCamera();
+  renderWindow.render();
+}
+
+// ===== VOLUME CONTAINERS =====
+// Fetches one or more layers (.vol containers) in a single request from /layers/
+// Container: 80 byte header (magic, version, dtype, dims, spacing, origin, payload size, metadata size),
+// then the voxels, then the metadata JSON (crop offset, reference dims, label index of overlays)
+const CONTAINER_HEADER_BYTES = 80;
+const CONTAINER_DTYPES = { 1: Uint8Array, 2: Int16Array, 3: Uint16Array, 4: Float32Array };
+
+function fetchLayers(names) {
+  const query = names.map(name => `layer=${encodeURIComponent(name)}`).join('&');
+  return fetch(`/layers/?${query}&t=` + new Date().getTime())
+    .then(response => {
+      if (!response.ok) throw new Error(`Layers ${names.join(', ')} not found.`);
+      const index = JSON.parse(response.headers.get('X-Layers'));
+      return response.arrayBuffer().then(buffer => ({ index, buffer }));
+    })
+    .then(({ index, buffer }) => {
+      const layers = {};
+      index.layers.forEach(({ name, offset }) => {
+        const view = new DataView(buffer, offset, CONTAINER_HEADER_BYTES);
+        const dims = [0, 1, 2].map(i => view.getUint32(8 + 4 * i, true));
+        const spacing = [0, 1, 2].map(i => view.getFloat64(20 + 8 * i, true));
+        const origin = [0, 1, 2].map(i => view.getFloat64(44 + 8 * i, true));
+        const payloadBytes = Number(view.getBigUint64(68, true));
+        const metaBytes = view.getUint32(76, true);
+        const ArrayType = CONTAINER_DTYPES[view.getUint16(6, true)];
+
+        // copy, the payload of a layer is not aligned for 16/32 bit types
+        const start = offset + CONTAINER_HEADER_BYTES;
+        const data = new ArrayType(buffer.slice(start, start + payloadBytes));
+        const meta = metaBytes
+          ? JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, start + payloadBytes, metaBytes)))
+          : {};
+        layers[name] = { data, dims, spacing, origin, meta };
+      });
+      return layers;
+    });
+}
+
+// ===== SEGMENTATION LABELS =====
+// Segmentations keep their label values (0 is background), the label index
+// (voxels, bbox, centroid per label) comes with the metadata of the preview container
+const LABEL_COLORS = [
+  [1.0, 0.0, 0.0], [0.0, 0.8, 0.0], [0.0, 0.4, 1.0], [1.0, 0.8, 0.0],
+  [1.0, 0.0, 1.0], [0.0, 1.0, 1.0], [1.0, 0.5, 0.0], [0.6, 0.3, 1.0],
+];
+const segmentationLabels = {};   // datasetId -> { labels: {label: index entry}, hidden: Set }
+
+// Colour and opacity per label, hidden labels are transparent (values between labels as well)
+function setLabelTransferFunctions(ctfun, ofun, labels, hidden) {
+  ctfun.removeAllPoints();
+  ofun.removeAllPoints();
+  ctfun.addRGBPoint(0, 0.0, 0.0, 0.0);
+  ofun.addPoint(0.0, 0.0);
+  Object.keys(labels).map(Number).sort((a, b) => a - b).forEach((label, i) => {
+    ctfun.addRGBPoint(label, ...LABEL_COLORS[i % LABEL_COLORS.length]);
+    ofun.addPoint(label - 0.5, 0.0);
+    ofun.addPoint(label, hidden.has(label) ? 0.0 : 1.0);
+    ofun.addPoint(label + 0.5, 0.0);
+  });
+}
+
+// Shows or hides one structure of a segmentation without fetching it again
+function setLabelVisible(datasetId, label, visible) {
+  const entry = segmentationLabels[datasetId];
+  if (!entry) return;
+  if (visible) entry.hidden.delete(label); else entry.hidden.add(label);
+
+  Object.values(viewerManagers).forEach(({ renderWindow, actors }) => {
+    const actor = actors[datasetId];
+    if (actor) {
+      const property = actor.getProperty();
+      setLabelTransferFunctions(property.getRGBTransferFunction(0), property.getScalarOpacity(0), entry.labels, entry.hidden);
+      actor.modified();
+    }
+    const mesh = actors[`${datasetId}-mesh-${label}`];
+    if (mesh) mesh.setVisibility(visible);
+    renderWindow.render();
+  });
+}
+
+// One checkbox per label of the label index (in the colour of the label), toggles setLabelVisible
+function buildLabelToggles(datasetId, labels) {
+  const container = document.getElementById('seg-label-toggles');
+  container.innerHTML = '';
+  Object.keys(labels).map(Number).sort((a, b) => a - b).forEach((label, i) => {
+    const color = LABEL_COLORS[i % LABEL_COLORS.length].map(c => Math.round(c * 255)).join(', ');
+    const checkbox = document.createElement('input');
+    checkbox.type = 'checkbox';
+    checkbox.checked = true;
+    checkbox.addEventListener('change', () => setLabelVisible(datasetId, label, checkbox.checked));
+
+    const swatch = document.createElement('span');
+    swatch.style.cssText = `display: inline-block; width: 10px; height: 10px; margin: 0 4px; background: rgb(${color});`;
+
+    const toggle = document.createElement('label');
+    toggle.append(checkbox, swatch, `Label ${label} (${labels[label].voxels} voxels)`);
+    container.append(toggle, document.createElement('br'));
+  });
+}
+
 //////////////////////////////////////////////////////////////////////////////////////////////
       //=====================//
       // Viewer Definition   //
@@ -138,7 +292,10 @@ function addVolumeToViewers(volumeData, datasetId) {
         volumeProperty.setInterpolationTypeToLinear();
         const ctfun = vtk.Rendering.Core.vtkColorTransferFunction.newInstance();
         const ofun = vtk.Common.DataModel.vtkPiecewiseFunction.newInstance();
-        if (datasetId.toLowerCase().includes('seg')) {    //seg
+        if (segmentationLabels[datasetId]) {              //seg with label index
+          const { labels, hidden } = segmentationLabels[datasetId];
+          setLabelTransferFunctions(ctfun, ofun, labels, hidden);
+        } else if (datasetId.toLowerCase().includes('seg')) {    //seg
           ctfun.addRGBPoint(0, 0.0, 0.0, 0.0);
           ctfun.addRGBPoint(255, 1.0, 0.0, 0.0); // red
           ofun.addPoint(0.0, 0.0);
@@ -171,11 +328,14 @@ function addVolumeToViewers(volumeData, datasetId) {
         const slicingMode = slicingModeMap[view.mode];
         const axisIndex = axisIndexMap[view.mode];
         const dim = volumeData.dimensions;
-        const sliceIndex = Math.floor(dim[axisIndex] / 2);
+        // cropped overlays focus the middle of the anatomy grid, not of the crop
+        const offset = volumeData.offset || [0, 0, 0];
+        const referenceDims = volumeData.referenceDims || dim;
+        const sliceIndex = Math.floor(referenceDims[axisIndex] / 2) - offset[axisIndex];
 
         mapper.setSlicingMode(slicingMode);
         mapper.setSliceAtFocalPoint(true);
-        mapper.setSlice(sliceIndex);
+        mapper.setSlice(Math.min(Math.max(sliceIndex, 0), dim[axisIndex] - 1));
 
         const slice = vtk.Rendering.Core.vtkImageSlice.newInstance();
         slice.setMapper(mapper);
@@ -184,7 +344,10 @@ function addVolumeToViewers(volumeData, datasetId) {
         const ctfun = vtk.Rendering.Core.vtkColorTransferFunction.newInstance();
         const ofun = vtk.Common.DataModel.vtkPiecewiseFunction.newInstance();
 
-        if (datasetId.toLowerCase().includes('seg')) {   //seg
+        if (segmentationLabels[datasetId]) {              //seg with label index
+          const { labels, hidden } = segmentationLabels[datasetId];
+          setLabelTransferFunctions(ctfun, ofun, labels, hidden);
+        } else if (datasetId.toLowerCase().includes('seg')) {   //seg
           ctfun.addRGBPoint(0, 0.0, 0.0, 0.0);
           ctfun.addRGBPoint(255, 1.0, 0.0, 0.0);   //red
           ofun.addPoint(0.0, 0.0);
@@ -242,36 +405,52 @@ function addVolumeToViewers(volumeData, datasetId) {
         // Fetch volumes from media and visualize in viewer  //
         //===================================================//
    
+//===== Fetch layers and render them =====
+// All layers of a view come in one /layers/ request, missing layers are skipped.
+// Crop offset, reference dims and label index of an overlay come with its container.
+// entries: [{ name, datasetId, label }], resolves with the fetched layers by name
+function visualizeLayers(entries) {
+  return fetchLayers(entries.map(entry => entry.name))
+    .then(layers => {
+      entries.forEach(({ name, datasetId, label }) => {
+        const layer = layers[name];
+        if (!layer) return;
+        const { dims, spacing, origin, meta } = layer;
+        if (meta.labels) {
+          segmentationLabels[datasetId] = { labels: meta.labels, hidden: new Set() };
+          buildLabelToggles(datasetId, meta.labels);
+          addLog(`Segmentation labels: ${Object.keys(meta.labels).join(', ')}`);
+        }
+
+        addLog(`${label} volume loaded successfully, start visualization...`);
+        addLog(`Volume dimensions: ${dims.join(' x ')}, spacing: ${spacing.join(', ')}, origin: ${origin.join(", ," )}`);
+        addVolumeToViewers({ data: layer.data, dimensions: dims, spacing: spacing, origin: origin,
+                             offset: meta.offset, referenceDims: meta.reference_dims }, datasetId);
+        addLog(`${label} volume loaded and visualized.`);
+      });
+      return layers;
+    });
+}
+
+// Anatomy previews, an overlay brings them along in its request when none is shown yet
+const ANATOMY_LAYERS = [
+  { name: 'volume_dicom_preview', datasetId: 'dnifti', label: 'DICOM' },
+  { name: 'volume_nifti_preview', datasetId: 'nifti', label: 'NIFTI' },
+];
+
+function missingAnatomyLayers() {
+  const { actors } = viewerManagers['viewer-3d'];
+  return ANATOMY_LAYERS.some(entry => actors[entry.datasetId]) ? [] : ANATOMY_LAYERS;
+}
+
 //===== Fetch and render converted DICOM as preview volume =====
 function fetchAndVisualizeDICOM2NIFTIvolume() {
   addLog('Start visualisation of DICOM volume...');
+  datasetId = "dnifti"
 
-  fetch('/media/volume_base.meta_preview.json?t=' + new Date().getTime())
-    .then(response => {
-      if (!response.ok) throw new Error("Meta-information not found.");
-      return response.json();
-    })
-    .then(meta => {
-      const spacing = meta.spacing;
-      const dims = meta.dims;
-      const totalSize = dims[0] * dims[1] * dims[2];
-      const origin = meta.origin;
-
-      datasetId = "dnifti"
-
-      fetch('/media/volume_dicom_preview.bin?t=' + new Date().getTime())
-        .then(response => response.arrayBuffer())
-        .then(buffer => {
-          const flatData = new Uint8Array(buffer);
-          if (flatData.length !== totalSize) {
-            throw new Error(`Data mismatch: expected ${totalSize} voxels, but received ${flatData.length}`);
-          }
-
-          addLog('Volume data loaded successfully, start visualization...');
-          addLog(`Volume dimensions: ${dims.join(' x ')}, spacing: ${spacing.join(', ')}, origin: ${origin.join(", ," )} `);
-          addVolumeToViewers({ data: flatData, dimensions: dims, spacing: spacing, origin: origin}, datasetId);
-          addLog('DICOM volume loaded and visualized.');
-        });
+  visualizeLayers([ANATOMY_LAYERS[0]])
+    .then(layers => {
+      if (!layers['volume_dicom_preview']) throw new Error("DICOM preview not found.");
     })
     .catch(error => {
       console.error('Error loading volume:', error);
@@ -282,33 +461,11 @@ function fetchAndVisualizeDICOM2NIFTIvolume() {
 //===== Fetch and render uploaded NIFTI preview volume =====
 function fetchAndVisualizeNiftivolume() {
   addLog('Start visualisation of NIFTI volume...');
+  datasetId = "nifti"
 
-  fetch('/media/volume_base.meta_preview.json?t=' + new Date().getTime())
-    .then(response => {
-      if (!response.ok) throw new Error("Meta-information not found.");
-      return response.json();
-    })
-    .then(meta => {
-      const spacing = meta.spacing;
-      const dims = meta.dims;
-      const totalSize = dims[0] * dims[1] * dims[2];
-      const origin = meta.origin;
-
-      datasetId = "nifti"
-
-      fetch('/media/volume_nifti_preview.bin?t=' + new Date().getTime())
-        .then(response => response.arrayBuffer())
-        .then(buffer => {
-          const flatData = new Uint8Array(buffer);
-          if (flatData.length !== totalSize) {
-            throw new Error(`Data mismatch: expected ${totalSize} voxels, but received ${flatData.length}`);
-          }
-
-          addLog('Volume data loaded successfully, start visualization...');
-          addLog(`Volume dimensions: ${dims.join(' x ')}, spacing: ${spacing.join(', ')}, origin: ${origin.join(", ," )}`);
-          addVolumeToViewers({ data: flatData, dimensions: dims, spacing: spacing, origin: origin}, datasetId);
-          addLog('NIFTI volume loaded and visualized.');
-        });
+  visualizeLayers([ANATOMY_LAYERS[1]])
+    .then(layers => {
+      if (!layers['volume_nifti_preview']) throw new Error("NIFTI preview not found.");
     })
     .catch(error => {
       console.error('Error loading volume:', error);
@@ -316,70 +473,67 @@ function fetchAndVisualizeNiftivolume() {
     });
 }
 
-//===== Fetch and render segmentation preview volume //
+//===== Fetch and render segmentation preview volume =====
+// One request for the segmentation (with its label index) and the anatomy when it is not shown yet
 function fetchAndVisualizeSEGNIFTIvolume(datasetId) {
   addLog('Start visualisation of segmentation volume...');
 
-  // Haal de meta- en binaire bestanden op voor het NIFTI bestand
-  fetch('/media/volume_base.meta_preview.json?t=' + new Date().getTime())
+  const entries = missingAnatomyLayers().concat([
+    { name: 'segmentation_result_preview', datasetId: datasetId, label: 'Segmentation' },
+  ]);
+  visualizeLayers(entries)
+    .then(layers => {
+      if (!layers['segmentation_result_preview']) throw new Error("Segmentation preview not found.");
+      showSegmentationMeshes(datasetId);
+    })
+    .catch(error => {
+      console.error('Error loading volume:', error);
+      addLog('Meta or binary data not found.');
+    });
+}
+
+//===== Surface meshes of the segmentation labels in the 3D viewer =====
+// Built on request from the full resolution labels (cached), the volume rendering stays when there are none
+function showSegmentationMeshes(datasetId) {
+  fetch('/segmarks/meshes/', {
+    method: 'POST',
+    headers: { 'X-CSRFToken': getCSRFToken() },
+  })
     .then(response => {
-      if (!response.ok) throw new Error("Meta-information not found.");
+      if (!response.ok) throw new Error('No full resolution segmentation for meshes.');
       return response.json();
     })
-    .then(meta => {
-      const spacing = meta.spacing;
-      const dims = meta.dims;
-      const origin = meta.origin;
-      const totalSize = dims[0] * dims[1] * dims[2];
-
-      fetch('/media/segmentation_result_preview.bin?t=' + new Date().getTime())
-        .then(response => response.arrayBuffer())
-        .then(buffer => {
-          const flatData = new Uint8Array(buffer);
-          if (flatData.length !== totalSize) {
-            throw new Error(`Data mismatch: excpected ${totalSize} voxels, but received ${flatData.length}`);
-          }
-
-          addLog('Volume data loaded successfully, start visualization...');
-          addLog(`Volume dimensions: ${dims.join(' x ')}, spacing: ${spacing.join(', ')}, origin: ${origin.join(", ," )}`);
-          addVolumeToViewers({ data: flatData, dimensions: dims, spacing: spacing, origin: origin}, datasetId);
-          addLog('NIFTI volume loaded and visualized.');
-        });
+    .then(data => data.job_id ? waitForJob(data.job_id) : null)
+    .then(() => fetchMeshes())
+    .then(meshes => {
+      addMeshesToViewer(meshes, datasetId);
+      addLog(`Segmentation meshes shown (${meshes.length} labels).`);
     })
     .catch(error => {
-      console.error('Error loading volume:', error);
-      addLog('Meta or binary data not found.');
+      console.error('Error loading meshes:', error);
+      addLog(error.message);
     });
 }
 
 //===== Fetch and render preview landmark volume =====
+// The voxelized volume is generated on request from the point set (lazy)
 function fetchAndVisualizeLandmarkVolume(datasetId) {
   addLog('Start visualisation of landmark volume...');
 
-  fetch('/media/volume_base.meta_preview.json?t=' + new Date().getTime())
+  fetch('/segmarks/landmarks-volume/', {
+    method: 'POST',
+    headers: { 'X-CSRFToken': getCSRFToken() },
+  })
     .then(response => {
-      if (!response.ok) throw new Error("Meta-information not found.");
+      if (!response.ok) throw new Error("Landmarks not converted.");
       return response.json();
     })
-    .then(meta => {
-      const spacing = meta.spacing;
-      const dims = meta.dims;
-      const origin = meta.origin;
-      const totalSize = dims[0] * dims[1] * dims[2];
-
-      fetch('/media/landmarks_volume_preview.bin?t=' + new Date().getTime())
-        .then(response => response.arrayBuffer())
-        .then(buffer => {
-          const flatData = new Uint8Array(buffer);
-          if (flatData.length !== totalSize) {
-            throw new Error(`Data mismatch: expected ${totalSize} voxels, butreceived ${flatData.length}`);
-          }
-
-          addLog('Volume data loaded successfully, start visualization...');
-          addLog(`Volume dimensions: ${dims.join(' x ')}, spacing: ${spacing.join(', ')}, origin: ${origin.join(", ," )}`);
-          addVolumeToViewers({ data: flatData, dimensions: dims, spacing: spacing, origin: origin }, datasetId);
-          addLog('Landmarkvolume volume loaded and visualized.');
-        });
+    .then(data => data.job_id ? waitForJob(data.job_id) : null)
+    .then(() => visualizeLayers(missingAnatomyLayers().concat([
+      { name: 'landmarks_volume_preview', datasetId: datasetId, label: 'Landmark' },
+    ])))
+    .then(layers => {
+      if (!layers['landmarks_volume_preview']) throw new Error("Landmark volume preview not found.");
     })
     .catch(error => {
       console.error('Error loading volume:', error);
@@ -387,6 +541,46 @@ function fetchAndVisualizeLandmarkVolume(datasetId) {
     });
 }
 
+//===== Fetch and render landmark point set =====
+// Every landmark is drawn as a sphere at origin + voxel * spacing (same placement as the volumes)
+function fetchAndVisualizeLandmarkPoints(datasetId, radiusMm = 3) {
+  addLog('Start visualisation of landmarks...');
+
+  fetch('/segmarks/landmarks/?t=' + new Date().getTime())
+    .then(response => {
+      if (!response.ok) throw new Error("Landmarks not found.");
+      return response.json();
+    })
+    .then(points => {
+      const { spacing, origin } = points;
+
+      Object.keys(viewerManagers).forEach(viewerId => {
+        if (!document.getElementById(viewerId)) return;
+        const { renderer, renderWindow, actors } = initializeViewer(viewerId, viewerId === 'viewer-3d' ? '3D' : '2D');
+
+        points.voxel.forEach((voxel, n) => {
+          const center = voxel.map((v, axis) => origin[axis] + v * spacing[axis]);
+          const source = vtk.Filters.Sources.vtkSphereSource.newInstance({ center, radius: radiusMm });
+          const mapper = vtk.Rendering.Core.vtkMapper.newInstance();
+          mapper.setInputConnection(source.getOutputPort());
+          const actor = vtk.Rendering.Core.vtkActor.newInstance();
+          actor.setMapper(mapper);
+          actor.getProperty().setColor(0.0, 0.0, 1.0);   //blue
+
+          renderer.addActor(actor);
+          actors[`${datasetId}-${n}`] = actor;
+        });
+        renderWindow.render();
+      });
+
+      addLog(`${points.ids.length} landmarks visualized.`);
+    })
+    .catch(error => {
+      console.error('Error loading landmarks:', error);
+      addLog('Landmarks not found.');
+    });
+}
+
 /////////////////////////////////////////////////////////////////////////////////////////////
           //==================//
           // Other functions  //
@@ -426,19 +620,18 @@ document.getElementById('dnifti-visualize-form').addEventListener('submit', func
   const formData = new FormData(this);
   fetch('/upload/', {
     method: 'POST',
-    headers: { 'X-CSRFToken': getCSRFToken() },
+    headers: { 'X-CSRFToken': getCSRFToken(), 'X-Requested-With': 'XMLHttpRequest' },
     body: formData,
   })
   .then(response => {
-    if (response.ok) {
-      fetchAndVisualizeDICOM2NIFTIvolume();
-    } else {
-      addLog('Error uploading DICOM')
-    }
+    if (!response.ok) throw new Error('Error uploading DICOM');
+    return response.json();
   })
+  .then(data => Promise.all((data.jobs || []).map(jobId => waitForJob(jobId))))
+  .then(() => fetchAndVisualizeDICOM2NIFTIvolume())
   .catch(error => {
     console.error('Upload failure:', error);
-    addLog('Error in code');   
+    addLog(error.message);
   });
 });
 
@@ -449,19 +642,18 @@ document.getElementById('nifti-visualize-form').addEventListener('submit', funct
   const formData = new FormData(this);
   fetch('/upload/', {
     method: 'POST',
-    headers: { 'X-CSRFToken': getCSRFToken() },
+    headers: { 'X-CSRFToken': getCSRFToken(), 'X-Requested-With': 'XMLHttpRequest' },
     body: formData,
   })
   .then(response => {
-    if (response.ok) {
-      fetchAndVisualizeNiftivolume('nifti');
-    } else {
-      addLog('Error uploading NIFTI');
-    }
+    if (!response.ok) throw new Error('Error uploading NIFTI');
+    return response.json();
   })
+  .then(data => Promise.all((data.jobs || []).map(jobId => waitForJob(jobId))))
+  .then(() => fetchAndVisualizeNiftivolume('nifti'))
   .catch(error => {
     console.error('Upload failure:', error);
-    addLog('error in code.');
+    addLog(error.message);
   });
 });
 
@@ -493,14 +685,17 @@ document.getElementById('visualize-seg-btn').addEventListener('click', function(
   })
   .then(response => {
     if (response.ok) {
-      addLog('Segmantation file retrieved')
+      addLog('Segmantation file retrieved, converting...')
       return response.json();
     } else {
       throw new Error('Error uploading segmentation');
     }
   })
+  .then(data => waitForJob(data.job_id))
+  .then(() => addLog('Segmentation converted, ready to show'))
   .catch(error => {
     console.error('Error:', error);
+    addLog(error.message);
   });
 });
 // Function to start visualisation of segmentation
@@ -537,19 +732,26 @@ document.getElementById('visualize-landmarks-btn').addEventListener('click', fun
   })
   .then(response => {
     if (response.ok) {
-      addLog('Landmark files retreived');
+      addLog('Landmark files retreived, converting...');
       return response.json();
     } else {
       throw new Error('Error uploading landmarks');
     }
   })
+  .then(data => addLog(`${data.count} landmarks converted, ready to show`))
   .catch(error => {
     console.error('Error:', error);
+    addLog(error.message);
   });
 });
 // Function to start visualisation of landmarks
+// Points by default, the dense toggle shows the voxelized volume instead (generated on first request)
 document.getElementById('show-landmarks-btn').addEventListener('click', function() {
-  fetchAndVisualizeLandmarkVolume('landmarks');
+  if (document.getElementById('landmarks-dense-toggle').checked) {
+    fetchAndVisualizeLandmarkVolume('landmarks-volume');
+  } else {
+    fetchAndVisualizeLandmarkPoints('landmarks');
+  }
 });
 
 //////////////////////////////////////////////////////////////////////////////////////////////
@@ -566,6 +768,7 @@ document.getElementById('hide-nifti-btn').addEventListener('click', function() {
 // SEG
 document.getElementById('hide-seg-btn').addEventListener('click', function() {
   removeDatasetFromViewers(datasetId = 'segnifti');
+  document.getElementById('seg-label-toggles').innerHTML = '';
 });
 // LND
 document.getElementById('hide-landmarks-btn').addEventListener('click', function() {
@@ -576,6 +779,7 @@ document.getElementById('hide-landmarks-btn').addEventListener('click', function
 document.getElementById('reset-viewer-btn').addEventListener('click',function() {
   addLog('Reset viewer');
   clearAllViewers();
+  document.getElementById('seg-label-toggles').innerHTML = '';
   addLog('Entire viewer has been emptied');
 });
 
@@ -22,6 +22,115 @@ function addLog(message) {
   logList.scrollTop = logList.scrollHeight;
 }
 
+// ===== RESUMABLE CHUNKED UPLOAD =====
+// Files are sent in chunks to /uploads/, a dropped connection resumes at the offset
+// the server has (also after a page reload, the upload id is kept in localStorage).
+const UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024;
+const UPLOAD_PARALLEL_FILES = 4;
+const UPLOAD_RETRIES = 5;
+
+// localStorage key of an upload: hash over name, size and modification time of the files
+function uploadKey(kind, files) {
+  let hash = 5381;
+  for (const f of files) {
+    for (const c of `${f.name}:${f.size}:${f.lastModified}|`) hash = (hash * 33 + c.charCodeAt(0)) | 0;
+  }
+  return `upload:${kind}:${files.length}:${hash >>> 0}`;
+}
+
+// sha256 of a file, used to skip files uploaded before. Only where the browser allows it
+// (secure context) and for files up to one chunk (DICOM slices), large files are not read twice
+async function sha256Hex(file) {
+  if (!(window.crypto && crypto.subtle) || file.size > UPLOAD_CHUNK_SIZE) return undefined;
+  const digest = await crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+  return Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('');
+}
+
+async function uploadJSON(url, options = {}) {
+  const response = await fetch(url, {
+    ...options,
+    headers: { 'X-CSRFToken': getCSRFToken(), 'Content-Type': 'application/json', ...(options.headers || {}) }
+  });
+  const data = await response.json();
+  if (!response.ok) throw Object.assign(new Error(data.error || response.statusText), { status: response.status, data });
+  return data;
+}
+
+async function startUpload(kind, files) {
+  const key = uploadKey(kind, files);
+  const previous = localStorage.getItem(key);
+  if (previous) {
+    try {
+      const state = await uploadJSON(`/uploads/${previous}/`, { method: 'GET' });
+      addLog('Resuming earlier upload...');
+      return state;
+    } catch (error) {
+      localStorage.removeItem(key);   // finished or unknown, start a new one
+    }
+  }
+  const descriptions = [];
+  for (const file of files) {
+    descriptions.push({ name: file.name, size: file.size, sha256: await sha256Hex(file) });
+  }
+  const state = await uploadJSON('/uploads/', { method: 'POST', body: JSON.stringify({ kind, files: descriptions }) });
+  localStorage.setItem(key, state.upload_id);
+  return state;
+}
+
+async function uploadFile(uploadId, index, file, offset) {
+  let retries = 0;
+  while (offset < file.size) {
+    const chunk = file.slice(offset, offset + UPLOAD_CHUNK_SIZE);
+    try {
+      const response = await fetch(`/uploads/${uploadId}/files/${index}/`, {
+        method: 'POST',
+        headers: { 'X-CSRFToken': getCSRFToken(), 'X-Upload-Offset': String(offset), 'Content-Type': 'application/octet-stream' },
+        body: chunk
+      });
+      const data = await response.json();
+      if (response.status === 409) { offset = data.offset; continue; }   // server has a different offset, continue there
+      if (!response.ok) throw new Error(data.error || response.statusText);
+      offset = data.offset;
+      retries = 0;
+    } catch (error) {
+      if (++retries > UPLOAD_RETRIES) throw error;
+      await new Promise(resolve => setTimeout(resolve, 500 * 2 ** retries));
+      const state = await uploadJSON(`/uploads/${uploadId}/`, { method: 'GET' }).catch(() => null);
+      if (state) offset = state.files[index].offset;
+    }
+  }
+}
+
+async function chunkedUpload(kind, files) {
+  const state = await startUpload(kind, files);
+  const pending = state.files.filter(f => f.offset < f.size);
+  const skipped = state.files.length - pending.length;
+  if (skipped) addLog(`${skipped} file(s) already on the server, skipped.`);
+
+  let next = 0, done = 0;
+  const worker = async () => {
+    while (next < pending.length) {
+      const entry = pending[next++];
+      await uploadFile(state.upload_id, entry.index, files[entry.index], entry.offset);
+      if (++done % 100 === 0) addLog(`${done}/${pending.length} files uploaded...`);
+    }
+  };
+  await Promise.all(Array.from({ length: Math.min(UPLOAD_PARALLEL_FILES, pending.length) }, worker));
+
+  const result = await uploadJSON(`/uploads/${state.upload_id}/finalize/`, { method: 'POST' });
+  localStorage.removeItem(uploadKey(kind, files));
+  return result;
+}
+
+function handleUploadResult(data) {
+  if (data.log) data.log.forEach(msg => addLog(msg));
+  (data.jobs || []).forEach(jobId => {
+    waitForJob(jobId)
+      .then(job => addLog(`${job.name} finished.`))
+      .catch(error => addLog(`Conversion failed: ${error.message}`));
+  });
+}
+
 //////////////////////////////////////////////////////////////////////////////////////////////
           //===================//
           // User interaction  //
@@ -30,43 +139,31 @@ function addLog(message) {
 //=== Upload DICOM files =====
 document.getElementById('dicom-upload-form').addEventListener('submit', function(e) {
   e.preventDefault();
-  const formData = new FormData(this);
+  const files = Array.from(document.getElementById('dicom-files').files);
+  if (!files.length) return;
   addLog('Upload started...');
 
-  fetch('/upload/', {
-    method: 'POST',
-    headers: { 'X-CSRFToken': getCSRFToken(), 'X-Requested-With': 'XMLHttpRequest' },
-    body: formData
-  })
-  .then(response => response.json())
-  .then(data => {
-    if (data.log) data.log.forEach(msg => addLog(msg));
-  })
-  .catch(error => {
-    console.error('Upload failure:', error);
-    addLog('Error in code');   
-  });
+  chunkedUpload('dicom', files)
+    .then(handleUploadResult)
+    .catch(error => {
+      console.error('Upload failure:', error);
+      addLog(`Upload failed: ${error.message}`);
+    });
 });
 
 //=== Upload NIFIT files =====
 document.getElementById('nifti-upload-form').addEventListener('submit', function(e) {
   e.preventDefault();
-  const formData = new FormData(this);
+  const files = Array.from(document.getElementById('nifti-file').files);
+  if (!files.length) return;
   addLog('Upload started...');
 
-  fetch('/upload/', {
-    method: 'POST',
-    headers: { 'X-CSRFToken': getCSRFToken(), 'X-Requested-With': 'XMLHttpRequest' },
-    body: formData
-  })
-  .then(response => response.json())
-  .then(data => {
-    if (data.log) data.log.forEach(msg => addLog(msg));
-  })
-  .catch(error => {
-    console.error('Upload failure:', error);
-    addLog('Error in code');   
-  });
+  chunkedUpload('nifti', files)
+    .then(handleUploadResult)
+    .catch(error => {
+      console.error('Upload failure:', error);
+      addLog(`Upload failed: ${error.message}`);
+    });
 });
 
 //===== reset all media function =====
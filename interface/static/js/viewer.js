@@ -29,7 +29,12 @@ function addLog(message) {
 
 //===== Initialize VTK viewer =====
 // Sets up renderer, interactor, container dimensions, etc.
+// Viewers are created once per pane and reused, every viewer holds its own WebGL context.
+const viewers = {};
+
 function createViewer(containerId, interactorStyle = '2D') {
+  if (viewers[containerId]) return viewers[containerId];
+
   const container = document.getElementById(containerId);
   const content = container.querySelector('.viewer-content');
   content.innerHTML = '';
@@ -57,18 +62,77 @@ function createViewer(containerId, interactorStyle = '2D') {
   } else {
     interactor.setInteractorStyle(vtk.Interaction.Style.vtkInteractorStyleTrackballCamera.newInstance());
   }
-  
-  return {renderer, renderWindow};
+
+  viewers[containerId] = { renderer, renderWindow, openGLRenderWindow, interactor, content };
+  return viewers[containerId];
 }
 
-//===== Render input volume in all 2D and 3D viewers =====
-// Renders a 3D volume in all viewer panes (2D and 3D) with synchronized orientation.
-function addVolumeToViewers(volumeData) {
-  const imageData = vtk.Common.DataModel.vtkImageData.newInstance();
+//===== Release all viewers =====
+// Deletes interactors and render windows, so their WebGL contexts are freed
+function deleteViewers() {
+  Object.keys(viewers).forEach(id => {
+    const { renderWindow, openGLRenderWindow, interactor, content } = viewers[id];
+    interactor.unbindEvents();
+    interactor.delete();
+    renderWindow.delete();
+    openGLRenderWindow.delete();
+    content.innerHTML = '';
+    delete viewers[id];
+  });
+  viewerImage = null;
+}
+
+// Set orientation to LPS for logic visualisation (AP, LR, SI)
+const slicingModeMap = {
+  I: vtk.Rendering.Core.vtkImageMapper.SlicingMode.Z,
+  J: vtk.Rendering.Core.vtkImageMapper.SlicingMode.X,
+  K: vtk.Rendering.Core.vtkImageMapper.SlicingMode.Y
+};
+const axisIndexMap = { I: 2, J: 0, K: 1 };
+const viewUpMap = {
+  'viewer-axial': [0, 1, 0],     
+  'viewer-coronal': [1, 0, 0],    
+  'viewer-sagittal': [0, 0, -1]  
+};
+const views = [
+  { id: 'viewer-3d', style: '3D', mapper: 'volume' },
+  { id: 'viewer-axial', mode: 'J' },
+  { id: 'viewer-coronal', mode: 'K' },
+  { id: 'viewer-sagittal', mode: 'I' }
+];
+
+// Image data shown in all viewers, its scalars are replaced when a finer level arrives
+let viewerImage = null;
+
+//===== Camera of a viewer =====
+// 2D viewers look at the middle slice along their axis, the 3D viewer at the whole volume
+function resetViewCamera(view, renderer, volumeData) {
+  if (view.mapper !== 'volume') {
+    const axisIndex = axisIndexMap[view.mode];
+    const sliceIndex = Math.floor(volumeData.dimensions[axisIndex] / 2);
+
+    const camera = renderer.getActiveCamera();
+    camera.setParallelProjection(true);
+
+    const spacing = volumeData.spacing;
+    const origin = volumeData.origin || [0, 0, 0];
+    const focalPoint = origin.slice();
+    focalPoint[axisIndex] += spacing[axisIndex] * sliceIndex;
+
+    camera.setFocalPoint(...focalPoint);
+    camera.setPosition(...focalPoint.map((v, i) => i === axisIndex ? v + 1 : v));
+    const customViewUp = viewUpMap[view.id] || viewUpMap[axisIndex];
+    if (customViewUp) camera.setViewUp(...customViewUp);
+  }
+  renderer.resetCamera();
+}
+
+//===== Replace the voxels of the shown volume =====
+// Same image data (mappers and props stay), only geometry and scalars change
+function setImageData(imageData, volumeData) {
   imageData.setDimensions(volumeData.dimensions);
   imageData.setSpacing(...volumeData.spacing);
-  imageData.setOrigin(...volumeData.origin)
-
+  imageData.setOrigin(...volumeData.origin);
   imageData.getPointData().setScalars(
     vtk.Common.Core.vtkDataArray.newInstance({
       name: 'Scalars',
@@ -76,25 +140,27 @@ function addVolumeToViewers(volumeData) {
       numberOfComponents: 1
     })
   );
+  imageData.modified();
+}
+
+//===== Render input volume in all 2D and 3D viewers =====
+// Renders a 3D volume in all viewer panes (2D and 3D) with synchronized orientation.
+// The viewers and their pipeline are built for the first volume only, later volumes
+// swap the scalars of the same image data; keepCamera keeps the view (pyramid refinement).
+function addVolumeToViewers(volumeData, keepCamera = false) {
+  if (viewerImage) {
+    setImageData(viewerImage, volumeData);
+    views.forEach(view => {
+      const viewer = viewers[view.id];
+      if (!viewer) return;
+      if (!keepCamera) resetViewCamera(view, viewer.renderer, volumeData);
+      viewer.renderWindow.render();
+    });
+    return;
+  }
 
-  // Set orientation to LPS for logic visualisation (AP, LR, SI)
-  const slicingModeMap = {
-    I: vtk.Rendering.Core.vtkImageMapper.SlicingMode.Z,
-    J: vtk.Rendering.Core.vtkImageMapper.SlicingMode.X,
-    K: vtk.Rendering.Core.vtkImageMapper.SlicingMode.Y
-  };
-  const axisIndexMap = { I: 2, J: 0, K: 1 };
-  const viewUpMap = {
-    'viewer-axial': [0, 1, 0],     
-    'viewer-coronal': [1, 0, 0],    
-    'viewer-sagittal': [0, 0, -1]  
-  };
-  const views = [
-    { id: 'viewer-3d', style: '3D', mapper: 'volume' },
-    { id: 'viewer-axial', mode: 'J' },
-    { id: 'viewer-coronal', mode: 'K' },
-    { id: 'viewer-sagittal', mode: 'I' }
-  ];
+  viewerImage = vtk.Common.DataModel.vtkImageData.newInstance();
+  setImageData(viewerImage, volumeData);
 
   // fill in the viewblocks
   views.forEach(view => {
@@ -106,7 +172,7 @@ function addVolumeToViewers(volumeData) {
 
       if (view.mapper === 'volume') {   // 3D viewer
         const volumeMapper = vtk.Rendering.Core.vtkVolumeMapper.newInstance();
-        volumeMapper.setInputData(imageData);
+        volumeMapper.setInputData(viewerImage);
         const volume = vtk.Rendering.Core.vtkVolume.newInstance();
         volume.setMapper(volumeMapper);
 
@@ -124,44 +190,22 @@ function addVolumeToViewers(volumeData) {
         volume.setProperty(volumeProperty);
 
         renderer.addVolume(volume);
-        renderer.resetCamera();
-        renderWindow.render();
 
       } else {     // 2D viewers
         const mapper = vtk.Rendering.Core.vtkImageMapper.newInstance();
-        mapper.setInputData(imageData);
+        mapper.setInputData(viewerImage);
 
-        const slicingMode = slicingModeMap[view.mode];
-        const axisIndex = axisIndexMap[view.mode];
-        const dim = volumeData.dimensions;
-        const sliceIndex = Math.floor(dim[axisIndex] / 2);
-
-        mapper.setSlicingMode(slicingMode);
+        // the slice follows the focal point of the camera, so it stays in place when the level changes
+        mapper.setSlicingMode(slicingModeMap[view.mode]);
         mapper.setSliceAtFocalPoint(true);
-        mapper.setSlice(sliceIndex);
 
         const slice = vtk.Rendering.Core.vtkImageSlice.newInstance();
         slice.setMapper(mapper);
         renderer.addViewProp(slice);
-
-        // camera settings
-        const camera = renderer.getActiveCamera();
-        camera.setParallelProjection(true);
-
-        const spacing = volumeData.spacing;
-        const origin = volumeData.origin || [0, 0, 0];
-        const focalPoint = origin.slice();
-        focalPoint[axisIndex] += spacing[axisIndex] * sliceIndex;
-
-        camera.setFocalPoint(...focalPoint);
-        camera.setPosition(...focalPoint.map((v, i) => i === axisIndex ? v + 1 : v));
-        const customViewUp = viewUpMap[view.id] || viewUpMap[axisIndex];
-        if (customViewUp) camera.setViewUp(...customViewUp);
-
-        renderer.resetCamera();
-        renderWindow.render();
-
       }
+
+      resetViewCamera(view, renderer, volumeData);
+      renderWindow.render();
     } catch (error) {
       console.error(`Failure during rendering view ${view.id}:`, error);
       addLog(`Failure during rendering view ${view.id}: ${error.message}`);
@@ -175,76 +219,89 @@ function addVolumeToViewers(volumeData) {
         // Fetch volumes from media and visualize in viewer  //
         //===================================================//
    
-//===== Fetch and render converted DICOM as preview volume =====
-function fetchAndVisualizeDICOM2NIFTIvolume() {
-  addLog('Start visualisation of DICOM volume...');
+// ===== VOLUME CONTAINERS =====
+// Streams one or more layers (.vol containers) from /layers/ in a single request, onLayer is
+// called for every layer as soon as its bytes have arrived (in request order, missing layers skipped)
+// Container: 80 byte header (magic, version, dtype, dims, spacing, origin, payload size, metadata size),
+// then the voxels, then the metadata JSON
+const CONTAINER_HEADER_BYTES = 80;
+const CONTAINER_DTYPES = { 1: Uint8Array, 2: Int16Array, 3: Uint16Array, 4: Float32Array };
+
+function parseContainer(bytes) {
+  const view = new DataView(bytes.buffer, bytes.byteOffset, CONTAINER_HEADER_BYTES);
+  const dims = [0, 1, 2].map(i => view.getUint32(8 + 4 * i, true));
+  const spacing = [0, 1, 2].map(i => view.getFloat64(20 + 8 * i, true));
+  const origin = [0, 1, 2].map(i => view.getFloat64(44 + 8 * i, true));
+  const payloadBytes = Number(view.getBigUint64(68, true));
+  const metaBytes = view.getUint32(76, true);
+  const ArrayType = CONTAINER_DTYPES[view.getUint16(6, true)];
+
+  // copy, the payload of a layer is not aligned for 16/32 bit types
+  const end = CONTAINER_HEADER_BYTES + payloadBytes;
+  const data = new ArrayType(bytes.slice(CONTAINER_HEADER_BYTES, end).buffer);
+  const meta = metaBytes ? JSON.parse(new TextDecoder().decode(bytes.subarray(end, end + metaBytes))) : {};
+  return { data, dims, spacing, origin, meta };
+}
 
-  fetch('/media/volume_base.meta_preview.json?t=' + new Date().getTime())
+function fetchLayers(names, onLayer) {
+  const query = names.map(name => `layer=${encodeURIComponent(name)}`).join('&');
+  return fetch(`/layers/?${query}&t=` + new Date().getTime())
     .then(response => {
-      if (!response.ok) throw new Error("Meta-information not found.");
-      return response.json();
-    })
-    .then(meta => {
-      const spacing = meta.spacing;
-      const dims = meta.dims;
-      const totalSize = dims[0] * dims[1] * dims[2];
-      const origin = meta.origin;
-
-      fetch('/media/volume_dicom_preview.bin?t=' + new Date().getTime())
-        .then(response => response.arrayBuffer())
-        .then(buffer => {
-          const flatData = new Uint8Array(buffer);
-          if (flatData.length !== totalSize) {
-            throw new Error(`Data mismatch: expected ${totalSize} voxels, but received ${flatData.length}`);
-          }
-
-          addLog('Volume data loaded successfully, start visualization...');
-          addLog(`Volume dimensions: ${dims.join(' x ')}, spacing: ${spacing.join(', ')}, origin: ${origin.join(", ," )} `);
-          addVolumeToViewers({ data: flatData, dimensions: dims, spacing: spacing, origin: origin});
-          addLog('DICOM volume loaded and visualized.');
-        });
-    })
-    .catch(error => {
-      console.error('Error loading volume:', error);
-      addLog('Meta or binary data not found.');
+      if (!response.ok) throw new Error(`Layers ${names.join(', ')} not found.`);
+      const index = JSON.parse(response.headers.get('X-Layers'));
+      const body = new Uint8Array(index.layers.reduce((size, layer) => size + layer.length, 0));
+      const reader = response.body.getReader();
+      let received = 0;
+      let next = 0;
+
+      const pump = () => reader.read().then(({ done, value }) => {
+        if (value) {
+          body.set(value, received);
+          received += value.length;
+        }
+        while (next < index.layers.length && received >= index.layers[next].offset + index.layers[next].length) {
+          const { name, offset, length } = index.layers[next++];
+          onLayer(name, parseContainer(body.subarray(offset, offset + length)));
+        }
+        if (!done) return pump();
+        if (next < index.layers.length) throw new Error('Layers response incomplete.');
+        return index;
+      });
+      return pump();
     });
 }
 
-//===== Fetch and render uploaded NIFTI preview volume =====
-function fetchAndVisualizeNiftivolume() {
-  addLog('Start visualisation of NIFTI volume...');
-
-  fetch('/media/volume_base.meta_preview.json?t=' + new Date().getTime())
-    .then(response => {
-      if (!response.ok) throw new Error("Meta-information not found.");
-      return response.json();
-    })
-    .then(meta => {
-      const spacing = meta.spacing;
-      const dims = meta.dims;
-      const totalSize = dims[0] * dims[1] * dims[2];
-      const origin = meta.origin;
-
-      fetch('/media/volume_nifti_preview.bin?t=' + new Date().getTime())
-        .then(response => response.arrayBuffer())
-        .then(buffer => {
-          const flatData = new Uint8Array(buffer);
-          if (flatData.length !== totalSize) {
-            throw new Error(`Data mismatch: expected ${totalSize} voxels, but received ${flatData.length}`);
-          }
-
-          addLog('Volume data loaded successfully, start visualization...');
-          addLog(`Volume dimensions: ${dims.join(' x ')}, spacing: ${spacing.join(', ')}, origin: ${origin.join(", ," )}`);
-          addVolumeToViewers({ data: flatData, dimensions: dims, spacing: spacing, origin: origin});
-          addLog('NIFTI volume loaded and visualized.');
-        });
-    })
+//===== Fetch a volume and render it coarse-to-fine =====
+// The coarsest pyramid level and the preview come in one request, the coarse level is
+// rendered as soon as it has arrived, the preview then replaces its voxels in place.
+function fetchAndVisualizePyramid(volumeName, label) {
+  addLog(`Start visualisation of ${label} volume...`);
+
+  let rendered = 0;
+  fetchLayers([`${volumeName}_coarse`, `${volumeName}_preview`], (name, layer) => {
+    const { dims, spacing, origin } = layer;
+    addLog(`${name} loaded, start visualization...`);
+    addLog(`Volume dimensions: ${dims.join(' x ')}, spacing: ${spacing.join(', ')}, origin: ${origin.join(", ," )}`);
+    // finer levels keep the camera of the first one
+    addVolumeToViewers({ data: layer.data, dimensions: dims, spacing: spacing, origin: origin }, rendered++ > 0);
+  })
+    .then(() => addLog(`${label} volume loaded and visualized.`))
     .catch(error => {
       console.error('Error loading volume:', error);
       addLog('Meta or binary data not found.');
     });
 }
 
+//===== Fetch and render converted DICOM volume =====
+function fetchAndVisualizeDICOM2NIFTIvolume() {
+  fetchAndVisualizePyramid('volume_dicom', 'DICOM');
+}
+
+//===== Fetch and render uploaded NIFTI volume =====
+function fetchAndVisualizeNiftivolume() {
+  fetchAndVisualizePyramid('volume_nifti', 'NIFTI');
+}
+
 //////////////////////////////////////////////////////////////////////////////////////////////
           //===================//
           // User interaction  //
@@ -257,17 +314,18 @@ document.getElementById('dnifti-visualize-form').addEventListener('submit', func
   const formData = new FormData(this);
   fetch('/upload/', {
     method: 'POST',
-    headers: { 'X-CSRFToken': getCSRFToken() },
+    headers: { 'X-CSRFToken': getCSRFToken(), 'X-Requested-With': 'XMLHttpRequest' },
     body: formData,
   })
   .then(response => {
-    if (response.ok) {
-      fetchAndVisualizeDICOM2NIFTIvolume();
-    }
+    if (!response.ok) throw new Error('Error uploading DICOM');
+    return response.json();
   })
+  .then(data => Promise.all((data.jobs || []).map(jobId => waitForJob(jobId))))
+  .then(() => fetchAndVisualizeDICOM2NIFTIvolume())
   .catch(error => {
     console.error('Upload failure:', error);
-    addLog('Error in code');   
+    addLog(error.message);
   });
 });
 
@@ -278,19 +336,18 @@ document.getElementById('nifti-visualize-form').addEventListener('submit', funct
   const formData = new FormData(this);
   fetch('/upload/', {
     method: 'POST',
-    headers: { 'X-CSRFToken': getCSRFToken() },
+    headers: { 'X-CSRFToken': getCSRFToken(), 'X-Requested-With': 'XMLHttpRequest' },
     body: formData,
   })
   .then(response => {
-    if (response.ok) {
-      fetchAndVisualizeNiftivolume();
-    } else {
-      addLog('Error uploading NIFTI');
-    }
+    if (!response.ok) throw new Error('Error uploading NIFTI');
+    return response.json();
   })
+  .then(data => Promise.all((data.jobs || []).map(jobId => waitForJob(jobId))))
+  .then(() => fetchAndVisualizeNiftivolume())
   .catch(error => {
     console.error('Upload failure:', error);
-    addLog('error in code.');
+    addLog(error.message);
   });
 });
 
@@ -298,11 +355,7 @@ document.getElementById('nifti-visualize-form').addEventListener('submit', funct
 document.getElementById('reset-viewer-btn').addEventListener('click', () => {
   addLog('Reset viewer');
 
-  ['viewer-3d', 'viewer-axial', 'viewer-coronal', 'viewer-sagittal'].forEach(id => {
-    const container = document.getElementById(id);
-    const content = container.querySelector('.viewer-content');
-    if (content) content.innerHTML = '';
-  });
+  deleteViewers();
 
   addLog('viewer content has been emptied')
 });
@@ -1,3 +1,133 @@
-from django.test import TestCase
+import os
+import json
+import tempfile
 
-# Create your tests here.
+import numpy as np
+import nibabel as nib
+from scipy.ndimage import zoom
+from django.test import SimpleTestCase
+
+from .utils.landmarks_utils import rasterize_landmarks
+from .utils.seg_utils import nearest_indices, convert_segnifti_to_binary
+
+
+def stamp_dense(landmarks, dims, spacing, radius_mm=3):
+    """
+    Reference: the per voxel distance check the landmark volume was drawn with
+    before the stencil (every offset of the box is tested, clipped at the borders).
+    """
+    volume = np.zeros(dims[::-1], dtype=np.uint8)
+    rx, ry, rz = (int(round(radius_mm / s)) for s in spacing)
+    for lm in landmarks:
+        v = lm['voxel']
+        i, j, k = int(round(v['i'])), int(round(v['j'])), int(round(v['k']))
+        for dz in range(-rz, rz + 1):
+            for dy in range(-ry, ry + 1):
+                for dx in range(-rx, rx + 1):
+                    if (dx * spacing[0])**2 + (dy * spacing[1])**2 + (dz * spacing[2])**2 <= radius_mm**2:
+                        zi, yi, xi = k + dz, j + dy, i + dx
+                        if 0 <= zi < volume.shape[0] and 0 <= yi < volume.shape[1] and 0 <= xi < volume.shape[2]:
+                            volume[zi, yi, xi] = 255
+    return volume
+
+
+def landmark(i, j, k):
+    return {'id': f'{i}-{j}-{k}', 'voxel': {'i': i, 'j': j, 'k': k}}
+
+
+class LandmarkRasterizationTests(SimpleTestCase):
+    """
+    The stencil rasterization has to draw exactly the spheres of the dense per voxel stamping.
+    """
+    dims = [40, 32, 24]   # x, y, z
+
+    def assert_same_as_dense(self, landmarks, spacing, radius_mm=3):
+        expected = stamp_dense(landmarks, self.dims, spacing, radius_mm)
+        actual = rasterize_landmarks(landmarks, self.dims, spacing, radius_mm=radius_mm)
+        self.assertEqual(actual.dtype, np.uint8)
+        np.testing.assert_array_equal(actual, expected)
+
+    def test_isotropic_spacing(self):
+        self.assert_same_as_dense([landmark(20, 16, 12), landmark(5.4, 9.6, 3.5)], [1.0, 1.0, 1.0])
+
+    def test_anisotropic_spacing(self):
+        self.assert_same_as_dense([landmark(20, 16, 12), landmark(7, 25, 4)], [0.4, 0.6, 1.5], radius_mm=2.5)
+
+    def test_clipped_at_the_borders(self):
+        landmarks = [landmark(0, 0, 0), landmark(39, 31, 23), landmark(-2, 16, 12), landmark(41, 16, 12)]
+        self.assert_same_as_dense(landmarks, [1.0, 1.0, 1.0])
+
+    def test_outside_the_volume(self):
+        self.assert_same_as_dense([landmark(-50, 16, 12), landmark(20, 16, 100)], [1.0, 1.0, 1.0])
+
+    def test_overlapping_spheres(self):
+        self.assert_same_as_dense([landmark(20, 16, 12), landmark(22, 17, 12)], [0.8, 0.8, 0.8])
+
+    def test_cropped_volume_matches_the_full_grid(self):
+        landmarks = [landmark(20, 16, 12), landmark(25, 10, 8)]
+        spacing = [1.0, 1.0, 1.0]
+        offset, shape = (4, 2, 8), (16, 24, 24)   # z, y, x
+        crop = rasterize_landmarks(landmarks, shape[::-1], spacing, offset=offset)
+        full = stamp_dense(landmarks, self.dims, spacing)
+        np.testing.assert_array_equal(
+            crop, full[tuple(slice(o, o + n) for o, n in zip(offset, shape))])
+
+
+class SegmentationResamplingTests(SimpleTestCase):
+    """
+    The slab wise nearest neighbour resampling of a segmentation onto the reference grid
+    has to match scipy.ndimage.zoom with order=0 on the whole volume.
+    """
+
+    def test_nearest_indices_match_zoom(self):
+        for in_size, out_size in [(10, 10), (10, 25), (25, 10), (7, 64), (64, 7), (33, 17), (1, 5), (5, 1)]:
+            with self.subTest(in_size=in_size, out_size=out_size):
+                expected = zoom(np.arange(in_size, dtype=np.float64), out_size / in_size, order=0)
+                self.assertEqual(len(expected), out_size)
+                np.testing.assert_array_equal(nearest_indices(in_size, out_size), expected.astype(np.intp))
+
+    def convert(self, labels, reference_dims, memory_budget_mb=256):
+        """
+        Converts a label volume (numpy order) onto a reference grid, returns the written
+        full resolution labels placed in the whole reference grid (numpy order).
+        """
+        with tempfile.TemporaryDirectory() as folder:
+            nifti_path = os.path.join(folder, 'seg.nii.gz')
+            nib.save(nib.Nifti1Image(labels, np.eye(4)), nifti_path)
+            reference_meta = os.path.join(folder, 'volume_base.meta.json')
+            with open(reference_meta, 'w', encoding='utf-8') as f:
+                json.dump({'spacing': [1.0, 1.0, 1.0], 'dims': reference_dims[::-1], 'origin': [0.0, 0.0, 0.0]}, f)
+
+            bin_out = os.path.join(folder, 'segmentation_result.bin')
+            meta_out = os.path.join(folder, 'segmentation_result.meta.json')
+            convert_segnifti_to_binary(nifti_path, bin_out, meta_out, reference_meta, generate_preview=False,
+                                       memory_budget_mb=memory_budget_mb, compress=False)
+
+            with open(meta_out, encoding='utf-8') as f:
+                meta = json.load(f)
+            crop = np.fromfile(bin_out, dtype=np.uint8).reshape(meta['dims'][::-1])
+            offset = meta['offset'][::-1]
+            volume = np.zeros(reference_dims, dtype=np.uint8)
+            volume[tuple(slice(o, o + n) for o, n in zip(offset, crop.shape))] = crop
+            return volume
+
+    def labels(self, shape, seed=0):
+        rng = np.random.default_rng(seed)
+        labels = np.zeros(shape, dtype=np.uint8)
+        labels[3:-4, 5:-3, 2:-5] = rng.integers(0, 4, size=labels[3:-4, 5:-3, 2:-5].shape)
+        return labels
+
+    def assert_same_as_zoom(self, labels, reference_dims, **kwargs):
+        expected = zoom(labels, [r / s for r, s in zip(reference_dims, labels.shape)], order=0)
+        self.assertEqual(expected.shape, tuple(reference_dims))
+        np.testing.assert_array_equal(self.convert(labels, reference_dims, **kwargs), expected)
+
+    def test_upsampled_onto_the_reference_grid(self):
+        self.assert_same_as_zoom(self.labels((20, 24, 16)), (40, 48, 48))
+
+    def test_downsampled_onto_the_reference_grid(self):
+        self.assert_same_as_zoom(self.labels((48, 40, 56)), (24, 32, 16))
+
+    def test_small_slabs(self):
+        # a tiny memory budget converts in many slabs, the result must not depend on it
+        self.assert_same_as_zoom(self.labels((30, 20, 40), seed=1), (32, 24, 48), memory_budget_mb=0.01)
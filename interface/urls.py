@@ -5,10 +5,24 @@ from . import views
 urlpatterns = [
     path('', views.login_view, name='login'),
     path('upload/', views.upload, name='upload'),
+    path('uploads/', views.upload_init, name='upload_init'),
+    path('uploads/<str:upload_id>/', views.upload_state, name='upload_state'),
+    path('uploads/<str:upload_id>/files/<int:index>/', views.upload_chunk, name='upload_chunk'),
+    path('uploads/<str:upload_id>/finalize/', views.upload_finalize, name='upload_finalize'),
     path('viewer/', views.viewer, name='viewer'),
     path('reset/', views.reset_viewer, name='reset_viewer'),
     path('media-files/', views.list_media_files, name='media_files'),
     path('segmarks/', views.segmarks, name='segmarks'),
     path('segmarks/run-segmentation/', views.run_segmentation, name='run_segmentation'),
     path('segmarks/run-landmarks/', views.run_landmarks, name='run_landmarks'),
+    path('segmarks/landmarks/', views.landmark_points, name='landmark_points'),
+    path('segmarks/landmarks-volume/', views.landmark_volume, name='landmark_volume'),
+    path('segmarks/meshes/', views.segmentation_meshes, name='segmentation_meshes'),
+    path('bricks/<str:volume_name>/', views.fetch_bricks, name='fetch_bricks'),
+    path('masks/<str:volume_name>/', views.fetch_mask, name='fetch_mask'),
+    path('meshes/', views.fetch_meshes, name='fetch_meshes'),
+    path('layers/', views.fetch_layers, name='fetch_layers'),
+    path('window/<str:volume_name>/', views.window_volume, name='window_volume'),
+    path('stats/<str:volume_name>/', views.volume_stats, name='volume_stats'),
+    path('jobs/<str:job_id>/', views.job_status, name='job_status'),
 ]
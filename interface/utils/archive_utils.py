@@ -0,0 +1,80 @@
+import os
+import tarfile
+import zipfile
+
+# DICOM Part 10 files: 128 byte preamble followed by the 'DICM' prefix
+DICOM_PREAMBLE = 128
+DICOM_PREFIX = b'DICM'
+ARCHIVE_SUFFIXES = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz')
+
+
+def is_archive(name):
+    """
+    Returns True for file names of supported archives (zip, tar, compressed tar).
+    """
+    return name.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def _read_if_dicom(member):
+    """
+    Peeks at the preamble of an archive member, returns its bytes when it is a
+    DICOM file and None otherwise (only the first 132 bytes are decompressed).
+    """
+    head = member.read(DICOM_PREAMBLE + len(DICOM_PREFIX))
+    if head[DICOM_PREAMBLE:] != DICOM_PREFIX:
+        return None
+    return head + member.read()
+
+
+def iter_dicom_members(archive_path):
+    """
+    Streams the DICOM files out of a zip or tar archive, one member at a time,
+    without extracting the archive to disk.
+    -> for speed: non-DICOM members (viewers, reports, ...) are skipped after
+       reading their preamble; a DICOMDIR passes, read_dicom_header drops it
+    -> tar archives are read as stream (r|*), compressed tars are decompressed once
+
+    Args:
+        archive_path (str): Path of the archive.
+
+    Yields:
+        tuple: (member name, file bytes).
+    """
+    if zipfile.is_zipfile(archive_path):
+        with zipfile.ZipFile(archive_path) as archive:
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                with archive.open(info) as member:
+                    data = _read_if_dicom(member)
+                if data is not None:
+                    yield info.filename, data
+        return
+
+    try:
+        archive = tarfile.open(archive_path, mode='r|*')
+    except tarfile.TarError as exc:
+        raise ValueError(f"Not a zip or tar archive: {os.path.basename(archive_path)}") from exc
+    with archive:
+        for info in archive:
+            if not info.isfile():
+                continue
+            data = _read_if_dicom(archive.extractfile(info))
+            if data is not None:
+                yield info.name, data
+
+
+def extract_dicom_members(archive_path, folder):
+    """
+    Writes the DICOM files of an archive into a folder (flat, numbered names,
+    member paths are not trusted). Used when a series has to go through dicom2nifti.
+
+    Returns:
+        int: Number of files written.
+    """
+    os.makedirs(folder, exist_ok=True)
+    count = 0
+    for count, (_, data) in enumerate(iter_dicom_members(archive_path), start=1):
+        with open(os.path.join(folder, f'{count:06d}.dcm'), 'wb') as f:
+            f.write(data)
+    return count
@@ -0,0 +1,154 @@
+import os
+import shutil
+import hashlib
+
+# Version of the conversion outputs (files, formats, layouts), part of every cache key:
+# bump it when the converters change, entries of older converters are then never restored
+CONVERSION_VERSION = 3
+
+
+def write_upload(uploaded_file, dest_path):
+    """
+    Writes an uploaded file to disk chunk by chunk and hashes the bytes on the way.
+
+    Args:
+        uploaded_file (UploadedFile): Django uploaded file.
+        dest_path (str): Path where the file is written.
+
+    Returns:
+        str: sha256 hex digest of the file content.
+    """
+    digest = hashlib.sha256()
+    with open(dest_path, 'wb+') as dest:
+        for chunk in uploaded_file.chunks():
+            dest.write(chunk)
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def combine_digests(digests):
+    """
+    Combines the digests of several files (e.g. a DICOM folder) into one,
+    independent of the upload order.
+    """
+    digest = hashlib.sha256()
+    for d in sorted(digests):
+        digest.update(d.encode('ascii'))
+    return digest.hexdigest()
+
+
+def conversion_key(kind, digest):
+    """
+    Cache key of a conversion: kind ('dicom', 'nifti'), converter version and content hash.
+    """
+    return f'{kind}-v{CONVERSION_VERSION}-{digest}'
+
+
+def conversion_outputs(media_root, prefix):
+    """
+    Lists the files of one conversion in media_root: everything named <prefix>.* or <prefix>_*
+    """
+    return [name for name in os.listdir(media_root)
+            if os.path.isfile(os.path.join(media_root, name))
+            and (name.startswith(prefix + '.') or name.startswith(prefix + '_'))]
+
+
+def link_or_copy(src, dest):
+    """
+    Places src at dest as hard link, a copy where the file system has no hard links.
+    -> for speed: a link costs no bytes and no time, independent of the file size
+    """
+    if os.path.exists(dest):
+        os.remove(dest)
+    try:
+        os.link(src, dest)
+    except OSError:   # no hard links on this file system (or across file systems)
+        shutil.copyfile(src, dest)
+
+
+def remove_conversion_outputs(media_root, prefix):
+    """
+    Removes the outputs of an earlier conversion before converting again.
+    They can be hard links into the cache, writing over them would change the cached entry.
+    """
+    if not os.path.isdir(media_root):
+        return
+    for name in conversion_outputs(media_root, prefix):
+        os.remove(os.path.join(media_root, name))
+
+
+def restore_from_cache(cache_dir, key, media_root):
+    """
+    Links (or copies) the cached outputs of a conversion back into media_root
+    and marks the entry as recently used.
+
+    Returns:
+        list[str]: Restored file names, None when the key is not cached.
+    """
+    entry = os.path.join(cache_dir, key)
+    if not os.path.isdir(entry):
+        return None
+
+    os.makedirs(media_root, exist_ok=True)
+    restored = []
+    # precompressed variants last, they must not be older than their binary
+    # (a link keeps the mtime of the cached file, restored outputs are marked new like a copy)
+    for name in sorted(os.listdir(entry), key=lambda n: n.endswith(('.gz', '.zst', '.br'))):
+        link_or_copy(os.path.join(entry, name), os.path.join(media_root, name))
+        os.utime(os.path.join(media_root, name))
+        restored.append(name)
+
+    os.utime(entry)  # LRU: last use is the mtime of the entry folder
+    return restored
+
+
+def store_in_cache(cache_dir, key, media_root, prefix, max_bytes):
+    """
+    Stores the outputs of a conversion under their key and evicts the least
+    recently used entries while the cache is larger than max_bytes.
+    -> links (or copies) into a temporary folder first, so a half written entry is never used
+
+    Args:
+        cache_dir (str): Root folder of the conversion cache.
+        key (str): Cache key (kind and content hash).
+        media_root (str): Folder the outputs are taken from.
+        prefix (str): Name of the converted volume, see conversion_outputs.
+        max_bytes (int): Size limit of the whole cache.
+    """
+    entry = os.path.join(cache_dir, key)
+    if os.path.isdir(entry):
+        return
+
+    names = conversion_outputs(media_root, prefix)
+    tmp = os.path.join(cache_dir, f'.{key}.{os.getpid()}.tmp')
+    os.makedirs(tmp, exist_ok=True)
+    for name in names:
+        link_or_copy(os.path.join(media_root, name), os.path.join(tmp, name))
+    try:
+        os.rename(tmp, entry)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)  # stored concurrently by another job
+
+    evict_cache(cache_dir, max_bytes)
+
+
+def evict_cache(cache_dir, max_bytes):
+    """
+    Removes least recently used entries until the cache fits in max_bytes.
+    """
+    entries = []
+    for key in os.listdir(cache_dir):
+        entry = os.path.join(cache_dir, key)
+        if key.startswith('.') or not os.path.isdir(entry):
+            continue
+        size = sum(os.path.getsize(os.path.join(entry, name)) for name in os.listdir(entry))
+        entries.append((os.path.getmtime(entry), size, entry))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, entry in sorted(entries):
+        if total <= max_bytes:
+            break
+        print(f"[INFO] evicting {entry} from conversion cache")
+        shutil.rmtree(entry, ignore_errors=True)
+        total -= size
+
@@ -0,0 +1,171 @@
+import os
+import gzip
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+# zstd and brotli are optional, without them only gzip variants are written
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+CHUNK_SIZE = 1024 * 1024
+
+# Content-Encoding -> file suffix of the precompressed variant, in order of preference
+ENCODING_SUFFIXES = {
+    'br': '.br',
+    'zstd': '.zst',
+    'gzip': '.gz',
+}
+
+
+def available_encodings():
+    """
+    Returns the encodings variants can be written for (gzip always, zstd/brotli when installed).
+    """
+    encodings = []
+    if brotli is not None:
+        encodings.append('br')
+    if zstandard is not None:
+        encodings.append('zstd')
+    encodings.append('gzip')
+    return encodings
+
+
+def variant_path(path, encoding):
+    """
+    Returns the path of the precompressed variant of a file, e.g. volume.bin -> volume.bin.gz
+    """
+    return path + ENCODING_SUFFIXES[encoding]
+
+
+def compress_file(path, encoding):
+    """
+    Writes one precompressed variant of a file, chunk by chunk.
+    -> written to a temporary file first, a half written variant is never served
+
+    Args:
+        path (str): File to compress.
+        encoding (str): 'gzip', 'zstd' or 'br'.
+
+    Returns:
+        str: Path of the variant.
+    """
+    out_path = variant_path(path, encoding)
+    tmp_path = out_path + '.tmp'
+
+    with open(path, 'rb') as src, open(tmp_path, 'wb') as dst:
+        if encoding == 'gzip':
+            with gzip.GzipFile(fileobj=dst, mode='wb', compresslevel=6, mtime=0) as gz:
+                shutil.copyfileobj(src, gz, CHUNK_SIZE)
+        elif encoding == 'zstd':
+            zstandard.ZstdCompressor(level=3).copy_stream(src, dst, read_size=CHUNK_SIZE)
+        elif encoding == 'br':
+            compressor = brotli.Compressor(quality=5)
+            for chunk in iter(lambda: src.read(CHUNK_SIZE), b''):
+                dst.write(compressor.process(chunk))
+            dst.write(compressor.finish())
+        else:
+            raise ValueError(f"Unknown encoding {encoding}")
+
+    os.replace(tmp_path, out_path)
+    return out_path
+
+
+def compress_binaries(paths, encodings=None, workers=None):
+    """
+    Writes gzip (and zstd/brotli) variants next to the binary outputs of a conversion.
+    Overlays are mostly zeros and shrink by one to two orders of magnitude.
+    -> for speed: every (file, encoding) pair runs in its own thread, the compressors release the GIL
+
+    Args:
+        paths (list[str]): Files to compress, missing files are skipped.
+        encodings (list[str]): Default all available_encodings().
+        workers (int): Number of threads, default cpu count.
+
+    Returns:
+        list[str]: Paths of the written variants.
+    """
+    encodings = encodings or available_encodings()
+    tasks = [(p, e) for p in paths if os.path.isfile(p) for e in encodings]
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(lambda task: compress_file(*task), tasks))
+
+
+def parse_accept_encoding(header):
+    """
+    Parses an Accept-Encoding header into {coding: q}, e.g. 'gzip, br;q=0.5' -> {'gzip': 1.0, 'br': 0.5}
+    """
+    accepted = {}
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def choose_variant(path, accept_encoding):
+    """
+    Chooses the best precompressed variant of a file the client accepts.
+    Variants older than the file itself (stale after a reconversion) are ignored.
+
+    Args:
+        path (str): Path of the uncompressed file.
+        accept_encoding (str): Accept-Encoding request header.
+
+    Returns:
+        tuple: (variant path, encoding), (None, None) when the file has to be served as is.
+    """
+    accepted = parse_accept_encoding(accept_encoding)
+    mtime = os.path.getmtime(path)
+
+    for encoding in ENCODING_SUFFIXES:
+        q = accepted.get(encoding, accepted.get('*', 0.0))
+        if q <= 0:
+            continue
+        candidate = variant_path(path, encoding)
+        if os.path.isfile(candidate) and os.path.getmtime(candidate) >= mtime:
+            return candidate, encoding
+    return None, None
+
+
+def choose_variants(paths, accept_encoding):
+    """
+    Chooses one precompressed encoding for several files sent after each other as one body.
+    One file gets the best variant (see choose_variant). Several files only use zstd:
+    its frames concatenate into one valid stream, browsers stop after the first gzip
+    member and brotli streams cannot be concatenated.
+
+    Args:
+        paths (list[str]): Paths of the uncompressed files, in body order.
+        accept_encoding (str): Accept-Encoding request header.
+
+    Returns:
+        tuple: (paths to send, encoding), (paths, None) when the files have to be sent as is.
+    """
+    if len(paths) == 1:
+        variant, encoding = choose_variant(paths[0], accept_encoding)
+        return [variant or paths[0]], encoding
+
+    accepted = parse_accept_encoding(accept_encoding)
+    if accepted.get('zstd', accepted.get('*', 0.0)) > 0:
+        variants = [variant_path(p, 'zstd') for p in paths]
+        if all(os.path.isfile(v) and os.path.getmtime(v) >= os.path.getmtime(p) for p, v in zip(paths, variants)):
+            return variants, 'zstd'
+    return list(paths), None
@@ -0,0 +1,113 @@
+import json
+
+import numpy as np
+
+# Volume container (.vol): fixed 80 byte little-endian header, then the payload (C order),
+# then optionally a UTF-8 JSON block with the layer metadata (crop offset, reference dims,
+# label index). The viewer gets geometry, data and metadata of a layer in one request.
+CONTAINER_MAGIC = b'APVL'
+CONTAINER_VERSION = 1
+
+CONTAINER_HEADER = np.dtype([
+    ('magic', 'S4'),
+    ('version', '<u2'),
+    ('dtype', '<u2'),           # code, see CONTAINER_DTYPES
+    ('dims', '<u4', 3),         # x, y, z (same order as the meta JSON)
+    ('spacing', '<f8', 3),
+    ('origin', '<f8', 3),
+    ('payload_bytes', '<u8'),
+    ('meta_bytes', '<u4'),      # JSON metadata after the payload, 0 without
+])
+
+CONTAINER_DTYPES = {
+    1: np.dtype('uint8'),
+    2: np.dtype('<i2'),
+    3: np.dtype('<u2'),
+    4: np.dtype('<f4'),
+}
+
+
+def container_path(bin_path):
+    """
+    Returns the path of the container that belongs to a .bin file.
+    """
+    return bin_path.replace('.bin', '.vol')
+
+
+def pack_container_header(shape, dtype, spacing, origin, meta_bytes=0):
+    """
+    Builds the fixed header of a container.
+
+    Args:
+        shape (tuple): Shape of the numpy volume (dims are written reversed, x, y, z).
+        dtype (np.dtype): Voxel type, one of CONTAINER_DTYPES.
+        spacing (list): Voxel spacing [x, y, z].
+        origin (list): World origin [x, y, z].
+        meta_bytes (int): Size of the JSON metadata block after the payload.
+
+    Returns:
+        bytes: Header of CONTAINER_HEADER.itemsize bytes.
+    """
+    codes = {v: k for k, v in CONTAINER_DTYPES.items()}
+    dtype = np.dtype(dtype)
+    if dtype not in codes:
+        raise ValueError(f"Unsupported container dtype {dtype}")
+
+    header = np.zeros((), dtype=CONTAINER_HEADER)
+    header['magic'] = CONTAINER_MAGIC
+    header['version'] = CONTAINER_VERSION
+    header['dtype'] = codes[dtype]
+    header['dims'] = shape[::-1]
+    header['spacing'] = spacing
+    header['origin'] = origin
+    header['payload_bytes'] = int(np.prod(shape)) * dtype.itemsize
+    header['meta_bytes'] = meta_bytes
+    return header.tobytes()
+
+
+def write_container(volume, spacing, origin, path, meta=None):
+    """
+    Writes a volume with its geometry as one self-describing file.
+
+    Args:
+        volume (np.ndarray): 3D volume (numpy order), may be a memmap.
+        spacing (list): Voxel spacing [x, y, z].
+        origin (list): World origin [x, y, z].
+        path (str): Output path (.vol).
+        meta (dict): Optional layer metadata, e.g. offset and reference_dims [x, y, z]
+            of a cropped overlay or the label index of a segmentation.
+    """
+    meta_block = json.dumps(meta).encode('utf-8') if meta else b''
+    with open(path, 'wb') as f:
+        f.write(pack_container_header(volume.shape, volume.dtype, spacing, origin, len(meta_block)))
+        f.write(np.ascontiguousarray(volume).tobytes(order='C'))
+        f.write(meta_block)
+
+
+def read_container(data):
+    """
+    Parses a container from bytes.
+
+    Returns:
+        tuple: (header dict with dims, spacing, origin, dtype and meta; volume np.ndarray in numpy order).
+    """
+    if len(data) < CONTAINER_HEADER.itemsize:
+        raise ValueError("Container too short")
+    header = np.frombuffer(data, dtype=CONTAINER_HEADER, count=1)[0]
+    if header['magic'] != CONTAINER_MAGIC:
+        raise ValueError("Not a volume container")
+
+    dtype = CONTAINER_DTYPES[int(header['dtype'])]
+    dims = [int(d) for d in header['dims']]
+    start = CONTAINER_HEADER.itemsize
+    volume = np.frombuffer(data, dtype=dtype, count=int(np.prod(dims)), offset=start).reshape(dims[::-1])
+    meta_start = start + int(header['payload_bytes'])
+    meta_block = bytes(data[meta_start:meta_start + int(header['meta_bytes'])])
+    info = {
+        'dims': dims,
+        'spacing': header['spacing'].tolist(),
+        'origin': header['origin'].tolist(),
+        'dtype': dtype.name,
+        'meta': json.loads(meta_block) if meta_block else {},
+    }
+    return info, volume
@@ -1,28 +1,358 @@
 import os
+import io
+import tempfile
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import nibabel as nib
+from nibabel.orientations import io_orientation, axcodes2ornt, ornt_transform, apply_orientation, inv_ornt_aff
+import pydicom
+from pydicom.errors import InvalidDicomError
 import dicom2nifti
 
-def convert_dicom_to_nifti(dicom_folder, output_nifti_path):
+from .nifti_utils import convert_image_to_binary, convert_nifti_to_binary
+from .timing_utils import stage
+from .archive_utils import iter_dicom_members, extract_dicom_members
+
+
+def _open_source(source):
+    """
+    DICOM sources are file paths or the bytes of a file (e.g. from an archive).
+    """
+    return io.BytesIO(source) if isinstance(source, bytes) else source
+
+
+def read_dicom_header(source):
+    """
+    Reads the header of a DICOM file without its pixel data.
+
+    Args:
+        source (str | bytes): Path or content of the file.
+
+    Returns:
+        pydicom.Dataset: Header, None when the file is not an image slice.
+    """
+    try:
+        header = pydicom.dcmread(_open_source(source), stop_before_pixels=True)
+    except (InvalidDicomError, OSError):
+        return None
+    if 'ImagePositionPatient' not in header or 'ImageOrientationPatient' not in header:
+        return None  # e.g. DICOMDIR, reports, multiframe
+    return header
+
+
+def scan_dicom_series(dicom_folder, workers=None):
+    """
+    Scans the headers of all files in a folder and groups the slices per series.
+
+    Args:
+        dicom_folder (str): Folder with the DICOM files.
+        workers (int): Number of threads, default cpu count.
+
+    Returns:
+        dict: SeriesInstanceUID -> list of (path, header).
+    """
+    paths = [os.path.join(dicom_folder, name) for name in sorted(os.listdir(dicom_folder))]
+    return group_dicom_series([p for p in paths if os.path.isfile(p)], workers=workers)
+
+
+def group_dicom_series(sources, workers=None):
+    """
+    Reads the headers of DICOM sources (paths or file bytes) and groups the slices per series.
+
+    Returns:
+        dict: SeriesInstanceUID -> list of (source, header).
+    """
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        headers = list(pool.map(read_dicom_header, sources))
+
+    series = defaultdict(list)
+    for source, header in zip(sources, headers):
+        if header is not None:
+            series[header.get('SeriesInstanceUID', '')].append((source, header))
+    return series
+
+
+def sort_slices(slices):
+    """
+    Sorts slices on their position along the axis with the largest extent
+    (same order as dicom2nifti uses).
+    """
+    positions = np.array([[float(v) for v in h.ImagePositionPatient] for _, h in slices])
+    axis = int(np.argmax(positions.max(axis=0) - positions.min(axis=0)))
+    order = np.argsort(positions[:, axis], kind='stable')
+    return [slices[i] for i in order]
+
+
+def create_affine(sorted_headers):
+    """
+    Creates the (RAS) affine of a sorted series, identical to dicom2nifti.
+    """
+    first, last = sorted_headers[0], sorted_headers[-1]
+    orient1 = np.array([float(v) for v in first.ImageOrientationPatient[0:3]])
+    orient2 = np.array([float(v) for v in first.ImageOrientationPatient[3:6]])
+    delta_r = float(first.PixelSpacing[0])
+    delta_c = float(first.PixelSpacing[1])
+    image_pos = np.array([float(v) for v in first.ImagePositionPatient])
+    last_pos = np.array([float(v) for v in last.ImagePositionPatient])
+
+    if len(sorted_headers) == 1:
+        step = -np.cross(orient1, orient2) * float(first.get('SliceThickness', 1))
+    else:
+        step = (image_pos - last_pos) / (1 - len(sorted_headers))
+    if np.linalg.norm(step) == 0.0:
+        raise ValueError("Slices of the series have the same position")
+
+    return np.array([
+        [-orient1[0] * delta_c, -orient2[0] * delta_r, -step[0], -image_pos[0]],
+        [-orient1[1] * delta_c, -orient2[1] * delta_r, -step[1], -image_pos[1]],
+        [orient1[2] * delta_c, orient2[2] * delta_r, step[2], image_pos[2]],
+        [0, 0, 0, 1]
+    ])
+
+
+def volume_dtype(headers):
+    """
+    Chooses one output dtype for the rescaled pixel data of all slices,
+    based on the stored bit range and RescaleSlope/RescaleIntercept.
+    """
+    low, high = [], []
+    for h in headers:
+        slope = float(h.get('RescaleSlope', 1))
+        intercept = float(h.get('RescaleIntercept', 0))
+        if slope != int(slope) or intercept != int(intercept):
+            return np.float32
+        bits = int(h.BitsStored)
+        lo, hi = (-2 ** (bits - 1), 2 ** (bits - 1) - 1) if h.PixelRepresentation == 1 else (0, 2 ** bits - 1)
+        low.append(min(lo * slope + intercept, hi * slope + intercept))
+        high.append(max(lo * slope + intercept, hi * slope + intercept))
+
+    for dtype in (np.int16, np.int32):
+        if min(low) >= np.iinfo(dtype).min and max(high) <= np.iinfo(dtype).max:
+            return dtype
+    return np.float32
+
+
+def read_dicom_series(dicom_folder, workers=None):
+    """
+    Reads the largest DICOM series in a folder into one volume.
+
+    Headers are scanned, grouped per series and sorted by slice position.
+    The pixel data of the slices is then decoded by a thread pool straight
+    into a preallocated volume (same layout as dicom2nifti: columns, rows, slices).
+
+    Args:
+        dicom_folder (str): Folder with the DICOM files.
+        workers (int): Number of threads, default cpu count.
+
+    Returns:
+        tuple: (volume np.ndarray, affine np.ndarray) in dicom2nifti layout, before reorientation.
+    """
+    return read_largest_series(scan_dicom_series(dicom_folder, workers=workers), workers=workers)
+
+
+def read_dicom_archive(archive_path, workers=None):
+    """
+    Reads the largest DICOM series in a zip or tar archive into one volume.
+    -> the members are streamed from the archive and kept in memory,
+       nothing is extracted to disk (see archive_utils)
+
+    Args:
+        archive_path (str): Path of the archive.
+        workers (int): Number of threads, default cpu count.
+
+    Returns:
+        tuple: (volume np.ndarray, affine np.ndarray), see read_dicom_series.
+    """
+    sources = [data for _, data in iter_dicom_members(archive_path)]
+    return read_largest_series(group_dicom_series(sources, workers=workers), workers=workers)
+
+
+def read_largest_series(series, workers=None):
+    """
+    Decodes the largest of the grouped series (see group_dicom_series) into one volume.
+
+    Returns:
+        tuple: (volume np.ndarray, affine np.ndarray), see read_dicom_series.
+    """
+    if not series:
+        raise ValueError("No DICOM image slices found")
+
+    slices = sort_slices(max(series.values(), key=len))
+    headers = [h for _, h in slices]
+    rows, cols = int(headers[0].Rows), int(headers[0].Columns)
+    dtype = volume_dtype(headers)
+
+    # Fortran order: every slice is one contiguous block
+    volume = np.empty((cols, rows, len(slices)), dtype=dtype, order='F')
+
+    def decode(index):
+        source, header = slices[index]
+        data = pydicom.dcmread(_open_source(source)).pixel_array
+        if data.shape != (rows, cols):
+            raise ValueError(f"Slice {index} has shape {data.shape}, expected {(rows, cols)}")
+        slope = float(header.get('RescaleSlope', 1))
+        intercept = float(header.get('RescaleIntercept', 0))
+        if dtype == np.float32:
+            volume[:, :, index] = data.T * np.float32(slope) + np.float32(intercept)
+        else:
+            volume[:, :, index] = data.T.astype(dtype) * dtype(slope) + dtype(intercept)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(decode, range(len(slices))))
+
+    return volume, create_affine(headers)
+
+
+def reorient_to_las(volume, affine):
+    """
+    Reorients a volume in memory to LAS, the orientation dicom2nifti writes (reorient=True).
+    -> same data and affine as dicom2nifti.image_reorientation.reorient_image,
+       without writing a NIfTI file
+
+    Returns:
+        nib.Nifti1Image: Reoriented image (data may be a view on volume).
     """
-    Converts DICOM files to a single NIfTI (.nii.gz) file using the dicom2nifti function.
+    ornt = ornt_transform(io_orientation(affine), axcodes2ornt(('L', 'A', 'S')))
+    data = apply_orientation(volume, ornt)
+    img = nib.Nifti1Image(data, affine @ inv_ornt_aff(ornt, volume.shape))
+    img.header.set_slope_inter(1, 0)
+    img.header.set_xyzt_units(2)  # mm
+    return img
+
+
+def convert_dicom_to_nifti(dicom_folder, output_nifti_path, workers=None):
+    """
+    Converts DICOM files to a single NIfTI (.nii.gz, or .nii uncompressed) file.
+    -> for speed: slices are decoded in parallel by read_dicom_series
+    -> falls back to dicom2nifti for series it cannot read (e.g. multiframe)
 
     Args:
         dicom_folder (str): Path to input folder with DICOM files.
         output_nifti_path (str): Path where the output NIfTI file will be saved.
+        workers (int): Number of decoding threads, default cpu count.
     """
     try:
         os.makedirs(os.path.dirname(output_nifti_path), exist_ok=True)
+        try:
+            with stage('read dicom') as info:
+                volume, affine = read_dicom_series(dicom_folder, workers=workers)
+                info['bytes'] = volume.nbytes
+        except Exception as exc:
+            print(f"[INFO] parallel DICOM reading failed ({exc}), using dicom2nifti")
+            with stage('dicom2nifti'):
+                convert_dicom_with_dicom2nifti(dicom_folder, output_nifti_path)
+            return
+
+        # Transfrom LPS to RAS orientation, same as dicom2nifti reorient=True
+        with stage('write nifti', volume.nbytes):
+            nib.save(reorient_to_las(volume, affine), output_nifti_path)
+    except Exception as exc:
+        raise RuntimeError(f"Error converting DICOM to NIfTI: {exc}") from exc
+
+
+def convert_dicom_to_binary(dicom_folder, bin_out, meta_out, nifti_out=None, workers=None, **kwargs):
+    """
+    Converts DICOM files directly to binary format (+ pyramid, bricks and preview),
+    without the round trip through a compressed NIfTI file.
+    -> for speed: volume and affine stay in memory, no gzip compression and decompression
+    -> the NIfTI is optional (nifti_out), written after the binaries are done
+    -> falls back to dicom2nifti for series it cannot read (e.g. multiframe)
+
+    Args:
+        dicom_folder (str): Path to input folder with DICOM files.
+        bin_out (str): Output path for .bin file.
+        meta_out (str): Output path for metadata .json file.
+        nifti_out (str): Optional path for a NIfTI copy (.nii for uncompressed).
+        workers (int): Number of decoding threads, default cpu count.
+        **kwargs: Passed on to convert_image_to_binary (preview_scale, pyramid_levels, ...).
+    """
+    try:
+        with stage('read dicom') as info:
+            volume, affine = read_dicom_series(dicom_folder, workers=workers)
+            info['bytes'] = volume.nbytes
+    except Exception as exc:
+        print(f"[INFO] parallel DICOM reading failed ({exc}), using dicom2nifti")
+        # without nifti_out the intermediate NIfTI never enters the workspace
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(bin_out)) as folder:
+            nifti_path = nifti_out or os.path.join(folder, 'dicom_fallback.nii')
+            with stage('dicom2nifti'):
+                convert_dicom_with_dicom2nifti(dicom_folder, nifti_path)
+            convert_nifti_to_binary(nifti_path, bin_out, meta_out, **kwargs)
+        return
+
+    convert_dicom_volume_to_binary(volume, affine, bin_out, meta_out, nifti_out=nifti_out, **kwargs)
+
+
+def convert_dicom_archive_to_binary(archive_path, bin_out, meta_out, nifti_out=None, workers=None, **kwargs):
+    """
+    Converts the DICOM series in a zip or tar archive (e.g. a PACS export) to binary format,
+    same outputs as convert_dicom_to_binary.
+    -> for speed: the DICOM members are streamed from the archive, the archive is not unpacked
+    -> series that cannot be read directly are extracted and go through dicom2nifti
+
+    Args:
+        archive_path (str): Path of the archive.
+        bin_out (str): Output path for .bin file.
+        meta_out (str): Output path for metadata .json file.
+        nifti_out (str): Optional path for a NIfTI copy (.nii for uncompressed).
+        workers (int): Number of decoding threads, default cpu count.
+        **kwargs: Passed on to convert_image_to_binary (preview_scale, pyramid_levels, ...).
+    """
+    try:
+        with stage('read dicom archive') as info:
+            volume, affine = read_dicom_archive(archive_path, workers=workers)
+            info['bytes'] = volume.nbytes
+    except Exception as exc:
+        print(f"[INFO] reading DICOM archive failed ({exc}), extracting it")
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(bin_out)) as folder:
+            with stage('extract archive'):
+                extract_dicom_members(archive_path, folder)
+            convert_dicom_to_binary(folder, bin_out, meta_out, nifti_out=nifti_out, workers=workers, **kwargs)
+        return
+
+    convert_dicom_volume_to_binary(volume, affine, bin_out, meta_out, nifti_out=nifti_out, **kwargs)
+
+
+def convert_dicom_volume_to_binary(volume, affine, bin_out, meta_out, nifti_out=None, **kwargs):
+    """
+    Reorients a volume read from DICOM (dicom2nifti layout) to LAS and converts it
+    to binary format, optionally also saving it as NIfTI.
+    """
+    with stage('reorient'):
+        img = reorient_to_las(volume, affine)
+    convert_image_to_binary(img, bin_out, meta_out, **kwargs)
+
+    if nifti_out:
+        with stage('nifti export', volume.nbytes):
+            nib.save(img, nifti_out)
+
+
+def convert_dicom_with_dicom2nifti(dicom_folder, output_nifti_path):
+    """
+    Converts DICOM files to a single NIfTI (.nii.gz, or .nii uncompressed) file using the dicom2nifti function.
+    dicom2nifti writes one file per series into a temporary folder, only the largest
+    (the volume, not a localizer or scout) is moved to output_nifti_path.
+
+    Args:
+        dicom_folder (str): Path to input folder with DICOM files.
+        output_nifti_path (str): Path where the output NIfTI file will be saved.
+    """
+    compression = output_nifti_path.endswith('.gz')
+    extension = '.nii.gz' if compression else '.nii'
+    output_folder = os.path.dirname(output_nifti_path)
+    os.makedirs(output_folder, exist_ok=True)
+
+    # same filesystem as the output, so the result is moved and not copied
+    with tempfile.TemporaryDirectory(dir=output_folder) as folder:
         dicom2nifti.convert_directory(
             dicom_folder,
-            os.path.dirname(output_nifti_path),
-            compression=True,
+            folder,
+            compression=compression,
             reorient=True                       # Transfrom LPS to RAS orientation
         )
-
-        # Find and rename the first .nii.gz file to the expected name
-        for filename in os.listdir(os.path.dirname(output_nifti_path)):
-            if filename.endswith('.nii.gz'):
-                actual_path = os.path.join(os.path.dirname(output_nifti_path), filename)
-                os.rename(actual_path, output_nifti_path)
-                break
-    except Exception as exc:
-        raise RuntimeError(f"Error converting DICOM to NIfTI: {exc}") from exc
+        outputs = [os.path.join(folder, f) for f in os.listdir(folder) if f.endswith(extension)]
+        if not outputs:
+            raise ValueError(f"dicom2nifti wrote no NIfTI file for {dicom_folder}")
+        os.replace(max(outputs, key=os.path.getsize), output_nifti_path)
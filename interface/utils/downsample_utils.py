@@ -0,0 +1,135 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# Volumes with more voxels than this are reduced by several threads (numpy releases the GIL)
+THREAD_MIN_VOXELS = 2 ** 22
+REDUCE_MODES = ('mean', 'max', 'mode')
+
+
+def _reduce_axes(volume, factors, combine, dtype):
+    """
+    Combines the voxels of every block one axis after the other: per axis the
+    strided views offset 0..factor-1 are combined into the first.
+    -> for speed: every pass runs over plain strided views, much faster than
+       reducing a reshaped 6D view over its factor axes
+    """
+    out = volume
+    for axis, f in enumerate(factors):
+        if f == 1 and out is not volume:   # the first pass always copies, the input is never modified
+            continue
+        index = [slice(None)] * 3
+        index[axis] = slice(0, None, f)
+        reduced = out[tuple(index)].astype(dtype)   # copy, combined in place
+        for offset in range(1, f):
+            index[axis] = slice(offset, None, f)
+            combine(reduced, out[tuple(index)], out=reduced)
+        out = reduced
+    return out
+
+
+def _sum_dtype(dtype, count):
+    """
+    Smallest accumulator for the sum of `count` values of dtype.
+    """
+    if np.issubdtype(dtype, np.floating):
+        return np.float32
+    if dtype == np.uint8 and count * 255 <= np.iinfo(np.uint16).max:
+        return np.uint16
+    if np.dtype(dtype).itemsize <= 2:
+        return np.int32
+    return np.int64
+
+
+def _reduce_blocks(volume, factors, mode):
+    """
+    Reduces a volume whose shape is a multiple of factors over its blocks.
+    """
+    if mode == 'max':
+        return _reduce_axes(volume, factors, np.maximum, volume.dtype)
+
+    if mode == 'mode':
+        return _mode_blocks(volume, factors)
+
+    count = int(np.prod(factors))
+    total = _reduce_axes(volume, factors, np.add, _sum_dtype(volume.dtype, count))
+    if np.issubdtype(volume.dtype, np.integer):
+        return np.rint(total / np.float32(count)).astype(volume.dtype)
+    return (total / np.float32(count)).astype(volume.dtype)
+
+
+def _mode_blocks(volume, factors):
+    """
+    Most frequent nonzero label per block, background only for empty blocks.
+    -> for speed: blocks with at most one nonzero label (nearly all of them) are
+       found with a max and a min-nonzero pass, only blocks where labels touch are counted
+    """
+    highest = _reduce_axes(volume, factors, np.maximum, volume.dtype)
+    background = np.iinfo(volume.dtype).max
+    lowest = _reduce_axes(np.where(volume == 0, volume.dtype.type(background), volume), factors,
+                          np.minimum, volume.dtype)
+    mixed = np.nonzero(highest > lowest)
+    if not len(mixed[0]):
+        return highest
+
+    # voxels of the mixed blocks, one row per block
+    offsets = np.indices(factors).reshape(3, -1)
+    voxels = np.asarray(volume)[tuple(mixed[axis][:, None] * factors[axis] + offsets[axis] for axis in range(3))]
+    labels = np.unique(voxels[voxels != 0])
+    counts = np.stack([(voxels == label).sum(axis=1) for label in labels], axis=1)
+    highest[mixed] = labels[np.argmax(counts, axis=1)]   # ties go to the lowest label
+    return highest
+
+
+def block_reduce(volume, factor=2, mode='mean', workers=None):
+    """
+    Downsamples a volume by integer factors by reducing every block of voxels.
+    -> for speed: vectorized, no interpolation, one strided pass per axis;
+       large volumes are split into slabs along the first axis and reduced by a thread pool
+
+    Axes that are not a multiple of the factor are padded by repeating the last
+    voxel, so the output has ceil(size / factor) voxels per axis. Blocks never
+    cross a multiple of the factor, so slabs aligned to it give the same result
+    as the whole volume.
+
+    Modes:
+        mean: average intensity (integers are rounded), for anatomy.
+        max: largest value, keeps thin structures of binary masks.
+        mode: most frequent nonzero label of the block, for label maps with
+              several labels (thin structures are kept like with max).
+
+    Args:
+        volume (np.ndarray): 3D volume (numpy order), may be a memmap.
+        factor (int | tuple[int]): Reduction factor, per axis or for all axes.
+        mode (str): One of REDUCE_MODES.
+        workers (int): Number of threads, default cpu count.
+
+    Returns:
+        np.ndarray: Reduced volume of the same dtype.
+    """
+    if mode not in REDUCE_MODES:
+        raise ValueError(f"Unknown reduce mode {mode}")
+    factors = (factor,) * 3 if np.isscalar(factor) else tuple(factor)
+    if mode == 'mode' and volume.dtype not in (np.uint8, np.uint16):
+        raise ValueError("mode reduction needs an unsigned integer label volume")
+
+    pad = [(0, -size % f) for size, f in zip(volume.shape, factors)]
+    if any(p for _, p in pad):
+        volume = np.pad(volume, pad, mode='edge')
+
+    out_shape = tuple(size // f for size, f in zip(volume.shape, factors))
+    workers = workers or os.cpu_count() or 1
+    if volume.size < THREAD_MIN_VOXELS or workers == 1 or out_shape[0] < 2:
+        return _reduce_blocks(volume, factors, mode)
+
+    out = np.empty(out_shape, dtype=volume.dtype)
+    rows = -(-out_shape[0] // workers)   # output rows per task
+
+    def reduce_slab(start):
+        stop = min(start + rows, out_shape[0])
+        out[start:stop] = _reduce_blocks(volume[start * factors[0]:stop * factors[0]], factors, mode)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(reduce_slab, range(0, out_shape[0], rows)))
+    return out
@@ -0,0 +1,76 @@
+import numpy as np
+
+# Label volumes are stored as uint8, label 0 is background
+MAX_LABEL = 255
+
+
+def to_labels(values):
+    """
+    Converts segmentation values (any dtype) to uint8 labels, label values are kept.
+    Float values (scaled NIfTI data) are rounded to the nearest label.
+    """
+    values = np.asarray(values)
+    if values.dtype == np.uint8:
+        return values
+    if values.dtype.kind == 'f':
+        values = np.rint(values)
+    if values.size and (values.min() < 0 or values.max() > MAX_LABEL):
+        raise ValueError(f"Segmentation labels have to be between 0 and {MAX_LABEL}")
+    return values.astype(np.uint8)
+
+
+class LabelIndex:
+    """
+    Accumulates per label the voxel count, bounding box and centroid, slab by slab,
+    so the index comes from the same pass as the conversion.
+    -> for speed: only the nonzero voxels are visited (one np.nonzero per slab), per axis
+       one bincount over their (coordinate, label) pairs gives how often every label
+       occurs in every row, plane and slice; counts, boxes and centroids all follow
+       exactly from these three small histograms, no per label loop over the volume
+    """
+
+    def __init__(self, shape):
+        self.shape = tuple(shape)
+        # histograms[axis][coordinate, label]: voxels of label at that coordinate of the axis
+        self.histograms = [np.zeros((n, MAX_LABEL + 1), dtype=np.int64) for n in self.shape]
+
+    def update(self, slab, z):
+        """
+        Adds a uint8 label slab (numpy order) that starts at slice z of the last axis.
+        """
+        slab = np.asarray(slab)
+        coords = np.nonzero(slab)
+        if not len(coords[0]):
+            return
+        labels = slab[coords].astype(np.int64)
+        for axis, n in enumerate(slab.shape):
+            keys = coords[axis] * (MAX_LABEL + 1) + labels
+            counts = np.bincount(keys, minlength=n * (MAX_LABEL + 1)).reshape(n, MAX_LABEL + 1)
+            if axis == 2:
+                self.histograms[2][z:z + n] += counts
+            else:
+                self.histograms[axis] += counts
+
+    def to_dict(self, offset=(0, 0, 0)):
+        """
+        Returns the index per nonzero label, in the axis order of the metadata
+        (like the mask index): {'<label>': {'voxels', 'bbox': {'start', 'dims'}, 'centroid'}}.
+        Boxes and centroids are voxel coordinates of the reference grid, offset (numpy order)
+        is the position of a cropped volume in it.
+        """
+        counts = self.histograms[0].sum(axis=0)
+        index = {}
+        for label in np.flatnonzero(counts[1:]) + 1:
+            start, size, centroid = [], [], []
+            for histogram, shift in zip(self.histograms, offset):
+                rows = histogram[:, label]
+                present = np.flatnonzero(rows)
+                start.append(int(present[0]) + shift)
+                size.append(int(present[-1] - present[0] + 1))
+                centroid.append(round(float(np.dot(np.arange(len(rows)), rows) / counts[label]) + shift, 3))
+            index[str(label)] = {
+                'voxels': int(counts[label]),
+                'bbox': {'start': start[::-1], 'dims': size[::-1]},
+                'centroid': centroid[::-1],
+            }
+        return index
@@ -1,7 +1,21 @@
 import os
+import math
 import json
 import numpy as np
-from scipy.ndimage import zoom
+
+from .volume_utils import (
+    build_volume_pyramid,
+    write_volume_pyramid,
+    write_volume_bricks,
+    pyramid_preview,
+    level_path,
+    aligned_crop,
+    crop_origin
+)
+from .compress_utils import compress_binaries
+from .mask_utils import write_mask
+from .container_utils import write_container, container_path
+from .timing_utils import stage
 
 
 def read_json_information(input_folder):
@@ -98,6 +112,172 @@ def transform_landmarks_to_voxel_space(landmarks, origin, spacing, dims=None):
     return voxel_landmarks
 
 
+def landmarks_to_point_set(voxel_landmarks, dims, spacing, origin):
+    """
+    Collects the transformed landmarks in a compact point set (a few kB),
+    served as is instead of a rasterized volume.
+
+    Args:
+        voxel_landmarks (list): Output of transform_landmarks_to_voxel_space.
+        dims (list[int]): Dimensions of the anatomy [x, y, z].
+        spacing (list[float]): Spacing [x, y, z] of the anatomy.
+        origin (list[float]): Origin [x, y, z] of the anatomy.
+
+    Returns:
+        dict: ids, labels, voxel [i, j, k] and world [x, y, z] per landmark, with the anatomy geometry.
+    """
+    return {
+        'ids': [lm.get('id') for lm in voxel_landmarks],
+        'labels': [lm.get('label') for lm in voxel_landmarks],
+        'voxel': [[lm['voxel']['i'], lm['voxel']['j'], lm['voxel']['k']] for lm in voxel_landmarks],
+        'world': [[lm['position']['x'], lm['position']['y'], lm['position']['z']] for lm in voxel_landmarks],
+        'dims': list(dims),
+        'spacing': list(spacing),
+        'origin': list(origin),
+    }
+
+
+def point_set_to_buffer(point_set):
+    """
+    Packs the coordinates of a point set as float32, per landmark: i, j, k, x, y, z.
+    """
+    coords = np.zeros((len(point_set['voxel']), 6), dtype=np.float32)
+    if len(coords):
+        coords[:, :3] = point_set['voxel']
+        coords[:, 3:] = point_set['world']
+    return coords.tobytes()
+
+
+def point_set_to_landmarks(point_set):
+    """
+    Turns a point set back into voxel landmarks, e.g. for convert_landmarks_to_volume_binary.
+    """
+    return [
+        {
+            'id': lm_id,
+            'label': label,
+            'position': {'x': world[0], 'y': world[1], 'z': world[2]},
+            'voxel': {'i': voxel[0], 'j': voxel[1], 'k': voxel[2]},
+        }
+        for lm_id, label, voxel, world in zip(point_set['ids'], point_set['labels'], point_set['voxel'], point_set['world'])
+    ]
+
+
+def build_sphere_stencil(spacing, radius_mm):
+    """
+    Builds a boolean ellipsoid stencil for a sphere of radius_mm in voxel space.
+
+    The stencil is anisotropic: its half-size per axis is the radius rounded to
+    whole voxels using the spacing of that axis. A voxel offset is part of the
+    sphere when its distance in mm is within radius_mm.
+
+    Args:
+        spacing (list[float]): Spacing [x, y, z] in mm.
+        radius_mm (float): Radius of the sphere in mm.
+
+    Returns:
+        np.ndarray: Boolean stencil in z,y,x order with odd size per axis.
+    """
+    rx = int(round(radius_mm / spacing[0]))
+    ry = int(round(radius_mm / spacing[1]))
+    rz = int(round(radius_mm / spacing[2]))
+
+    dz_mm = np.arange(-rz, rz + 1)[:, None, None] * spacing[2]
+    dy_mm = np.arange(-ry, ry + 1)[None, :, None] * spacing[1]
+    dx_mm = np.arange(-rx, rx + 1)[None, None, :] * spacing[0]
+
+    # same summation order as the distance check per voxel (x, y, z)
+    return dx_mm**2 + dy_mm**2 + dz_mm**2 <= radius_mm**2
+
+
+def stamp_stencil(volume, stencil, center, value=255):
+    """
+    Writes value into the volume wherever the stencil is set, centered on a voxel.
+
+    The stencil is clipped at the volume borders, so landmarks near or outside
+    the edge are drawn partially (or not at all).
+
+    Args:
+        volume (np.ndarray): Volume in z,y,x order, modified in place.
+        stencil (np.ndarray): Boolean stencil in z,y,x order (odd sizes).
+        center (tuple[int]): Center voxel (k, j, i) in z,y,x order.
+        value (int): Value to write for voxels inside the stencil.
+    """
+    src = []
+    dst = []
+    for c, size, half in zip(center, volume.shape, (n // 2 for n in stencil.shape)):
+        lo, hi = c - half, c + half + 1
+        lo_clip, hi_clip = max(lo, 0), min(hi, size)
+        if lo_clip >= hi_clip:
+            return
+        dst.append(slice(lo_clip, hi_clip))
+        src.append(slice(lo_clip - lo, hi_clip - lo))
+
+    volume[tuple(dst)][stencil[tuple(src)]] = value
+
+
+def landmark_center(lm):
+    """
+    Center voxel (k, j, i) of a landmark in z,y,x order.
+    """
+    v = lm['voxel']
+    return int(round(v['k'])), int(round(v['j'])), int(round(v['i']))
+
+
+def landmarks_bbox(landmarks, shape, spacing, radius_mm=3):
+    """
+    Bounding box of the landmark spheres inside a volume of shape (z,y,x order).
+
+    Returns:
+        tuple: (start, stop) per axis in z,y,x order, None when no sphere lies inside.
+    """
+    start = np.array(shape)
+    stop = np.zeros(3, dtype=int)
+    for lm in landmarks:
+        half = np.array(build_sphere_stencil(spacing, lm.get('radius_mm', radius_mm)).shape) // 2
+        center = np.array(landmark_center(lm))
+        lo, hi = np.maximum(center - half, 0), np.minimum(center + half + 1, shape)
+        if np.all(lo < hi):
+            start, stop = np.minimum(start, lo), np.maximum(stop, hi)
+
+    if np.any(start >= stop):
+        return None
+    return tuple((int(a), int(b)) for a, b in zip(start, stop))
+
+
+def rasterize_landmarks(landmarks, dims, spacing, radius_mm=3, value=255, offset=(0, 0, 0)):
+    """
+    Renders landmarks as spheres in a uint8 volume (z,y,x order).
+
+    One stencil is built per distinct radius and stamped at each landmark.
+    Landmarks can override the defaults with their own 'radius_mm' and 'value'
+    keys; later landmarks overwrite earlier ones where they overlap.
+
+    Args:
+        landmarks (list): Landmarks with voxel coordinates.
+        dims (list[int]): Dimensions of the output volume [x, y, z].
+        spacing (list[float]): Spacing [x, y, z] in mm.
+        radius_mm (float): Default radius of each landmark in mm.
+        value (int): Default value written for each landmark.
+        offset (tuple[int]): Position of a cropped volume in the anatomy grid (z,y,x order).
+
+    Returns:
+        np.ndarray: uint8 volume in z,y,x order.
+    """
+    volume = np.zeros(dims[::-1], dtype=np.uint8)  # Create volume in z,y,x order
+    stencils = {}
+
+    for lm in landmarks:
+        radius = lm.get('radius_mm', radius_mm)
+        if radius not in stencils:
+            stencils[radius] = build_sphere_stencil(spacing, radius)
+
+        center = tuple(c - o for c, o in zip(landmark_center(lm), offset))
+        stamp_stencil(volume, stencils[radius], center, lm.get('value', value))
+
+    return volume
+
+
 def convert_landmarks_to_volume_binary(
     landmarks,
     dims,
@@ -107,10 +287,19 @@ def convert_landmarks_to_volume_binary(
     meta_out,
     radius_mm=3,
     generate_preview=True,
-    preview_scale=0.25
+    preview_scale=0.25,
+    pyramid_levels=4,
+    compress=True
 ):
     """
     Renders landmarks as binary spheres in a 3D numpy volume based on the anatomy dimensions
+    -> for speed: one sphere stencil per radius, stamped with numpy slicing
+    -> also writes precompressed variants of the binaries, the volume is mostly zeros
+    -> and a run-length encoded mask (.rle) of full resolution and preview, see mask_utils
+    -> the preview is also written as container (.vol, geometry + data + crop in one file)
+    -> for speed: only the (aligned) box around the spheres is rasterized and written, its
+       position is 'offset' [x, y, z] in the metadata ('reference_dims' is the anatomy grid);
+       masks, containers and pyramid carry the origin of the box
 
     note: when downsampling is used for the anatomy, also required to be used here
 
@@ -121,53 +310,65 @@ def convert_landmarks_to_volume_binary(
         origin (list[float]): Origin of the volume.
         bin_out (str): Output path for binary volume (.bin).
         meta_out (str): Output path for metadata (.json).
-        radius_mm (int): Radius of each landmark in mm.
+        radius_mm (int): Default radius of each landmark in mm (per landmark: 'radius_mm').
         generate_preview (bool): Whether to generate a downscaled preview volume.
         preview_scale (float): Downscaling factor for preview.
+        pyramid_levels (int): Number of pyramid levels including full resolution.
+        compress (bool): Also write precompressed variants of the binaries.
     """
-    volume = np.zeros(dims[::-1], dtype=np.uint8)  # Create volume in z,y,x order
-
-    # Calculate radius in voxel units
-    radii_vox = {
-        'x': int(round(radius_mm / spacing[0])),
-        'y': int(round(radius_mm / spacing[1])),
-        'z': int(round(radius_mm / spacing[2]))
-    }
+    align = 2 ** (pyramid_levels - 1)
+    if generate_preview:
+        align = math.lcm(align, round(1 / preview_scale))
+    offset, shape = aligned_crop(landmarks_bbox(landmarks, dims[::-1], spacing, radius_mm), dims[::-1], align)
+    box_origin = crop_origin(origin, spacing, offset)
 
-    # Draw each landmark as a sphere in the volume
-    for lm in landmarks:
-        v = lm['voxel']
-        i = int(round(v['i']))
-        j = int(round(v['j']))
-        k = int(round(v['k']))
-
-        for dz in range(-radii_vox['z'], radii_vox['z'] + 1):
-            for dy in range(-radii_vox['y'], radii_vox['y'] + 1):
-                for dx in range(-radii_vox['x'], radii_vox['x'] + 1):
-                    # Convert offsets to mm
-                    dx_mm = dx * spacing[0]
-                    dy_mm = dy * spacing[1]
-                    dz_mm = dz * spacing[2]
-
-                    if dx_mm**2 + dy_mm**2 + dz_mm**2 <= radius_mm**2:
-                        zi, yi, xi = k + dz, j + dy, i + dx
-                        if 0 <= zi < volume.shape[0] and 0 <= yi < volume.shape[1] and 0 <= xi < volume.shape[2]:
-                            volume[zi, yi, xi] = 255
+    with stage('rasterize'):
+        volume = rasterize_landmarks(landmarks, shape[::-1], spacing, radius_mm=radius_mm, offset=offset)
 
     # Save volume to binary
-    volume.tofile(bin_out)
+    with stage('write binary', volume.nbytes):
+        volume.tofile(bin_out)
 
     # Write metadata
     with open(meta_out, 'w', encoding='utf-8') as f:
-        json.dump({'spacing': spacing, 'dims': dims[::-1], 'origin': origin}, f)
+        json.dump({
+            'spacing': spacing,
+            'dims': volume.shape[::-1],
+            'origin': origin,
+            'offset': offset[::-1],
+            'reference_dims': list(dims),
+        }, f)
+
+    # Resolution pyramid and bricks, same levels as the anatomy
+    with stage('write pyramid'):
+        levels = build_volume_pyramid(volume, num_levels=pyramid_levels, labels=True)
+        write_volume_pyramid(levels, spacing, box_origin, bin_out, offset=offset[::-1])
+        write_volume_bricks(levels, bin_out, origin=box_origin, offset=offset[::-1], reference_dims=dims)
+    with stage('mask'):
+        write_mask(volume, bin_out, spacing, box_origin, offset[::-1], dims)
 
     # Optional: generate preview
     if generate_preview:
-        preview = zoom(volume, zoom=preview_scale, order=0)
         preview_spacing = [s / preview_scale for s in spacing]
         preview_bin = bin_out.replace('.bin', '_preview.bin')
         preview_meta = meta_out.replace('.json', '_preview.json')
 
-        preview.tofile(preview_bin)
+        with stage('preview'):
+            preview = pyramid_preview(levels, preview_scale, labels=True)
+            preview.tofile(preview_bin)
+            factor = round(1 / preview_scale)
+            preview_crop = {
+                'offset': [o // factor for o in offset[::-1]],
+                'reference_dims': [-(-d // factor) for d in dims],
+            }
+            write_mask(preview, preview_bin, preview_spacing, box_origin, **preview_crop)
+            write_container(preview, preview_spacing, box_origin, container_path(preview_bin), meta=preview_crop)
         with open(preview_meta, 'w', encoding='utf-8') as f:
-            json.dump({'spacing': preview_spacing, 'dims': preview.shape[::-1], 'origin': origin}, f)
+            json.dump({'spacing': preview_spacing, 'dims': preview.shape[::-1], 'origin': origin, **preview_crop}, f)
+
+    if compress:
+        outputs = [level_path(bin_out, n) for n in range(len(levels))]
+        if generate_preview:
+            outputs += [preview_bin, container_path(preview_bin)]
+        with stage('compress'):
+            compress_binaries(outputs)
@@ -0,0 +1,179 @@
+import os
+import json
+import numpy as np
+
+# Rows (first axis) processed at once while encoding, bounds the temporary memory
+ENCODE_CHUNK_ROWS = 16
+
+
+def mask_path(bin_path):
+    """
+    Returns the path of the run-length encoded mask that belongs to a .bin file.
+    """
+    return bin_path.replace('.bin', '.rle')
+
+
+def mask_index_path(bin_path):
+    """
+    Returns the path of the index JSON of the run-length encoded mask.
+    """
+    return bin_path.replace('.bin', '.rle.json')
+
+
+def mask_bbox(volume, chunk_rows=ENCODE_CHUNK_ROWS):
+    """
+    Computes the bounding box of the nonzero voxels, chunk by chunk along the first axis
+    (works on memory-mapped volumes without loading them).
+
+    Returns:
+        tuple: (start, stop) per axis in numpy order, None for an empty mask.
+    """
+    hit = [np.zeros(n, dtype=bool) for n in volume.shape]
+    for x in range(0, volume.shape[0], chunk_rows):
+        nonzero = np.asarray(volume[x:x + chunk_rows]) != 0
+        hit[0][x:x + chunk_rows] |= nonzero.any(axis=(1, 2))
+        hit[1] |= nonzero.any(axis=(0, 2))
+        hit[2] |= nonzero.any(axis=(0, 1))
+
+    if not hit[0].any():
+        return None
+    return tuple((int(np.argmax(h)), int(len(h) - np.argmax(h[::-1]))) for h in hit)
+
+
+def encode_runs(flat):
+    """
+    Run-length encodes a flat uint8 array, only runs of nonzero values are kept.
+
+    Returns:
+        tuple: (starts uint32, lengths uint32, values uint8).
+    """
+    if flat.size == 0:
+        return np.zeros(0, np.uint32), np.zeros(0, np.uint32), np.zeros(0, np.uint8)
+
+    bounds = np.concatenate(([0], np.flatnonzero(flat[1:] != flat[:-1]) + 1, [flat.size]))
+    starts = bounds[:-1]
+    lengths = np.diff(bounds)
+    values = flat[starts]
+    keep = values != 0
+    return starts[keep].astype(np.uint32), lengths[keep].astype(np.uint32), values[keep].astype(np.uint8)
+
+
+def encode_mask(volume, chunk_rows=ENCODE_CHUNK_ROWS):
+    """
+    Encodes a (mostly empty) label volume as runs inside its bounding box.
+    -> for speed: vectorized with numpy, runs are found from the changes between neighbouring voxels
+    -> the box is encoded in chunks along the first axis, runs may be split at chunk borders
+
+    Runs are flat offsets in C order within the box, so decoding the box and
+    placing it at its start gives back the dense volume.
+
+    Args:
+        volume (np.ndarray): uint8 labels in numpy order (x, y, z), may be a memmap.
+        chunk_rows (int): Rows of the first axis encoded at once.
+
+    Returns:
+        tuple: (index dict, starts, lengths, values).
+    """
+    bbox = mask_bbox(volume, chunk_rows)
+    if bbox is None:
+        box_start, box_shape = [0, 0, 0], [0, 0, 0]
+        runs = encode_runs(np.zeros(0, np.uint8))
+    else:
+        box_start = [start for start, _ in bbox]
+        box_shape = [stop - start for start, stop in bbox]
+        (x0, x1), (y0, y1), (z0, z1) = bbox
+        row_size = box_shape[1] * box_shape[2]
+
+        parts = []
+        for x in range(x0, x1, chunk_rows):
+            chunk = np.ascontiguousarray(volume[x:min(x + chunk_rows, x1), y0:y1, z0:z1])
+            starts, lengths, values = encode_runs(chunk.ravel())
+            parts.append((starts + np.uint32((x - x0) * row_size), lengths, values))
+        runs = tuple(np.concatenate(p) for p in zip(*parts))
+
+    index = {
+        'dims': list(volume.shape[::-1]),
+        'bbox': {'start': box_start[::-1], 'dims': box_shape[::-1]},
+        'runs': int(len(runs[0])),
+        'dtype': 'uint8',
+    }
+    return (index,) + runs
+
+
+def decode_mask(index, starts, lengths, values, crop=False):
+    """
+    Decodes runs back to a dense volume (numpy order).
+    -> for speed: vectorized, all run positions are generated at once with np.repeat
+
+    Args:
+        index (dict): Index as written by encode_mask.
+        starts, lengths, values (np.ndarray): Runs as written by encode_mask.
+        crop (bool): Return only the bounding box instead of the full volume.
+
+    Returns:
+        np.ndarray: uint8 volume.
+    """
+    box_shape = tuple(index['bbox']['dims'][::-1])
+    box = np.zeros(int(np.prod(box_shape)), dtype=np.uint8)
+    if len(starts):
+        lengths = lengths.astype(np.int64)
+        run_offsets = np.cumsum(lengths) - lengths
+        positions = np.arange(lengths.sum()) - np.repeat(run_offsets - starts.astype(np.int64), lengths)
+        box[positions] = np.repeat(values, lengths)
+    box = box.reshape(box_shape)
+    if crop:
+        return box
+
+    volume = np.zeros(tuple(index['dims'][::-1]), dtype=np.uint8)
+    x0, y0, z0 = index['bbox']['start'][::-1]
+    volume[x0:x0 + box_shape[0], y0:y0 + box_shape[1], z0:z0 + box_shape[2]] = box
+    return volume
+
+
+def write_mask(volume, bin_path, spacing=None, origin=None, offset=None, reference_dims=None):
+    """
+    Writes the run-length encoded mask of a label volume next to its .bin file.
+
+    The .rle file holds starts (uint32), lengths (uint32) and values (uint8) of all runs
+    after each other; the .rle.json index holds dims, bounding box and number of runs
+    (and spacing/origin when given, so the mask alone is enough to place it).
+    For a cropped overlay offset and reference_dims [x, y, z] give its position in the anatomy grid.
+
+    Returns:
+        dict: The index.
+    """
+    index, starts, lengths, values = encode_mask(volume)
+    if spacing is not None:
+        index['spacing'] = list(spacing)
+    if origin is not None:
+        index['origin'] = list(origin)
+    if offset is not None:
+        index['offset'] = list(offset)
+        index['reference_dims'] = list(reference_dims)
+    with open(mask_path(bin_path), 'wb') as f:
+        f.write(starts.tobytes())
+        f.write(lengths.tobytes())
+        f.write(values.tobytes())
+    with open(mask_index_path(bin_path), 'w', encoding='utf-8') as f:
+        json.dump(index, f)
+    return index
+
+
+def read_mask(bin_path):
+    """
+    Reads the run-length encoded mask of a .bin file.
+
+    Returns:
+        tuple: (index dict, starts, lengths, values).
+    """
+    if not os.path.exists(mask_index_path(bin_path)):
+        raise ValueError("Mask not found")
+    with open(mask_index_path(bin_path), encoding='utf-8') as f:
+        index = json.load(f)
+
+    n = index['runs']
+    data = np.fromfile(mask_path(bin_path), dtype=np.uint8)
+    starts = data[:4 * n].view(np.uint32)
+    lengths = data[4 * n:8 * n].view(np.uint32)
+    values = data[8 * n:9 * n]
+    return index, starts, lengths, values
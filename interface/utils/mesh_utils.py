@@ -0,0 +1,226 @@
+import os
+import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# scikit-image is optional, without it the surfaces are built from the voxel faces (blocky, same topology)
+try:
+    from skimage.measure import marching_cubes
+except ImportError:
+    marching_cubes = None
+
+from .compress_utils import compress_binaries
+from .cache_utils import remove_conversion_outputs, restore_from_cache, store_in_cache
+from .timing_utils import stage
+
+# Mesh (.mesh): per label float32 vertices (x, y, z world mm) followed by uint32 triangles
+# (3 vertex indices), labels after each other. The .mesh.json index lists per label
+# its counts and byte offsets, like the .rle/.rle.json masks.
+MESH_VERSION = 1
+# Triangles of all labels together after decimation, split over the labels by their surface size
+MESH_TRIANGLE_BUDGET = 300000
+MIN_LABEL_TRIANGLES = 500
+# Cell growth per decimation round when the budget is not met yet
+CLUSTER_GROWTH = 1.25
+HASH_BUFFER = 1024 ** 2
+
+
+def mesh_index_path(mesh_path):
+    """
+    Returns the path of the index JSON that belongs to a .mesh file.
+    """
+    return mesh_path + '.json'
+
+
+def segmentation_hash(bin_path, meta, triangle_budget):
+    """
+    Hash of everything a mesh depends on: the label voxels, the geometry, the budget and the format.
+    """
+    digest = hashlib.sha256()
+    with open(bin_path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BUFFER), b''):
+            digest.update(block)
+    geometry = {k: meta.get(k) for k in ('dims', 'spacing', 'origin', 'offset')}
+    digest.update(json.dumps([geometry, triangle_budget, MESH_VERSION, marching_cubes is not None]).encode())
+    return digest.hexdigest()
+
+
+def voxel_surface(mask):
+    """
+    Surface of a binary mask from the faces between inside and outside voxels
+    (fallback without scikit-image), vectorized over all faces.
+
+    Returns:
+        tuple: (vertices float32 (n, 3) in voxel coordinates, triangles int64 (m, 3)).
+    """
+    mask = np.pad(mask.astype(bool), 1)
+    corner_shape = np.array(mask.shape) + 1
+    quads = []
+    for axis in range(3):
+        u, v = [a for a in range(3) if a != axis]
+        inside = np.moveaxis(mask, axis, 0)
+        change = inside[1:].astype(np.int8) - inside[:-1]   # +1 outside -> inside, -1 inside -> outside
+        for sign in (1, -1):
+            faces = np.argwhere(np.moveaxis(change, 0, axis) == sign)
+            faces[:, axis] += 1   # face between voxel i and i+1 lies on corner plane i+1
+            corners = np.repeat(faces[:, None, :], 4, axis=1)
+            corners[:, 1, u] += 1
+            corners[:, 2, u] += 1
+            corners[:, 2, v] += 1
+            corners[:, 3, v] += 1
+            # outward normal: along -axis where the inside starts, along +axis where it ends
+            quads.append(corners[:, ::-1] if (sign == 1) == ((v - u) % 3 == 1) else corners)
+
+    corners = np.concatenate(quads) if quads else np.zeros((0, 4, 3), np.int64)
+    ids = np.ravel_multi_index(corners.reshape(-1, 3).T, corner_shape)
+    unique, inverse = np.unique(ids, return_inverse=True)
+    quads = inverse.reshape(-1, 4)
+    triangles = np.concatenate([quads[:, [0, 1, 2]], quads[:, [0, 2, 3]]])
+    # corner c lies half a voxel before voxel center c, minus the padding
+    vertices = np.stack(np.unravel_index(unique, corner_shape), axis=1).astype(np.float32) - 1.5
+    return vertices, triangles
+
+
+def extract_surface(mask):
+    """
+    Surface of a binary mask in voxel coordinates (numpy order): marching cubes at 0.5
+    when scikit-image is installed, the voxel faces otherwise.
+    """
+    if marching_cubes is None:
+        return voxel_surface(mask)
+    padded = np.pad(mask.astype(np.uint8), 1)
+    vertices, triangles, _, _ = marching_cubes(padded, level=0.5, allow_degenerate=False)
+    # scikit-image winds the triangles inwards, reversed to match voxel_surface (outward normals)
+    return (vertices - 1).astype(np.float32), triangles[:, ::-1].astype(np.int64)
+
+
+def decimate(vertices, triangles, max_triangles):
+    """
+    Reduces a mesh to at most max_triangles by vertex clustering: vertices in the same
+    grid cell are merged into their mean, collapsed and duplicate triangles are dropped.
+    -> for speed: every round is a few vectorized numpy passes, the cell size
+       starts from the ratio of the triangle counts and grows until the budget is met
+    """
+    if len(triangles) <= max_triangles:
+        return vertices, triangles
+
+    low = vertices.min(axis=0)
+    edges = np.linalg.norm(vertices[triangles[:, 0]] - vertices[triangles[:, 1]], axis=1)
+    cell = float(edges.mean()) * np.sqrt(len(triangles) / max_triangles)
+    while True:
+        cells = np.floor((vertices - low) / cell).astype(np.int64)
+        _, cluster = np.unique(cells, axis=0, return_inverse=True)
+        cluster = cluster.ravel()
+        count = np.bincount(cluster)
+        merged = np.stack([np.bincount(cluster, weights=vertices[:, a]) / count for a in range(3)], axis=1)
+
+        faces = cluster[triangles]
+        faces = faces[(faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2]) & (faces[:, 0] != faces[:, 2])]
+        # same triangle from both sides of a thin part, or twice after merging
+        _, first = np.unique(np.sort(faces, axis=1), axis=0, return_index=True)
+        faces = faces[np.sort(first)]
+        if len(faces) <= max_triangles:
+            break
+        cell *= CLUSTER_GROWTH
+
+    used, faces = np.unique(faces, return_inverse=True)
+    return merged[used].astype(np.float32), faces.reshape(-1, 3)
+
+
+def label_surface(volume, label, entry, offset=(0, 0, 0)):
+    """
+    Surface of one label, extracted only inside its bounding box (from the label index).
+    offset is the position of a cropped volume in the reference grid (numpy order).
+
+    Returns:
+        tuple: (vertices in voxel coordinates of the reference grid (numpy order), triangles).
+    """
+    start = entry['bbox']['start'][::-1]
+    lo = [s - o for s, o in zip(start, offset)]
+    hi = [s + d for s, d in zip(lo, entry['bbox']['dims'][::-1])]
+    box = np.asarray(volume[lo[0]:hi[0], lo[1]:hi[1], lo[2]:hi[2]])
+    vertices, triangles = extract_surface(box == label)
+    return vertices + np.float32(start), triangles
+
+
+def build_segmentation_meshes(bin_path, meta_path, mesh_out, cache_dir=None, cache_max_bytes=None,
+                              triangle_budget=MESH_TRIANGLE_BUDGET, workers=None, compress=True):
+    """
+    Builds a surface mesh per label of a full resolution segmentation.
+    -> the surfaces come from the full resolution labels, each label only inside its bounding box
+    -> decimated together to triangle_budget (split by surface size, vertex clustering)
+    -> for speed: labels are meshed in parallel by a thread pool (the numpy passes release the GIL),
+       meshes are cached by the hash of the segmentation, a known segmentation is restored instead
+
+    Args:
+        bin_path (str): Full resolution segmentation (segmentation_result.bin).
+        meta_path (str): Its metadata with the label index.
+        mesh_out (str): Output mesh (.mesh), the index is written next to it (.mesh.json).
+        cache_dir (str): Mesh cache folder, None disables the cache.
+        cache_max_bytes (int): Size bound of the cache (needed with cache_dir).
+        triangle_budget (int): Triangles of all labels together.
+        workers (int): Threads, default cpu count.
+        compress (bool): Also write precompressed variants of the mesh.
+
+    Returns:
+        dict: The mesh index.
+    """
+    with open(meta_path, encoding='utf-8') as f:
+        meta = json.load(f)
+    if 'labels' not in meta:
+        raise ValueError("Segmentation has no label index, convert it again")
+
+    workspace = os.path.dirname(mesh_out)
+    prefix = os.path.basename(mesh_out).split('.')[0]
+    with stage('hash', os.path.getsize(bin_path)):
+        key = 'mesh-' + segmentation_hash(bin_path, meta, triangle_budget)
+    if cache_dir and restore_from_cache(cache_dir, key, workspace) is not None:
+        with open(mesh_index_path(mesh_out), encoding='utf-8') as f:
+            return json.load(f)
+
+    if cache_dir:
+        remove_conversion_outputs(workspace, prefix)
+    volume = np.memmap(bin_path, dtype=np.uint8, mode='r', shape=tuple(meta['dims'][::-1]))
+    offset = tuple(meta.get('offset', [0, 0, 0])[::-1])   # cropped segmentation
+    labels = sorted(meta['labels'], key=int)
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        with stage('marching cubes', volume.size):
+            surfaces = list(pool.map(lambda label: label_surface(volume, int(label), meta['labels'][label], offset),
+                                     labels))
+
+        total = sum(len(t) for _, t in surfaces) or 1
+        budgets = [max(MIN_LABEL_TRIANGLES, triangle_budget * len(t) // total) for _, t in surfaces]
+        with stage('decimate'):
+            surfaces = list(pool.map(lambda args: decimate(*args), [(v, t, b) for (v, t), b in zip(surfaces, budgets)]))
+
+    # voxel coordinates of the reference grid (numpy order) -> world, in the axis order of the metadata
+    spacing = np.asarray(meta['spacing'], dtype=np.float64)
+    origin = np.asarray(meta['origin'], dtype=np.float64)
+    index = {'version': MESH_VERSION, 'segmentation': key[len('mesh-'):], 'labels': []}
+    byte_offset = 0
+    with stage('write mesh'), open(mesh_out, 'wb') as f:
+        for label, (vertices, triangles) in zip(labels, surfaces):
+            world = (vertices[:, ::-1] * spacing + origin).astype(np.float32)
+            # reversing the axes mirrors the mesh, swap two corners to keep the winding
+            faces = triangles[:, [0, 2, 1]].astype(np.uint32)
+            f.write(world.tobytes())
+            f.write(faces.tobytes())
+            index['labels'].append({
+                'label': int(label),
+                'vertices': int(len(world)),
+                'triangles': int(len(faces)),
+                'offset': byte_offset,
+            })
+            byte_offset += world.nbytes + faces.nbytes
+    index['bytes'] = byte_offset
+    with open(mesh_index_path(mesh_out), 'w', encoding='utf-8') as f:
+        json.dump(index, f)
+
+    if compress:
+        with stage('compress'):
+            compress_binaries([mesh_out])
+    if cache_dir:
+        store_in_cache(cache_dir, key, workspace, prefix, cache_max_bytes)
+    return index
@@ -2,10 +2,24 @@ import os
 import json
 import numpy as np
 import nibabel as nib
-from scipy.ndimage import zoom
 
+from .volume_utils import (
+    slab_depth,
+    allocate_pyramid,
+    write_slab_to_pyramid,
+    write_volume_pyramid,
+    write_volume_bricks,
+    pyramid_preview,
+    pyramid_manifest_path
+)
+from .compress_utils import compress_binaries
+from .container_utils import write_container, container_path
+from .window_utils import native_path, native_dtype, to_native
+from .stats_utils import StreamingStats
+from .timing_utils import stage
 
-def write_volume_to_binary(volume, spacing, origin, bin_path, meta_path, is_base=False):
+
+def write_volume_to_binary(volume, spacing, origin, bin_path, meta_path, is_base=False, stats=None):
     """
     Writes the NIFTI (transformed from DICOM (dNIFTI) or the original NIFTI) 
     to a binary file and seperate metadata.
@@ -17,57 +31,213 @@ def write_volume_to_binary(volume, spacing, origin, bin_path, meta_path, is_base
         bin_path (str): Path to save the .bin file.
         meta_path (str): Path to save the .json metadata.
         is_base (bool): Prevent overwrite of meta file if already exists.
+        stats (dict): Optional intensity statistics, see write_volume_meta.
     """
     os.makedirs(os.path.dirname(bin_path), exist_ok=True)
 
     with open(bin_path, 'wb') as f:
         f.write(volume.tobytes(order='C'))
 
-    dims = volume.shape
+    write_volume_meta(volume.shape, spacing, origin, meta_path, is_base=is_base, stats=stats)
+
 
+def write_volume_meta(shape, spacing, origin, meta_path, is_base=False, stats=None):
+    """
+    Writes the metadata of a binary volume (dims in x, y, z order).
+
+    Args:
+        shape (tuple): Shape of the numpy volume.
+        spacing (list): Voxel spacing [x, y, z].
+        origin (list): World origin [x, y, z].
+        meta_path (str): Path to save the .json metadata.
+        is_base (bool): Prevent overwrite of meta file if already exists.
+        stats (dict): Optional intensity statistics (histogram, min/max, percentiles).
+    """
     if is_base and os.path.exists(meta_path):
         print(f"[INFO] {meta_path} already exists, skipping overwrite.")
         return
 
+    meta = {'spacing': spacing, 'dims': shape[::-1], 'origin': origin}
+    if stats is not None:
+        meta['stats'] = stats
     with open(meta_path, 'w') as f:
-        json.dump({'spacing': spacing, 'dims': dims[::-1], 'origin': origin}, f)
+        json.dump(meta, f)
 
 
-def convert_nifti_to_binary(nifti_path, bin_out, meta_out, preview_scale=0.25, contrast_factor=0.3, generate_preview=True):
+def write_base_meta_from_pyramid(bin_path, meta_path, preview_scale=0.25):
+    """
+    Writes the (base) metadata of an already converted volume from its pyramid manifest,
+    e.g. after its outputs are restored from the conversion cache.
+
+    Args:
+        bin_path (str): Path of the full resolution .bin file.
+        meta_path (str): Path of the base metadata .json file.
+        preview_scale (float): Scale of the preview, its metadata is written as well.
+    """
+    with open(pyramid_manifest_path(bin_path), encoding='utf-8') as f:
+        manifest = json.load(f)
+
+    for level in manifest['levels']:
+        shape = tuple(level['dims'][::-1])
+        if level['level'] == 0:
+            write_volume_meta(shape, level['spacing'], manifest['origin'], meta_path, is_base=True)
+        if level['scale'] == preview_scale:
+            preview_meta = meta_path.replace('.json', '_preview.json')
+            write_volume_meta(shape, level['spacing'], manifest['origin'], preview_meta)
+
+
+def convert_nifti_to_binary(
+    nifti_path,
+    bin_out,
+    meta_out,
+    preview_scale=0.25,
+    contrast_factor=0.3,
+    generate_preview=True,
+    pyramid_levels=4,
+    streaming=True,
+    memory_budget_mb=256,
+    compress=True,
+    native=True
+):
     """
     Converts a NIfTI file to binary format with optional downscaled preview.
-    -> for speed: using lazy loading
-    -> for speed: converts in batches of 20 slices 
+    -> for speed: using lazy loading, see convert_image_to_binary
+
+    Args:
+        nifti_path (str): Path to the input NIfTI file.
+        bin_out (str): Output path for .bin file.
+        meta_out (str): Output path for metadata .json file.
+        preview_scale (float): Scaling factor for preview.
+        contrast_factor (float): Multiplier for intensity normalization.
+        generate_preview (bool): Whether to generate a preview version.
+        pyramid_levels (int): Number of pyramid levels including full resolution.
+        streaming (bool): Write slabs to memory-mapped files instead of memory.
+        memory_budget_mb (float): Approximate memory used per slab.
+        compress (bool): Also write precompressed variants of the preview and containers.
+        native (bool): Also keep the intensities in native precision, see convert_image_to_binary.
+    """
+    convert_image_to_binary(
+        nib.load(nifti_path), bin_out, meta_out,
+        preview_scale=preview_scale,
+        contrast_factor=contrast_factor,
+        generate_preview=generate_preview,
+        pyramid_levels=pyramid_levels,
+        streaming=streaming,
+        memory_budget_mb=memory_budget_mb,
+        compress=compress,
+        native=native
+    )
+
+
+def convert_image_to_binary(
+    img,
+    bin_out,
+    meta_out,
+    preview_scale=0.25,
+    contrast_factor=0.3,
+    generate_preview=True,
+    pyramid_levels=4,
+    streaming=True,
+    memory_budget_mb=256,
+    compress=True,
+    native=True
+):
+    """
+    Converts a NIfTI image (loaded from file or built in memory) to binary format
+    with optional downscaled preview.
+    -> for speed: reads img.dataobj, lazy for images loaded from file
+    -> for speed: converts in slabs of slices, sized by memory_budget_mb
 
     Because the frontend viewer cannot handle full resolution (>250MB) 
     -> downsample to 0.25 (preview_scale)
     -> can be turned off with generate_preview=False
+    -> also writes a resolution pyramid (1, 1/2, 1/4, 1/8) with a manifest (.pyramid.json)
+    -> and every level split in 64^3 bricks with an index (.bricks.json)
+    -> and gzip (zstd/brotli) variants of the preview and the containers, see compress_utils
+    -> the preview is also written as container (.vol, geometry + data in one file), and the
+       coarsest pyramid level below the preview (_coarse.vol) the viewer shows while the preview loads
+
+    The uint8 binaries have contrast_factor baked in. With native=True the intensities
+    are also kept as int16 (float32 for non-integer data) in <name>_native.bin with its
+    own pyramid, so other windows can be rendered on demand (see window_utils)
+    without converting again.
+
+    Intensity statistics (min/max, mean/std, histogram, approximate percentiles
+    and an auto window) are accumulated from the same slabs and stored in the
+    metadata and the pyramid manifest (see stats_utils).
+
+    With streaming=True every slab is written directly into memory-mapped
+    output files (full resolution and pyramid levels), so the volume is never
+    held in memory as a whole. The pyramid levels, and with that the preview,
+    are downsampled from the same slabs.
 
     Args:
-        nifti_path (str): Path to the input NIfTI file.
+        img (nib.Nifti1Image): Input image.
         bin_out (str): Output path for .bin file.
         meta_out (str): Output path for metadata .json file.
         preview_scale (float): Scaling factor for preview.
         contrast_factor (float): Multiplier for intensity normalization.
         generate_preview (bool): Whether to generate a preview version.
+        pyramid_levels (int): Number of pyramid levels including full resolution.
+        streaming (bool): Write slabs to memory-mapped files instead of memory.
+        memory_budget_mb (float): Approximate memory used per slab.
+        compress (bool): Also write precompressed variants of the preview and containers.
+        native (bool): Also write the native precision store and its pyramid.
     """
-    img = nib.load(nifti_path)
-    data = img.dataobj         
+    data = img.dataobj
     spacing = [float(img.header.get_zooms()[2]), float(img.header.get_zooms()[1]), float(img.header.get_zooms()[0])]
-    origin = img.affine[:3, 3].tolist()
+    origin = img.header.get_best_affine()[:3, 3].tolist()   # as stored in the header, also for in-memory images
 
-    volume = np.zeros(img.shape, dtype=np.uint8)
-    for z in range(0, img.shape[2], 20):
-        slice_data = data[:, :, z:z + 20]
-        slice_data = np.clip(slice_data * contrast_factor, 0, 255).astype(np.uint8) #contrast / windowrendering
-        volume[:, :, z:z + slice_data.shape[2]] = slice_data
+    levels = allocate_pyramid(bin_out, img.shape[:3], pyramid_levels, streaming=streaming)
+    native_levels = []
+    if native:
+        native_levels = allocate_pyramid(native_path(bin_out), img.shape[:3], pyramid_levels,
+                                         streaming=streaming, dtype=native_dtype(data))
 
-    write_volume_to_binary(volume, spacing, origin, bin_out, meta_out, is_base=True)
+    # pyramid levels are written from the same slabs
+    depth = slab_depth(img.shape[:2], memory_budget_mb, align=2 ** (len(levels) - 1),
+                       bytes_per_voxel=24 if native else 16)
+    with stage('slab loop', int(np.prod(img.shape[:3])) * data.dtype.itemsize):
+        stats = StreamingStats()
+        for z in range(0, img.shape[2], depth):
+            slice_data = data[:, :, z:z + depth]
+            stats.update(slice_data)
+            if native:
+                write_slab_to_pyramid(native_levels, to_native(slice_data, native_levels[0].dtype), z)
+            slice_data = np.clip(slice_data * contrast_factor, 0, 255).astype(np.uint8) #contrast / windowrendering
+            write_slab_to_pyramid(levels, slice_data, z)
+
+    with stage('write pyramid'):
+        if streaming:
+            for level in levels + native_levels:
+                level.flush()
+            write_volume_meta(levels[0].shape, spacing, origin, meta_out, is_base=True, stats=stats.result())
+        else:
+            write_volume_to_binary(levels[0], spacing, origin, bin_out, meta_out, is_base=True, stats=stats.result())
+            if native:
+                native_levels[0].tofile(native_path(bin_out))
+
+        write_volume_pyramid(levels, spacing, origin, bin_out, write_levels=not streaming, stats=stats.result())
+        if native:
+            write_volume_pyramid(native_levels, spacing, origin, native_path(bin_out), write_levels=not streaming,
+                                 stats=stats.result())
+        write_volume_bricks(levels, bin_out, origin=origin)
 
     if generate_preview:
-        preview = zoom(volume, zoom=preview_scale)
         preview_spacing = [s / preview_scale for s in spacing]
-
         preview_bin = bin_out.replace('.bin', '_preview.bin')
         preview_meta = meta_out.replace('.json', '_preview.json')
-        write_volume_to_binary(preview, preview_spacing, origin, preview_bin, preview_meta)
+        with stage('preview'):
+            preview = pyramid_preview(levels, preview_scale)
+            write_volume_to_binary(preview, preview_spacing, origin, preview_bin, preview_meta)
+            write_container(preview, preview_spacing, origin, container_path(preview_bin))
+            coarse_scale = 0.5 ** (len(levels) - 1)
+            coarse_vol = bin_out.replace('.bin', '_coarse.vol')
+            if coarse_scale < preview_scale:
+                write_container(levels[-1], [s / coarse_scale for s in spacing], origin, coarse_vol)
+
+    # only what is served as a whole file is precompressed, the full resolution and the
+    # pyramid levels are served in bricks and windows
+    if compress and generate_preview:
+        with stage('compress'):
+            compress_binaries([preview_bin, container_path(preview_bin), coarse_vol])
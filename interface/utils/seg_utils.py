@@ -1,17 +1,95 @@
 import os
+import math
 import json
 import numpy as np
 import nibabel as nib
-from scipy.ndimage import zoom
 
+from .volume_utils import (
+    slab_depth,
+    allocate_pyramid,
+    write_slab_to_pyramid,
+    write_volume_pyramid,
+    write_volume_bricks,
+    pyramid_preview,
+    slab_preview,
+    aligned_crop,
+    crop_origin,
+    level_path
+)
+from .compress_utils import compress_binaries
+from .mask_utils import write_mask
+from .container_utils import write_container, container_path
+from .timing_utils import stage
+from .label_utils import to_labels, LabelIndex
 
-def convert_segnifti_to_binary(nifti_path, bin_out, meta_out, reference_meta_path, generate_preview=True, preview_scale=0.25):
+
+def nearest_indices(in_size, out_size):
+    """
+    Returns for every output voxel along an axis the nearest input voxel index.
+
+    Uses the same corner-aligned mapping as scipy.ndimage.zoom with order=0
+    (output 0 -> input 0, last output -> last input).
+
+    Args:
+        in_size (int): Number of voxels of the source axis.
+        out_size (int): Number of voxels of the output axis.
+
+    Returns:
+        np.ndarray: Integer index array of length out_size.
+    """
+    if out_size == 1 or in_size == 1:
+        return np.zeros(out_size, dtype=np.intp)
+    scale = (in_size - 1) / (out_size - 1)
+    indices = np.floor(np.arange(out_size) * scale + 0.5).astype(np.intp)
+    return np.minimum(indices, in_size - 1)
+
+
+def source_bbox(data, depth):
+    """
+    Bounding box of the nonzero labels of a NIfTI image, read slab by slab along the
+    last axis (the slow axis on disk) in the stored dtype.
+
+    Returns:
+        tuple: (start, stop) per axis in numpy order, None for an empty segmentation.
+    """
+    shape = data.shape[:3]
+    hit = [np.zeros(n, dtype=bool) for n in shape]
+    for z in range(0, shape[2], depth):
+        nonzero = np.asarray(data[:, :, z:z + depth]) != 0
+        hit[0] |= nonzero.any(axis=(1, 2))
+        hit[1] |= nonzero.any(axis=(0, 2))
+        hit[2][z:z + depth] |= nonzero.any(axis=(0, 1))
+
+    if not hit[0].any():
+        return None
+    return tuple((int(np.argmax(h)), int(len(h) - np.argmax(h[::-1]))) for h in hit)
+
+
+def convert_segnifti_to_binary(nifti_path, bin_out, meta_out, reference_meta_path, generate_preview=True, preview_scale=0.25, pyramid_levels=4, streaming=True, memory_budget_mb=256, compress=True, full_resolution=True):
     """
     Writes the segmentation NIfTI file to a binary and seperate metadata. 
     metadata is influenced bij the anatomy's metadata (base.meta) if available.
 
-    binary mask of segmentation (0, 1) is converted to 0, 255 values.
+    label values are kept (uint8, 0 is background), so one file can hold several structures
+    (e.g. maxilla, mandible, teeth, nerves).
     note: when downsampling is aplied for the anatomy NIFTI, also use it for the segmentation
+    -> writes the same resolution pyramid and bricks as the anatomy (label pooling, thin structures are kept)
+    -> and precompressed variants of the binaries, the mask is mostly zeros
+    -> and a run-length encoded mask (.rle) of full resolution and preview, see mask_utils
+    -> the preview is also written as container (.vol, geometry + data + crop and label index in one file)
+    -> for speed: reads the labels in their stored dtype, in slabs of slices,
+       and resamples with precomputed nearest neighbour indices
+    -> every output grid is computed from the same source slabs in one pass:
+       source -> reference grid (nearest neighbour) -> preview (label pooling),
+       no full size temporary and no second resampling of the whole volume
+    -> the metadata holds a per label index (voxels, bounding box, centroid), see label_utils,
+       accumulated from the same slabs
+    -> overlays are stored cropped: only the (aligned) box of the reference grid that holds
+       labels is written, its position is 'offset' [x, y, z] in the metadata ('reference_dims'
+       is the whole grid); masks, containers and pyramid carry the origin of the crop
+    -> a first pass over the source finds the labelled box, the conversion reads only that box
+    -> with full_resolution=False only the preview is written (meta of the reference grid
+       included), the full resolution binary, pyramid, bricks and mask are skipped
 
     Args:
         nifti_path (str): Input NIfTI file with segmentation.
@@ -20,40 +98,132 @@ def convert_segnifti_to_binary(nifti_path, bin_out, meta_out, reference_meta_pat
         reference_meta_path (str): Optional reference metadata to match resolution/origin.
         generate_preview (bool): Whether to generate a low-res preview.
         preview_scale (float): Scale factor for preview generation.
+        pyramid_levels (int): Number of pyramid levels including full resolution.
+        streaming (bool): Write slabs to memory-mapped files instead of memory.
+        memory_budget_mb (float): Approximate memory used per slab.
+        compress (bool): Also write precompressed variants of the binaries.
+        full_resolution (bool): Also write the full resolution outputs (needed for bricks, meshes).
     """
+    if not full_resolution and not generate_preview:
+        raise ValueError("Nothing to write without full resolution and preview")
+
     img = nib.load(nifti_path)
-    data = img.get_fdata()
-    data = np.where(data == 1, 255, 0) 
+    data = img.dataobj
+    src_shape = img.shape[:3]
 
     if reference_meta_path and os.path.exists(reference_meta_path):
         with open(reference_meta_path, encoding='utf-8') as f:
             ref_meta = json.load(f)
-        ref_dims = tuple(ref_meta['dims'][::-1])
-        ref_spacing = ref_meta['spacing']
-        ref_origin = ref_meta.get('origin', img.affine[:3, 3].tolist())
-
-        zoom_factors = [r / s for r, s in zip(ref_dims, data.shape)]
-        volume = zoom(data, zoom=zoom_factors, order=0).astype(np.uint8)
-        spacing = ref_spacing
-        dims = ref_dims
-        origin = ref_origin
+        dims = tuple(ref_meta['dims'][::-1])
+        spacing = ref_meta['spacing']
+        origin = ref_meta.get('origin', img.affine[:3, 3].tolist())
     else:
         spacing = [float(img.header.get_zooms()[2]), float(img.header.get_zooms()[1]), float(img.header.get_zooms()[0])]
-        volume = data.astype(np.uint8)
-        dims = volume.shape
+        dims = src_shape
         origin = img.affine[:3, 3].tolist()
 
-    os.makedirs(os.path.dirname(bin_out), exist_ok=True)
-    volume.tofile(bin_out)
+    # source voxel per output voxel, per axis
+    ix, iy, iz = (nearest_indices(s, d) for s, d in zip(src_shape, dims))
+
+    factor = round(1 / preview_scale)
+    align = 2 ** (pyramid_levels - 1) if full_resolution else 1
+    if generate_preview:
+        align = math.lcm(align, factor)
+
+    # crop: the reference voxels that sample the labelled part of the source
+    with stage('bounding box'):
+        bbox = source_bbox(data, slab_depth(src_shape[:2], memory_budget_mb, bytes_per_voxel=2))
+    if bbox is not None:
+        bbox = [(int(np.searchsorted(idx, lo)), int(np.searchsorted(idx, hi))) for idx, (lo, hi) in zip((ix, iy, iz), bbox)]
+        if any(lo >= hi for lo, hi in bbox):   # labels only between the sampled source voxels
+            bbox = None
+    offset, shape = aligned_crop(bbox, dims, align)
+    ix, iy, iz = (idx[o:o + n] for idx, o, n in zip((ix, iy, iz), offset, shape))
+    x0, y0 = ix[0], iy[0]
+    ix, iy = ix - x0, iy - y0
+    box_origin = crop_origin(origin, spacing, offset)
 
+    if full_resolution:
+        levels = allocate_pyramid(bin_out, shape, pyramid_levels, streaming=streaming)
+    else:
+        # only the preview grid, filled slab by slab
+        preview = np.zeros(tuple(-(-d // factor) for d in shape), dtype=np.uint8)
+
+    label_index = LabelIndex(shape)
+    # a slab reads every source slice between its samples, a finer source (along z) reads
+    # several per output slice: the depth is sized by the source bytes read, not only the output
+    ratio = max(1.0, (iz[-1] - iz[0] + 1) / len(iz))
+    src_bytes = (ix[-1] + 1) * (iy[-1] + 1) * (img.get_data_dtype().itemsize + 1) * ratio
+    depth = slab_depth(shape[:2], memory_budget_mb, align=align, bytes_per_voxel=4 + src_bytes / (shape[0] * shape[1]))
+    with stage('slab loop', int(np.prod(shape))):
+        for z in range(0, shape[2], depth):
+            slab_iz = iz[z:z + depth]
+            # stored dtype, no float copy, only the box of the labels is read
+            src = np.asarray(data[x0:x0 + ix[-1] + 1, y0:y0 + iy[-1] + 1, slab_iz[0]:slab_iz[-1] + 1])
+            labels = to_labels(src)
+            slab = labels[ix][:, iy][:, :, slab_iz - slab_iz[0]]
+            label_index.update(slab, z)
+            if full_resolution:
+                write_slab_to_pyramid(levels, slab, z, labels=True)
+            else:
+                reduced = slab_preview(slab, preview_scale, labels=True)
+                preview[:, :, z // factor:z // factor + reduced.shape[2]] = reduced
+
+    labels = label_index.to_dict(offset)
     with open(meta_out, 'w') as f:
-        json.dump({'spacing': spacing, 'dims': dims[::-1], 'origin': origin}, f)
+        json.dump({
+            'spacing': spacing,
+            'dims': shape[::-1],
+            'origin': origin,
+            'offset': offset[::-1],
+            'reference_dims': dims[::-1],
+            'labels': labels,
+        }, f)
+
+    if full_resolution:
+        write_full_resolution(levels, spacing, box_origin, bin_out, streaming, offset, dims)
+        if generate_preview:
+            preview = pyramid_preview(levels, preview_scale, labels=True)
 
     if generate_preview:
-        preview = zoom(volume, zoom=preview_scale, order=0)
         preview_spacing = [s / preview_scale for s in spacing]
         preview_bin = bin_out.replace('.bin', '_preview.bin')
         preview_meta = meta_out.replace('.json', '_preview.json')
-        preview.tofile(preview_bin)
+        preview_crop = {
+            'offset': [o // factor for o in offset[::-1]],
+            'reference_dims': [-(-d // factor) for d in dims[::-1]],
+        }
+        with stage('preview'):
+            preview.tofile(preview_bin)
+            write_mask(preview, preview_bin, preview_spacing, box_origin, **preview_crop)
+            # the container carries crop and label index, the viewer needs no metadata request
+            write_container(preview, preview_spacing, box_origin, container_path(preview_bin),
+                            meta={**preview_crop, 'labels': labels})
         with open(preview_meta, 'w') as f:
-            json.dump({'spacing': preview_spacing, 'dims': preview.shape[::-1], 'origin': origin}, f)
+            json.dump({'spacing': preview_spacing, 'dims': preview.shape[::-1], 'origin': origin, **preview_crop}, f)
+
+    if compress:
+        outputs = [level_path(bin_out, n) for n in range(len(levels))] if full_resolution else []
+        if generate_preview:
+            outputs += [preview_bin, container_path(preview_bin)]
+        with stage('compress'):
+            compress_binaries(outputs)
+
+
+def write_full_resolution(levels, spacing, origin, bin_out, streaming, offset, reference_shape):
+    """
+    Writes the full resolution label volume (crop) with its pyramid, bricks and run-length encoded mask.
+    origin is the world origin of the crop, offset its position in the reference grid (numpy order).
+    """
+    if streaming:
+        for level in levels:
+            level.flush()
+    else:
+        os.makedirs(os.path.dirname(bin_out), exist_ok=True)
+        levels[0].tofile(bin_out)
+
+    with stage('write pyramid'):
+        write_volume_pyramid(levels, spacing, origin, bin_out, write_levels=not streaming, offset=offset[::-1])
+        write_volume_bricks(levels, bin_out, origin=origin, offset=offset[::-1], reference_dims=reference_shape[::-1])
+    with stage('mask'):
+        write_mask(levels[0], bin_out, spacing, origin, offset[::-1], reference_shape[::-1])
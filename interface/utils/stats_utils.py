@@ -0,0 +1,123 @@
+import numpy as np
+
+# Internal histogram resolution, percentiles are accurate to about range / HISTOGRAM_BINS
+HISTOGRAM_BINS = 4096
+# Bins of the histogram written to the metadata (transfer function editor)
+EXPORT_BINS = 256
+PERCENTILES = [0.5, 1, 5, 25, 50, 75, 95, 99, 99.5]
+
+
+class StreamingStats:
+    """
+    Accumulates min/max, mean/std and a histogram of intensities slab by slab,
+    so the statistics come from the same pass as the conversion.
+
+    The histogram has a fixed number of bins with a power of two width. When a
+    slab falls outside the covered range the width is doubled and neighbouring
+    bins are merged, so earlier slabs never have to be read again.
+    """
+
+    def __init__(self, bins=HISTOGRAM_BINS):
+        self.bins = bins
+        self.counts = np.zeros(bins, dtype=np.int64)
+        self.low = None         # lower edge of bin 0, a multiple of width
+        self.width = None
+        self.count = 0
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.min = None
+        self.max = None
+
+    def update(self, slab):
+        """
+        Adds the intensities of a slab.
+        """
+        values = np.asarray(slab).ravel()
+        if values.dtype.kind == 'f':
+            values = values[np.isfinite(values)]
+        if values.size == 0:
+            return
+
+        low, high = float(values.min()), float(values.max())
+        self.min = low if self.min is None else min(self.min, low)
+        self.max = high if self.max is None else max(self.max, high)
+        self.count += values.size
+        as_float = values.astype(np.float64)
+        self.total += float(as_float.sum())
+        self.total_sq += float(np.dot(as_float, as_float))
+
+        if self.width is None:
+            span = ((high - low) or 1.0) / self.bins
+            self.width = 2.0 ** np.ceil(np.log2(span))
+            if values.dtype.kind in 'iu':
+                self.width = max(self.width, 1.0)   # no bins between integers
+            self.low = np.floor(low / self.width) * self.width
+        while low < self.low or high >= self.low + self.width * self.bins:
+            self._widen()
+
+        index = ((as_float - self.low) / self.width).astype(np.int64)
+        self.counts += np.bincount(np.minimum(index, self.bins - 1), minlength=self.bins)
+
+    def _widen(self):
+        """
+        Doubles the bin width, the covered range grows around the current one.
+        """
+        width = self.width * 2
+        center = self.low + self.width * self.bins / 2
+        low = np.floor((center - width * self.bins / 2) / width) * width
+        old_edges = self.low + self.width * np.arange(self.bins)
+        new_index = ((old_edges - low) // width).astype(np.int64)
+        self.counts = np.bincount(new_index, weights=self.counts, minlength=self.bins).astype(np.int64)
+        self.low, self.width = low, width
+
+    def percentile(self, q):
+        """
+        Approximate percentile (0-100), interpolated linearly within a bin.
+        """
+        cumulative = np.cumsum(self.counts)
+        target = q / 100.0 * self.count
+        b = int(np.searchsorted(cumulative, target))
+        b = min(b, self.bins - 1)
+        before = cumulative[b - 1] if b > 0 else 0
+        fraction = (target - before) / self.counts[b] if self.counts[b] else 0.0
+        value = self.low + (b + fraction) * self.width
+        return float(min(max(value, self.min), self.max))
+
+    def histogram(self, bins=EXPORT_BINS):
+        """
+        Histogram between min and max with at most `bins` bins.
+
+        Returns:
+            dict: start, bin_width and counts.
+        """
+        first = int((self.min - self.low) // self.width)
+        last = int((self.max - self.low) // self.width)
+        counts = self.counts[first:last + 1]
+        group = int(np.ceil(len(counts) / bins))
+        counts = np.pad(counts, (0, -len(counts) % group)).reshape(-1, group).sum(axis=1)
+        return {
+            'start': float(self.low + first * self.width),
+            'bin_width': float(self.width * group),
+            'counts': counts.tolist(),
+        }
+
+    def result(self):
+        """
+        Returns the statistics as a JSON serializable dict (None before any data).
+        """
+        if not self.count:
+            return None
+        mean = self.total / self.count
+        std = float(np.sqrt(max(self.total_sq / self.count - mean * mean, 0.0)))
+        percentiles = {str(q): self.percentile(q) for q in PERCENTILES}
+        low, high = percentiles['0.5'], percentiles['99.5']
+        return {
+            'count': self.count,
+            'min': self.min,
+            'max': self.max,
+            'mean': mean,
+            'std': std,
+            'percentiles': percentiles,
+            'auto_window': {'center': (low + high) / 2, 'width': (high - low) or 1.0},
+            'histogram': self.histogram(),
+        }
@@ -0,0 +1,156 @@
+import os
+import json
+import numpy as np
+import nibabel as nib
+
+# Synthetic cases for the benchmark (see management/commands/benchmark.py).
+# Shapes are (x, y, z) like the converted volumes, spacing in mm.
+SYNTHETIC_SIZES = {
+    'small': {'shape': (128, 128, 96), 'spacing': (0.6, 0.6, 0.6), 'landmarks': 20},
+    'medium': {'shape': (256, 256, 200), 'spacing': (0.4, 0.4, 0.4), 'landmarks': 50},
+    'cbct': {'shape': (512, 512, 400), 'spacing': (0.3, 0.3, 0.3), 'landmarks': 100},
+}
+
+
+def _head_slice(shape, z, seed):
+    """
+    One axial slice (x, y) of the phantom: a soft tissue ellipsoid with a bone
+    shell and noise, intensities like CT (HU + 1024, int16).
+    """
+    nx, ny, nz = shape
+    x = (np.arange(nx) - nx / 2) / (nx * 0.42)
+    y = (np.arange(ny) - ny / 2) / (ny * 0.38)
+    dz = (z - nz / 2) / (nz * 0.45)
+    r = np.sqrt(x[:, None] ** 2 + y[None, :] ** 2 + dz ** 2)
+
+    rng = np.random.default_rng((seed, z))
+    values = np.where(r < 1.0, 1064.0, 24.0)                   # tissue / air
+    values = np.where((r > 0.82) & (r < 0.92), 2200.0, values)  # bone shell
+    values += rng.normal(0, 30, values.shape)
+    return np.clip(values, 0, 4095).astype(np.int16)
+
+
+def synthetic_volume(shape, seed=0):
+    """
+    Generates the phantom volume.
+
+    Args:
+        shape (tuple): (x, y, z).
+        seed (int): Seed of the noise.
+
+    Returns:
+        np.ndarray: int16 volume (x, y, z).
+    """
+    volume = np.empty(shape, dtype=np.int16)
+    for z in range(shape[2]):
+        volume[:, :, z] = _head_slice(shape, z, seed)
+    return volume
+
+
+def synthetic_labels(shape, num_labels=4):
+    """
+    Generates a label map with a few box shaped structures of different sizes
+    (labels 1..num_labels), thin ones included (like nerve canals).
+
+    Returns:
+        np.ndarray: uint8 label volume (x, y, z).
+    """
+    labels = np.zeros(shape, dtype=np.uint8)
+    nx, ny, nz = shape
+    for label in range(1, num_labels + 1):
+        size = max(2, min(shape) // (2 + 2 * label))
+        x0 = nx // 4 + (label - 1) * nx // (2 * num_labels)
+        y0, z0 = ny // 3, nz // 3
+        if label == num_labels:  # thin structure, 2 voxels wide
+            labels[x0:x0 + 2, y0:y0 + ny // 3, z0:z0 + 2] = label
+        else:
+            labels[x0:x0 + size, y0:y0 + size, z0:z0 + size] = label
+    return labels
+
+
+def write_synthetic_nifti(volume, spacing, path, origin=(0.0, 0.0, 0.0)):
+    """
+    Writes a volume as NIfTI (.nii or .nii.gz) with a diagonal affine.
+    """
+    affine = np.diag(list(spacing) + [1.0])
+    affine[:3, 3] = origin
+    nib.save(nib.Nifti1Image(volume, affine), path)
+
+
+def write_synthetic_dicom(volume, spacing, folder, origin=(0.0, 0.0, 0.0)):
+    """
+    Writes a volume as a CT DICOM series, one file per axial slice
+    (uncompressed, rescale intercept -1024 like most CBCT exports).
+
+    Args:
+        volume (np.ndarray): int16 volume (x, y, z).
+        spacing (tuple): Spacing (x, y, z) in mm.
+        folder (str): Output folder.
+        origin (tuple): Position of the first voxel in mm.
+    """
+    import pydicom
+    from pydicom.dataset import Dataset, FileMetaDataset
+    from pydicom.uid import ExplicitVRLittleEndian, CTImageStorage, generate_uid
+
+    os.makedirs(folder, exist_ok=True)
+    study_uid, series_uid = generate_uid(), generate_uid()
+    nx, ny, nz = volume.shape
+
+    for k in range(nz):
+        meta = FileMetaDataset()
+        meta.MediaStorageSOPClassUID = CTImageStorage
+        meta.MediaStorageSOPInstanceUID = generate_uid()
+        meta.TransferSyntaxUID = ExplicitVRLittleEndian
+
+        ds = Dataset()
+        ds.file_meta = meta
+        ds.SOPClassUID = CTImageStorage
+        ds.SOPInstanceUID = meta.MediaStorageSOPInstanceUID
+        ds.StudyInstanceUID = study_uid
+        ds.SeriesInstanceUID = series_uid
+        ds.Modality = 'CT'
+        ds.ImageType = ['ORIGINAL', 'PRIMARY', 'AXIAL']
+        ds.PatientName = 'Synthetic'
+        ds.PatientID = 'SYNTHETIC'
+        ds.Rows, ds.Columns = ny, nx
+        ds.PixelSpacing = [spacing[1], spacing[0]]
+        ds.SliceThickness = spacing[2]
+        ds.ImageOrientationPatient = [1, 0, 0, 0, 1, 0]
+        ds.ImagePositionPatient = [origin[0], origin[1], origin[2] + k * spacing[2]]
+        ds.InstanceNumber = k + 1
+        ds.SamplesPerPixel = 1
+        ds.PhotometricInterpretation = 'MONOCHROME2'
+        ds.BitsAllocated, ds.BitsStored, ds.HighBit = 16, 16, 15
+        ds.PixelRepresentation = 1
+        ds.RescaleSlope, ds.RescaleIntercept = 1, -1024
+        ds.PixelData = np.ascontiguousarray(volume[:, :, k].T).tobytes()  # rows = y, columns = x
+        pydicom.dcmwrite(os.path.join(folder, f'slice_{k:04d}.dcm'), ds, enforce_file_format=True)
+
+
+def write_synthetic_landmarks(count, dims, spacing, origin, path, seed=0):
+    """
+    Writes a Slicer markup JSON (LPS) with `count` control points.
+
+    The positions are chosen so that they end up inside the volume after the
+    landmark pipeline (LPS -> RAS, axis permutation, offset origin), see
+    read_json_information and transform_landmarks_to_voxel_space.
+
+    Args:
+        count (int): Number of landmarks.
+        dims (list[int]): Dims [x, y, z] of the reference meta.
+        spacing (list[float]): Spacing [x, y, z] of the reference meta.
+        origin (list[float]): Origin [x, y, z] of the reference meta.
+        path (str): Output path (.json).
+        seed (int): Seed of the positions.
+    """
+    rng = np.random.default_rng(seed)
+    offset_origin = [-abs(origin[2]), -abs(origin[1]), -abs(origin[0])]
+    points = []
+    for n in range(count):
+        voxel = [rng.uniform(0.1, 0.9) * d for d in dims]
+        px, py, pz = (offset_origin[a] + voxel[a] * spacing[a] for a in range(3))
+        # inverse of the permutation [2, 1, 0] and of the LPS -> RAS flip
+        points.append({'id': str(n + 1), 'label': f'L-{n + 1}', 'position': [-pz, -py, px]})
+
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'markups': [{'type': 'Fiducial', 'controlPoints': points}]}, f)
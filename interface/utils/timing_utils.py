@@ -0,0 +1,165 @@
+import os
+import re
+import json
+import time
+import contextvars
+from contextlib import contextmanager
+
+# Stages of the current request or job step, None when nothing is collecting
+_stages = contextvars.ContextVar('timing_stages', default=None)
+# [resident memory at entry, peak so far] per open stage, the innermost last;
+# None when the memory is not measured
+_open_stages = contextvars.ContextVar('timing_open_stages', default=None)
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def resident_memory():
+    """
+    Returns the resident memory of this process in bytes (Linux, from /proc).
+    """
+    with open('/proc/self/statm', encoding='ascii') as f:
+        return int(f.read().split()[1]) * PAGE_SIZE
+
+
+def peak_resident_memory():
+    """
+    Returns the peak resident memory (VmHWM) since the last reset_peak_memory in bytes.
+    """
+    with open('/proc/self/status', encoding='ascii') as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) * 1024
+    raise ValueError("No VmHWM in /proc/self/status")
+
+
+def reset_peak_memory():
+    """
+    Resets the peak resident memory of this process to the current resident memory (Linux).
+    """
+    with open('/proc/self/clear_refs', 'w', encoding='ascii') as f:
+        f.write('5')
+
+
+def start_timing(memory=False):
+    """
+    Starts collecting stages in the current context.
+
+    The peak memory of /proc is per process, it is only exact when the process runs
+    nothing else at the same time: memory=True is meant for the job processes
+    (see run_timed), requests share their process with other requests and threads.
+
+    Args:
+        memory (bool): Also measure the peak memory per stage (peak_mb).
+
+    Returns:
+        token: Pass to stop_timing.
+    """
+    return _stages.set([]), _open_stages.set([] if memory else None)
+
+
+def stop_timing(token):
+    """
+    Stops collecting and returns the stages collected since start_timing.
+    """
+    stages = _stages.get() or []
+    _stages.reset(token[0])
+    _open_stages.reset(token[1])
+    return stages
+
+
+def add_stages(stages, prefix=''):
+    """
+    Adds stages recorded elsewhere (e.g. in a job process) to the current collection.
+    """
+    collected = _stages.get()
+    if collected is not None:
+        collected.extend({**s, 'name': prefix + s['name']} for s in stages)
+
+
+@contextmanager
+def stage(name, nbytes=None):
+    """
+    Times a stage: wall time, bytes processed and, when measured (see start_timing),
+    the peak memory of the stage. Costs two clock reads when nothing is collecting.
+
+    The peak is the most resident memory during the stage above the resident memory
+    at its start (Linux, the peak is reset per stage; None where /proc is unavailable).
+    -> every stage resets the peak on entry, the peak reached before is handed
+       to the enclosing stage, so nested stages all stay exact
+    -> no tracing of allocations, the stage costs a few /proc reads
+
+    The bytes can also be set inside the block when they are only known there:
+        with stage('write upload') as info:
+            info['bytes'] = ...
+
+    Args:
+        name (str): Name of the stage.
+        nbytes (int): Bytes processed by the stage.
+    """
+    info = {'name': name, 'bytes': nbytes}
+    open_stages = _open_stages.get() if _stages.get() is not None else None
+    memory = open_stages is not None
+    if memory:
+        try:
+            current = resident_memory()
+            if open_stages:
+                open_stages[-1][1] = max(open_stages[-1][1], peak_resident_memory())
+            reset_peak_memory()
+            open_stages.append([current, current])
+        except (OSError, ValueError):   # no /proc (macOS, Windows)
+            open_stages = None
+    start = time.perf_counter()
+    try:
+        yield info
+    finally:
+        info['ms'] = round((time.perf_counter() - start) * 1000, 2)
+        collected = _stages.get()
+        if collected is not None:
+            if memory:
+                info['peak_mb'] = None
+            if open_stages is not None:
+                entry, peak = open_stages.pop()
+                peak = max(peak, peak_resident_memory())
+                if open_stages:
+                    open_stages[-1][1] = max(open_stages[-1][1], peak)
+                info['peak_mb'] = round((peak - entry) / 2**20, 1)
+            collected.append(info)
+
+
+def run_timed(func, args, kwargs):
+    """
+    Runs func while collecting its stages, used for job steps in the process pool.
+    -> a pool process runs one step at a time, so the peak memory is its own
+
+    Returns:
+        tuple: (stages, peak memory of the whole step in MB).
+    """
+    token = start_timing(memory=True)
+    try:
+        with stage('step'):
+            func(*args, **kwargs)
+    finally:
+        stages = stop_timing(token)
+    step = stages.pop()
+    return stages, step['peak_mb']
+
+
+def server_timing_header(stages):
+    """
+    Formats stages as Server-Timing header value (shown in the network tab of the browser).
+    """
+    metrics = []
+    for s in stages:
+        metric = f"{re.sub(r'[^A-Za-z0-9_-]+', '-', s['name']).strip('-')};dur={s['ms']}"
+        if s.get('bytes'):
+            metric += f';desc="{s["bytes"] / 2**20:.1f} MB"'
+        metrics.append(metric)
+    return ', '.join(metrics)
+
+
+def log_timings(kind, stages, **fields):
+    """
+    Logs stages as one JSON line, so timings can be aggregated across requests.
+    """
+    print("[TIMING] " + json.dumps({'kind': kind, 'time': time.time(), **fields, 'stages': stages}))
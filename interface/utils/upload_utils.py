@@ -0,0 +1,230 @@
+import os
+import re
+import json
+import time
+import uuid
+import shutil
+import hashlib
+
+from .cache_utils import link_or_copy
+
+# Resumable uploads live in <workspace>/uploads/<upload id>/, one .part file per file.
+# Finished files are kept by content hash in <workspace>/uploads/blobs/, so a file
+# that was uploaded before (same sha256) is not sent or stored again.
+UPLOADS_DIR = 'uploads'
+BLOBS_DIR = 'blobs'
+UPLOAD_KINDS = ('dicom', 'nifti')
+# Largest chunk accepted per request
+MAX_CHUNK_BYTES = 64 * 1024 ** 2
+COPY_BUFFER = 1024 ** 2
+
+
+class UploadOffsetError(ValueError):
+    """
+    A chunk does not start at the current offset of the file (e.g. sent twice after a dropped connection).
+    """
+
+    def __init__(self, offset):
+        super().__init__(f"Chunk does not start at the current offset {offset}")
+        self.offset = offset
+
+
+def upload_dir(workspace, upload_id):
+    """
+    Returns the folder of a resumable upload.
+    """
+    return os.path.join(workspace, UPLOADS_DIR, upload_id)
+
+
+def blob_path(workspace, digest):
+    """
+    Returns the path of a finished file in the blob store.
+    """
+    return os.path.join(workspace, UPLOADS_DIR, BLOBS_DIR, digest)
+
+
+def part_path(workspace, upload_id, index):
+    """
+    Returns the path of the partly received file `index` of an upload.
+    """
+    return os.path.join(upload_dir(workspace, upload_id), f'{index}.part')
+
+
+def _write_manifest(workspace, manifest):
+    path = os.path.join(upload_dir(workspace, manifest['id']), 'upload.json')
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    os.replace(path + '.tmp', path)
+
+
+def init_upload(workspace, kind, files):
+    """
+    Starts a resumable upload.
+
+    Files with a known sha256 that is already in the blob store are marked as
+    deduplicated and do not have to be sent.
+
+    Args:
+        workspace (str): Case workspace.
+        kind (str): 'dicom' (a folder of files) or 'nifti' (one file).
+        files (list[dict]): Per file 'name', 'size' and optionally 'sha256'.
+
+    Returns:
+        dict: The upload manifest.
+    """
+    if kind not in UPLOAD_KINDS:
+        raise ValueError(f"Unknown upload kind {kind}")
+    if not files or (kind == 'nifti' and len(files) != 1):
+        raise ValueError("Expected one NIfTI file or a list of DICOM files")
+
+    entries, names = [], set()
+    for index, f in enumerate(files):
+        name = os.path.basename(str(f.get('name', '')))
+        size = f.get('size')
+        digest = f.get('sha256')
+        if not name or not isinstance(size, int) or size < 0:
+            raise ValueError("Every file needs a name and a size")
+        if name in ('.', '..'):   # would place the file at (or above) the destination folder
+            raise ValueError(f"Invalid file name {name}")
+        if digest is not None and not re.fullmatch(r'[0-9a-f]{64}', str(digest)):
+            raise ValueError("sha256 has to be a hex digest")
+        if name in names:   # same file name in different subfolders of a DICOM export
+            name = f'{index}_{name}'
+        names.add(name)
+        entries.append({
+            'name': name,
+            'size': size,
+            'sha256': digest,
+            'deduplicated': digest is not None and os.path.exists(blob_path(workspace, digest)),
+        })
+
+    manifest = {'id': uuid.uuid4().hex, 'kind': kind, 'files': entries, 'created': time.time()}
+    os.makedirs(upload_dir(workspace, manifest['id']), exist_ok=True)
+    os.makedirs(os.path.dirname(blob_path(workspace, '0')), exist_ok=True)
+    _write_manifest(workspace, manifest)
+    return manifest
+
+
+def load_upload(workspace, upload_id):
+    """
+    Returns the manifest of an upload, or None for an unknown upload id.
+    """
+    if not re.fullmatch(r'[0-9a-f]{32}', upload_id):
+        return None
+    path = os.path.join(upload_dir(workspace, upload_id), 'upload.json')
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def file_offset(workspace, manifest, index):
+    """
+    Returns the number of bytes received for a file (its size when deduplicated).
+    The offset is the size of the part on disk, so it survives restarts of the server.
+    """
+    entry = manifest['files'][index]
+    if entry['deduplicated']:
+        return entry['size']
+    path = part_path(workspace, manifest['id'], index)
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+def upload_status(workspace, manifest):
+    """
+    Returns per file its index, name, size and offset.
+    """
+    return [
+        {'index': i, 'name': e['name'], 'size': e['size'], 'offset': file_offset(workspace, manifest, i),
+         'deduplicated': e['deduplicated']}
+        for i, e in enumerate(manifest['files'])
+    ]
+
+
+def append_chunk(workspace, manifest, index, offset, stream, length):
+    """
+    Appends a chunk to a file of an upload, streamed to disk (not held in memory).
+
+    Args:
+        workspace (str): Case workspace.
+        manifest (dict): Upload manifest.
+        index (int): Index of the file in the manifest.
+        offset (int): Offset of the chunk in the file, has to match the received bytes.
+        stream: File-like object with the chunk (e.g. the request).
+        length (int): Length of the chunk in bytes.
+
+    Returns:
+        int: New offset of the file.
+    """
+    if not 0 <= index < len(manifest['files']):
+        raise ValueError("Unknown file index")
+    if length > MAX_CHUNK_BYTES:
+        raise ValueError(f"Chunks are limited to {MAX_CHUNK_BYTES} bytes")
+
+    current = file_offset(workspace, manifest, index)
+    if offset != current:
+        raise UploadOffsetError(current)
+    if current + length > manifest['files'][index]['size']:
+        raise ValueError("Chunk exceeds the file size")
+
+    with open(part_path(workspace, manifest['id'], index), 'ab') as f:
+        remaining = length
+        while remaining:
+            data = stream.read(min(COPY_BUFFER, remaining))
+            if not data:
+                break
+            f.write(data)
+            remaining -= len(data)
+    return file_offset(workspace, manifest, index)
+
+
+def _hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(COPY_BUFFER), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def finalize_upload(workspace, manifest, dest_dir):
+    """
+    Checks that every file is complete, stores the parts in the blob store and
+    places the files in dest_dir (hard links to the blobs where possible).
+    The upload folder is removed afterwards.
+
+    Args:
+        workspace (str): Case workspace.
+        manifest (dict): Upload manifest.
+        dest_dir (str): Folder the files are placed in (e.g. <workspace>/dicoms).
+
+    Returns:
+        list[tuple]: (path, sha256) per file, in manifest order.
+    """
+    incomplete = [e['name'] for i, e in enumerate(manifest['files'])
+                  if file_offset(workspace, manifest, i) != e['size']]
+    if incomplete:
+        raise ValueError(f"{len(incomplete)} file(s) incomplete, e.g. {incomplete[0]}")
+
+    os.makedirs(dest_dir, exist_ok=True)
+    placed = []
+    for index, entry in enumerate(manifest['files']):
+        if entry['deduplicated']:
+            digest = entry['sha256']
+        else:
+            part = part_path(workspace, manifest['id'], index)
+            digest = _hash_file(part)
+            if entry['sha256'] and entry['sha256'] != digest:
+                raise ValueError(f"Checksum mismatch for {entry['name']}")
+            if os.path.exists(blob_path(workspace, digest)):
+                os.remove(part)
+            else:
+                os.replace(part, blob_path(workspace, digest))
+
+        if not os.path.exists(blob_path(workspace, digest)):
+            raise ValueError(f"{entry['name']} is no longer available, upload it again")
+        path = os.path.join(dest_dir, entry['name'])
+        link_or_copy(blob_path(workspace, digest), path)
+        placed.append((path, digest))
+
+    shutil.rmtree(upload_dir(workspace, manifest['id']), ignore_errors=True)
+    return placed
@@ -0,0 +1,339 @@
+import os
+import json
+import numpy as np
+from scipy.ndimage import zoom
+
+from .downsample_utils import block_reduce
+
+BRICK_SIZE = 64
+
+
+def downsample_by_two(volume, labels=False):
+    """
+    Halves every axis of a volume (odd axes are rounded up).
+
+    Intensities are averaged over 2x2x2 blocks, the last slice of an odd axis
+    is repeated for the missing half of the block. Label volumes keep the most
+    frequent nonzero label of the block, so thin structures (nerve canals)
+    do not disappear from the lower levels. See downsample_utils.block_reduce.
+    -> blocks never cross an even index, so slabs with an even number of
+       slices can be downsampled separately and give the same result
+
+    Args:
+        volume (np.ndarray): 3D volume (uint8, or int16/float32 for native stores).
+        labels (bool): Whether the volume holds label values.
+
+    Returns:
+        np.ndarray: Downsampled volume of the same dtype.
+    """
+    return block_reduce(volume, 2, mode='mode' if labels else 'mean')
+
+
+def pyramid_shapes(shape, num_levels=4):
+    """
+    Returns the array shape of every pyramid level for a full resolution shape.
+    -> stops early when an axis would drop below 1 voxel
+    """
+    shapes = [tuple(shape)]
+    for _ in range(1, num_levels):
+        if min(shapes[-1]) < 2:
+            break
+        shapes.append(tuple(-(-size // 2) for size in shapes[-1]))
+    return shapes
+
+
+def build_volume_pyramid(volume, num_levels=4, labels=False):
+    """
+    Builds a multi-resolution pyramid (1, 1/2, 1/4, 1/8, ...) of a volume.
+
+    Every level is downsampled from the previous one by a factor 2,
+    so the levels of the anatomy, segmentation and landmark volumes match
+    as long as they start from the same dims.
+
+    Args:
+        volume (np.ndarray): Full resolution 3D volume (level 0).
+        num_levels (int): Number of levels including the full resolution.
+        labels (bool): Whether the volume holds label values.
+
+    Returns:
+        list[np.ndarray]: Volumes per level, index 0 is the input volume.
+    """
+    levels = [volume]
+    for _ in pyramid_shapes(volume.shape, num_levels)[1:]:
+        levels.append(downsample_by_two(levels[-1], labels=labels))
+    return levels
+
+
+def slab_depth(slice_shape, memory_budget_mb, align=1, bytes_per_voxel=16):
+    """
+    Returns how many slices fit in one slab within the memory budget.
+
+    bytes_per_voxel covers the temporary arrays a converter keeps per voxel
+    of a slab. The depth is a multiple of align (at least align),
+    so pyramid blocks never cross a slab border.
+    """
+    slice_bytes = slice_shape[0] * slice_shape[1] * bytes_per_voxel
+    depth = int(memory_budget_mb * 1024 * 1024 // slice_bytes)
+    return max(align, depth - depth % align)
+
+
+def aligned_crop(bbox, shape, align=1):
+    """
+    Crop of an overlay inside its reference grid: the bounding box widened to
+    multiples of align (clipped to the grid), so the pyramid levels and the preview
+    of the crop are exact parts of those of the whole grid.
+
+    Args:
+        bbox (tuple): (start, stop) per axis in numpy order, None for an empty overlay.
+        shape (tuple): Shape of the reference grid (numpy order).
+        align (int): Alignment of the crop start (and stop, unless clipped).
+
+    Returns:
+        tuple: (offset, crop shape), numpy order; an empty overlay gets the first block.
+    """
+    if bbox is None:
+        bbox = [(0, 1)] * len(shape)
+    offset = tuple(start - start % align for start, _ in bbox)
+    stop = tuple(min(size, -(-end // align) * align) for (_, end), size in zip(bbox, shape))
+    return offset, tuple(e - o for o, e in zip(offset, stop))
+
+
+def crop_origin(origin, spacing, offset):
+    """
+    World origin of a crop, offset in numpy order (spacing and origin in the order of the metadata).
+    """
+    return [o + s * n for o, s, n in zip(origin, spacing, offset[::-1])]
+
+
+def allocate_pyramid(bin_path, shape, num_levels=4, streaming=True, dtype=np.uint8):
+    """
+    Allocates the output volumes (uint8 by default) of all pyramid levels.
+
+    With streaming=True the levels are memory-mapped onto their .bin files,
+    otherwise they are held in memory.
+
+    Returns:
+        list[np.ndarray]: Empty volume per level.
+    """
+    shapes = pyramid_shapes(shape, num_levels)
+    if streaming:
+        os.makedirs(os.path.dirname(bin_path), exist_ok=True)
+        return [np.memmap(level_path(bin_path, n), dtype=dtype, mode='w+', shape=level_shape)
+                for n, level_shape in enumerate(shapes)]
+    return [np.zeros(level_shape, dtype=dtype) for level_shape in shapes]
+
+
+def write_slab_to_pyramid(levels, slab, z, labels=False):
+    """
+    Writes a slab of slices starting at slice z (last axis) into every pyramid level.
+
+    z has to be a multiple of 2**(len(levels) - 1), see slab_depth.
+    """
+    levels[0][:, :, z:z + slab.shape[2]] = slab
+    for n in range(1, len(levels)):
+        slab = downsample_by_two(slab, labels=labels)
+        zn = z >> n
+        levels[n][:, :, zn:zn + slab.shape[2]] = slab
+
+
+def level_path(bin_path, level):
+    """
+    Returns the .bin path of a pyramid level (level 0 is the full resolution file).
+    """
+    if level == 0:
+        return bin_path
+    return bin_path.replace('.bin', f'_level{level}.bin')
+
+
+def pyramid_manifest_path(bin_path):
+    """
+    Returns the path of the pyramid manifest that belongs to a .bin file.
+    """
+    return bin_path.replace('.bin', '.pyramid.json')
+
+
+def write_volume_pyramid(levels, spacing, origin, bin_path, write_levels=True, stats=None, offset=None):
+    """
+    Writes the pyramid levels next to the full resolution .bin file
+    together with a manifest JSON that lists the dims and spacing per level.
+
+    Level 0 is expected to be written already to bin_path by the converter.
+    The manifest stores file names relative to its own folder.
+
+    Args:
+        levels (list[np.ndarray]): Output of build_volume_pyramid.
+        spacing (list): Voxel spacing of level 0 [x, y, z].
+        origin (list): World origin [x, y, z].
+        bin_path (str): Path of the full resolution .bin file.
+        write_levels (bool): False when the levels are already on disk (memmap).
+        stats (dict): Optional intensity statistics stored in the manifest.
+        offset (list): Offset of a cropped overlay in the reference grid [x, y, z], stored in the manifest.
+
+    Returns:
+        str: Path of the written manifest.
+    """
+    manifest = {'origin': origin, 'dtype': levels[0].dtype.name, 'levels': []}
+    if stats is not None:
+        manifest['stats'] = stats
+    if offset is not None:
+        manifest['offset'] = list(offset)
+
+    for n, level in enumerate(levels):
+        path = level_path(bin_path, n)
+        if n > 0 and write_levels:
+            level.tofile(path)
+
+        scale = 0.5 ** n
+        manifest['levels'].append({
+            'level': n,
+            'scale': scale,
+            'file': os.path.basename(path),
+            'dims': level.shape[::-1],
+            'spacing': [s / scale for s in spacing],
+        })
+
+    manifest_path = pyramid_manifest_path(bin_path)
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    return manifest_path
+
+
+def pyramid_preview(levels, preview_scale, labels=False):
+    """
+    Returns the preview volume for preview_scale, reusing a pyramid level when it matches.
+    Other scales of 1/k are block-reduced from full resolution, only scales that
+    are no integer fraction are interpolated.
+    """
+    for n, level in enumerate(levels):
+        if 0.5 ** n == preview_scale:
+            return level
+    factor = round(1 / preview_scale)
+    if abs(factor * preview_scale - 1) < 1e-6:
+        return block_reduce(levels[0], factor, mode='mode' if labels else 'mean')
+    return zoom(levels[0], zoom=preview_scale, order=0 if labels else 3)
+
+
+def slab_preview(slab, preview_scale, labels=False):
+    """
+    Downsamples one slab to the preview scale (1/k), the same way pyramid_preview
+    does for the whole volume: by the pyramid halving for powers of two,
+    otherwise by one block reduction. Slabs have to start at a multiple of k.
+    """
+    factor = round(1 / preview_scale)
+    if abs(factor * preview_scale - 1) > 1e-6:
+        raise ValueError(f"Preview scale {preview_scale} is not 1/k")
+    if factor & (factor - 1) == 0:
+        for _ in range(factor.bit_length() - 1):
+            slab = downsample_by_two(slab, labels=labels)
+        return slab
+    return block_reduce(slab, factor, mode='mode' if labels else 'mean')
+
+
+def bricks_index_path(bin_path):
+    """
+    Returns the path of the brick index that belongs to a .bin file.
+    """
+    return bin_path.replace('.bin', '.bricks.json')
+
+
+def write_volume_bricks(levels, bin_path, brick_size=BRICK_SIZE, origin=None, offset=None, reference_dims=None):
+    """
+    Splits every pyramid level into bricks of brick_size^3 voxels
+    and writes them to one .bricks file per level plus a shared index JSON.
+
+    Brick (bx, by, bz) follows the dims order of the metadata (x fastest),
+    so it covers volume[bz*B:(bz+1)*B, by*B:(by+1)*B, bx*B:(bx+1)*B].
+    Bricks on the upper borders are not padded, the index stores the byte
+    offset of every brick in raster order (bx fastest) plus the end offset;
+    the dtype of the levels is kept and stored in the index.
+
+    Args:
+        levels (list[np.ndarray]): Output of build_volume_pyramid.
+        bin_path (str): Path of the full resolution .bin file.
+        brick_size (int): Edge length of a brick in voxels.
+        origin (list): World origin of level 0 [x, y, z], stored in the index.
+        offset (list): Offset of a cropped overlay in the reference grid [x, y, z],
+            stored in the index (also per level, in the voxels of that level).
+        reference_dims (list): Dims of the reference grid [x, y, z] (needed with offset).
+
+    Returns:
+        str: Path of the written brick index.
+    """
+    index = {'brick_size': brick_size, 'dtype': levels[0].dtype.name, 'levels': []}
+    if origin is not None:
+        index['origin'] = list(origin)
+    if offset is not None:
+        index['offset'] = list(offset)
+        index['reference_dims'] = list(reference_dims)
+
+    for n, level in enumerate(levels):
+        path = bin_path.replace('.bin', f'_level{n}.bricks')
+        grid = [-(-size // brick_size) for size in level.shape[::-1]]
+        offsets = [0]
+
+        with open(path, 'wb') as f:
+            for bz in range(grid[2]):
+                for by in range(grid[1]):
+                    for bx in range(grid[0]):
+                        brick = level[bz * brick_size:(bz + 1) * brick_size,
+                                      by * brick_size:(by + 1) * brick_size,
+                                      bx * brick_size:(bx + 1) * brick_size]
+                        f.write(np.ascontiguousarray(brick).tobytes())
+                        offsets.append(offsets[-1] + brick.nbytes)
+
+        index['levels'].append({
+            'level': n,
+            'file': os.path.basename(path),
+            'dims': level.shape[::-1],
+            'grid': grid,
+            'offsets': offsets,
+        })
+        if offset is not None:
+            # crops are aligned to the pyramid, the offset halves exactly per level
+            index['levels'][-1]['offset'] = [o >> n for o in offset]
+            index['levels'][-1]['reference_dims'] = [-(-d >> n) for d in reference_dims]
+
+    index_path = bricks_index_path(bin_path)
+    with open(index_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f)
+    return index_path
+
+
+def read_bricks(bin_path, level, bricks):
+    """
+    Reads bricks of one pyramid level using the brick index of a .bin file.
+
+    Args:
+        bin_path (str): Path of the full resolution .bin file.
+        level (int): Pyramid level.
+        bricks (list[tuple[int]]): Brick coordinates (bx, by, bz).
+
+    Returns:
+        list[dict]: Per brick its coordinates, dims [x, y, z] and raw bytes.
+    """
+    with open(bricks_index_path(bin_path), encoding='utf-8') as f:
+        index = json.load(f)
+
+    entry = next((e for e in index['levels'] if e['level'] == level), None)
+    if entry is None:
+        raise ValueError(f"Level {level} not available")
+
+    brick_size = index['brick_size']
+    grid = entry['grid']
+    dims = entry['dims']
+    path = os.path.join(os.path.dirname(bin_path), entry['file'])
+
+    result = []
+    with open(path, 'rb') as f:
+        for bx, by, bz in bricks:
+            if not (0 <= bx < grid[0] and 0 <= by < grid[1] and 0 <= bz < grid[2]):
+                raise ValueError(f"Brick ({bx}, {by}, {bz}) outside grid {grid}")
+            number = (bz * grid[1] + by) * grid[0] + bx
+            start, end = entry['offsets'][number], entry['offsets'][number + 1]
+            f.seek(start)
+            result.append({
+                'brick': [bx, by, bz],
+                'dims': [min(brick_size, d - b * brick_size) for d, b in zip(dims, (bx, by, bz))],
+                'data': f.read(end - start),
+            })
+    return result
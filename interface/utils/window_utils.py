@@ -0,0 +1,163 @@
+import os
+import json
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+import numpy as np
+
+from .volume_utils import pyramid_manifest_path
+from .container_utils import pack_container_header
+
+# Bytes of rendered windows kept in memory (per process), see settings.WINDOW_CACHE_MAX_BYTES
+WINDOW_CACHE_MAX_BYTES = 256 * 1024 ** 2
+
+
+def native_path(bin_path):
+    """
+    Returns the path of the native precision store that belongs to a (uint8) .bin file.
+    """
+    return bin_path.replace('.bin', '_native.bin')
+
+
+def native_dtype(dataobj):
+    """
+    Chooses the dtype of the native store for the data of an image.
+    Integer data with integer scaling (CT, most MR) is stored as int16,
+    everything else as float32.
+
+    Args:
+        dataobj: img.dataobj (array proxy or numpy array).
+    """
+    slope = float(getattr(dataobj, 'slope', 1.0))
+    inter = float(getattr(dataobj, 'inter', 0.0))
+    if np.issubdtype(dataobj.dtype, np.integer) and slope.is_integer() and inter.is_integer():
+        return np.dtype(np.int16)
+    return np.dtype(np.float32)
+
+
+def to_native(slab, dtype):
+    """
+    Converts a slab of intensities to the dtype of the native store (int16 is clipped to its range).
+    """
+    if dtype == np.int16:
+        return np.clip(slab, -32768, 32767).astype(np.int16)
+    return np.asarray(slab, dtype=dtype)
+
+
+@lru_cache(maxsize=64)
+def window_lut(center, width):
+    """
+    Lookup table mapping every int16 value (offset by 32768) to uint8 for a window.
+    """
+    values = np.arange(-32768, 32768, dtype=np.float32)
+    low = center - width / 2.0
+    lut = np.clip((values - low) / width * 255.0, 0, 255)
+    lut = np.rint(lut).astype(np.uint8)
+    lut.flags.writeable = False
+    return lut
+
+
+def apply_window(volume, center, width):
+    """
+    Maps native intensities to uint8 for a window (center/level and width).
+    -> for speed: int16 volumes go through a 64k lookup table, the int16 values
+       are reinterpreted as offset indices without a conversion copy
+
+    Args:
+        volume (np.ndarray): Native volume (int16 or float32).
+        center (float): Window center (level).
+        width (float): Window width, > 0.
+
+    Returns:
+        np.ndarray: uint8 volume of the same shape.
+    """
+    if width <= 0:
+        raise ValueError("Window width has to be positive")
+
+    if volume.dtype == np.int16:
+        index = np.asarray(volume).view(np.uint16) ^ np.uint16(0x8000)  # -32768..32767 -> 0..65535
+        return window_lut(float(center), float(width))[index]
+
+    low = center - width / 2.0
+    return np.rint(np.clip((volume - low) / width * 255.0, 0, 255)).astype(np.uint8)
+
+
+class WindowCache:
+    """
+    LRU cache of rendered windows, bounded by the total size of the cached containers
+    (a count bound holds anything from a few kB of previews to GBs of full levels).
+    Least recently used windows are evicted above max_bytes, a container larger
+    than max_bytes is not cached at all.
+    """
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            data = self.entries.get(key)
+            if data is not None:
+                self.entries.move_to_end(key)
+            return data
+
+    def put(self, key, data, max_bytes):
+        with self.lock:
+            if key in self.entries:
+                self.nbytes -= len(self.entries.pop(key))
+            if len(data) <= max_bytes:
+                self.entries[key] = data
+                self.nbytes += len(data)
+            while self.nbytes > max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.nbytes -= len(evicted)
+
+
+_window_cache = WindowCache()
+
+
+def render_window(bin_path, level, center, width, cache_max_bytes=WINDOW_CACHE_MAX_BYTES):
+    """
+    Renders one pyramid level of the native store with a window as a uint8 container
+    (header with geometry + data, see container_utils). Recently used windows come
+    from a byte bounded LRU cache, a reconversion invalidates them (mtime is part of the key).
+    -> the full resolution level is not cached, it would push out all previews
+
+    Args:
+        bin_path (str): Path of the full resolution (uint8) .bin file.
+        level (int): Pyramid level.
+        center (float): Window center (level).
+        width (float): Window width.
+        cache_max_bytes (int): Size bound of the window cache.
+
+    Returns:
+        bytes: Container with the windowed volume.
+    """
+    manifest_path = pyramid_manifest_path(native_path(bin_path))
+    if not os.path.exists(manifest_path):
+        raise FileNotFoundError("Native store not found")
+    if level == 0:
+        return _render_window(manifest_path, level, float(center), float(width))
+
+    key = (manifest_path, os.path.getmtime(manifest_path), level, float(center), float(width))
+    data = _window_cache.get(key)
+    if data is None:
+        data = _render_window(manifest_path, level, float(center), float(width))
+        _window_cache.put(key, data, cache_max_bytes)
+    return data
+
+
+def _render_window(manifest_path, level, center, width):
+    with open(manifest_path, encoding='utf-8') as f:
+        manifest = json.load(f)
+
+    entry = next((e for e in manifest['levels'] if e['level'] == level), None)
+    if entry is None:
+        raise ValueError(f"Level {level} not available")
+
+    path = os.path.join(os.path.dirname(manifest_path), entry['file'])
+    volume = np.memmap(path, dtype=manifest['dtype'], mode='r', shape=tuple(entry['dims'][::-1]))
+    windowed = apply_window(volume, center, width)
+    return pack_container_header(windowed.shape, windowed.dtype, entry['spacing'], manifest['origin']) + windowed.tobytes()
@@ -1,22 +1,62 @@
 from django.shortcuts import render, redirect
 from django.conf import settings
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponse, FileResponse, StreamingHttpResponse, Http404
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib import messages
+from django.core.exceptions import SuspiciousFileOperation
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+from django.views.static import serve
 
 import os
+import re
+import uuid
 import shutil
 import json
+import mimetypes
 
-from .utils.dicom_utils import convert_dicom_to_nifti
-from .utils.nifti_utils import convert_nifti_to_binary
+from .utils.dicom_utils import convert_dicom_to_binary, convert_dicom_archive_to_binary
+from .utils.archive_utils import is_archive
+from .utils.nifti_utils import convert_nifti_to_binary, write_base_meta_from_pyramid
 from .utils.seg_utils import convert_segnifti_to_binary
 from .utils.landmarks_utils import (
     read_json_information,
     convert_landmarks_to_volume_binary,
     transform_landmarks_to_voxel_space,
-    apply_axis_permutation
+    apply_axis_permutation,
+    landmarks_to_point_set,
+    point_set_to_buffer,
+    point_set_to_landmarks
 )
+from .utils.volume_utils import bricks_index_path, read_bricks, pyramid_manifest_path
+from .utils.cache_utils import (
+    write_upload,
+    combine_digests,
+    conversion_key,
+    remove_conversion_outputs,
+    restore_from_cache,
+    store_in_cache
+)
+from .utils.compress_utils import choose_variant, choose_variants
+from .utils.mask_utils import mask_path, mask_index_path
+from .utils.mesh_utils import build_segmentation_meshes, mesh_index_path
+from .utils.container_utils import container_path
+from .utils.window_utils import render_window
+from .utils.timing_utils import stage, add_stages
+from .utils.upload_utils import (
+    UploadOffsetError,
+    init_upload,
+    load_upload,
+    upload_status,
+    append_chunk,
+    finalize_upload
+)
+from .jobs import submit_job, get_job
+from .workspaces import CASES_DIR, get_case_id, request_workspace, workspace_url
+
+MAX_BRICKS_PER_REQUEST = 64
+MAX_LAYERS_PER_REQUEST = 8
+PREVIEW_LEVEL = 2  # pyramid level of the 0.25 preview
 
 def login_view(request):
     """
@@ -30,73 +70,249 @@ def login_view(request):
     return render(request, 'interface/login.html')
 
 
+def start_dicom_conversion(workspace, source, digests):
+    """
+    Restores the conversion of an uploaded DICOM folder or archive from the cache, or queues it as job.
+    Converts directly to binary + meta (NIfTI copy optional).
+
+    Args:
+        workspace (str): Case workspace.
+        source (str): Folder with the DICOM files of this upload only, or a zip/tar archive.
+        digests (list[str]): sha256 of the files in source (cache key).
+
+    Returns:
+        tuple: (log message, job id or None).
+    """
+    cache_key = conversion_key('dicom', combine_digests(digests))
+    nifti_path = os.path.join(workspace, 'volume_dicom.nii') if settings.DICOM_NIFTI_EXPORT else None
+    bin_path = os.path.join(workspace, 'volume_dicom.bin')
+    meta_path = os.path.join(workspace, 'volume_base.meta.json')
+
+    with stage('cache restore'):
+        restored = restore_from_cache(settings.CONVERSION_CACHE_DIR, cache_key, workspace) is not None
+    if restored:
+        write_base_meta_from_pyramid(bin_path, meta_path)
+        return "DICOM uploaded, conversion restored from cache.", None
+
+    remove_conversion_outputs(workspace, 'volume_dicom')
+    convert = convert_dicom_archive_to_binary if is_archive(source) else convert_dicom_to_binary
+    job_id = submit_job('DICOM conversion', [
+        ('dicom to binary', convert, (source, bin_path, meta_path), {'nifti_out': nifti_path}),
+        ('store in cache', store_in_cache, (
+            settings.CONVERSION_CACHE_DIR, cache_key, workspace,
+            'volume_dicom', settings.CONVERSION_CACHE_MAX_BYTES
+        ), {}),
+    ], outputs=['volume_dicom.bin', 'volume_dicom_preview.bin', 'volume_dicom.pyramid.json'])
+    return f"DICOM uploaded, conversion queued (job {job_id}).", job_id
+
+
+def start_nifti_conversion(workspace, file_path, digest):
+    """
+    Restores the conversion of an uploaded NIfTI file from the cache, or queues it as job.
+
+    Args:
+        workspace (str): Case workspace.
+        file_path (str): Path of the NIfTI file.
+        digest (str): sha256 of the file (cache key).
+
+    Returns:
+        tuple: (log message, job id or None).
+    """
+    cache_key = conversion_key('nifti', digest)
+    bin_path = os.path.join(workspace, 'volume_nifti.bin')
+    meta_path = os.path.join(workspace, 'volume_base.meta.json')
+
+    with stage('cache restore'):
+        restored = restore_from_cache(settings.CONVERSION_CACHE_DIR, cache_key, workspace) is not None
+    if restored:
+        write_base_meta_from_pyramid(bin_path, meta_path)
+        return "NIfTI uploaded, conversion restored from cache.", None
+
+    remove_conversion_outputs(workspace, 'volume_nifti')
+    job_id = submit_job('NIfTI conversion', [
+        ('nifti to binary', convert_nifti_to_binary, (file_path, bin_path, meta_path), {}),
+        ('store in cache', store_in_cache, (
+            settings.CONVERSION_CACHE_DIR, cache_key, workspace,
+            'volume_nifti', settings.CONVERSION_CACHE_MAX_BYTES
+        ), {}),
+    ], outputs=['volume_nifti.bin', 'volume_nifti_preview.bin', 'volume_nifti.pyramid.json'])
+    return f"NIfTI uploaded, conversion queued (job {job_id}).", job_id
+
+
 def upload(request):
     """
     Handle upload of DICOM or NIfTI files in upload tab.
+    Conversions run as background jobs, see job_status.
+    All outputs are written to the workspace of the case of this session.
+    Large uploads can also use the resumable chunked protocol, see upload_init.
+    A DICOM upload can also be one zip/tar archive (PACS export), it is read without unpacking.
     """
     if not request.session.get('access_granted'):
         return redirect('login')
 
     log_messages = []
+    job_ids = []
 
     if request.method == 'POST':
-        # Handle DICOM upload, transform to NIFTI and convert to binary + meta
+        workspace = request_workspace(request, create=True)
+        # Handle DICOM upload
         dicom_files = request.FILES.getlist('dicom_file')
-        if dicom_files:
-            upload_dir = os.path.join(settings.MEDIA_ROOT, 'dicoms')
+        if len(dicom_files) == 1 and is_archive(dicom_files[0].name):
+            upload_dir = os.path.join(workspace, 'archives')
+            os.makedirs(upload_dir, exist_ok=True)
+            source = os.path.join(upload_dir, os.path.basename(dicom_files[0].name))
+            with stage('write upload', dicom_files[0].size):
+                digests = [write_upload(dicom_files[0], source)]
+
+            message, job_id = start_dicom_conversion(workspace, source, digests)
+            log_messages.append(message)
+            if job_id:
+                job_ids.append(job_id)
+        elif dicom_files:
+            # own folder per upload: the conversion reads exactly the files the cache key is built from
+            upload_dir = os.path.join(workspace, 'dicoms', uuid.uuid4().hex)
             os.makedirs(upload_dir, exist_ok=True)
 
-            for f in dicom_files:
-                with open(os.path.join(upload_dir, f.name), 'wb+') as dest:
-                    for chunk in f.chunks():
-                        dest.write(chunk)
-
-            nifti_path = os.path.join(settings.MEDIA_ROOT, 'volume_dicom.nii.gz')
-            bin_path = os.path.join(settings.MEDIA_ROOT, 'volume_dicom.bin')
-            meta_path = os.path.join(settings.MEDIA_ROOT, 'volume_base.meta.json')
+            # hash the bytes while they are written, identical uploads hit the conversion cache
+            with stage('write upload', sum(f.size for f in dicom_files)):
+                digests = [write_upload(f, os.path.join(upload_dir, f.name)) for f in dicom_files]
 
-            try:
-                convert_dicom_to_nifti(upload_dir, nifti_path)
-                convert_nifti_to_binary(nifti_path, bin_path, meta_path)
-                log_messages.append("DICOM uploaded, converted to NIfTI, and processed.")
-            except Exception as exc:
-                log_messages.append(f"Error during DICOM processing: {exc}")
+            message, job_id = start_dicom_conversion(workspace, upload_dir, digests)
+            log_messages.append(message)
+            if job_id:
+                job_ids.append(job_id)
 
         # Handle NIfTI upload and convert to binary + meta
         nifti_file = request.FILES.get('nifti_file')
         if nifti_file:
-            upload_dir = os.path.join(settings.MEDIA_ROOT, 'niftis')
+            upload_dir = os.path.join(workspace, 'niftis')
             os.makedirs(upload_dir, exist_ok=True)
             file_path = os.path.join(upload_dir, nifti_file.name)
 
-            with open(file_path, 'wb+') as dest:
-                for chunk in nifti_file.chunks():
-                    dest.write(chunk)
-            try:
-                convert_nifti_to_binary(
-                    file_path,
-                    os.path.join(settings.MEDIA_ROOT, 'volume_nifti.bin'),
-                    os.path.join(settings.MEDIA_ROOT, 'volume_base.meta.json')
-                )
-                log_messages.append("NIfTI uploaded and processed.")
-            except Exception as exc:
-                log_messages.append(f"Error during NIfTI processing: {exc}")
-
-    # If AJAX request, return log as JSON
+            with stage('write upload', nifti_file.size):
+                digest = write_upload(nifti_file, file_path)
+
+            message, job_id = start_nifti_conversion(workspace, file_path, digest)
+            log_messages.append(message)
+            if job_id:
+                job_ids.append(job_id)
+
+    # If AJAX request, return log and conversion jobs as JSON
     if request.headers.get('x-requested-with') == 'XMLHttpRequest':
-        return JsonResponse({'log': log_messages})
+        return JsonResponse({'log': log_messages, 'jobs': job_ids})
 
-    return render(request, 'interface/upload.html')
+    return render(request, 'interface/upload.html', {'media_base': workspace_url(get_case_id(request))})
+
+
+def upload_init(request):
+    """
+    Start a resumable chunked upload.
+
+    Body (JSON): {"kind": "dicom"|"nifti", "files": [{"name", "size", "sha256"?}, ...]}
+    Files whose sha256 was uploaded before are marked deduplicated and need no chunks.
+    Returns the upload id and per file the offset to continue from.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid request'}, status=400)
+    if not request.session.get('access_granted'):
+        return JsonResponse({'error': 'Access denied'}, status=403)
+    try:
+        body = json.loads(request.body)
+        manifest = init_upload(request_workspace(request, create=True), body.get('kind'), body.get('files'))
+    except (ValueError, TypeError, AttributeError) as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    return JsonResponse({'upload_id': manifest['id'],
+                         'files': upload_status(request_workspace(request), manifest)}, status=201)
+
+
+def upload_state(request, upload_id):
+    """
+    Return per file of an upload the received bytes (offset), to resume after a dropped connection.
+    """
+    if not request.session.get('access_granted'):
+        return JsonResponse({'error': 'Access denied'}, status=403)
+    manifest = load_upload(request_workspace(request), upload_id)
+    if manifest is None:
+        return JsonResponse({'error': 'Unknown upload'}, status=404)
+    return JsonResponse({'upload_id': upload_id, 'files': upload_status(request_workspace(request), manifest)})
+
+
+def upload_chunk(request, upload_id, index):
+    """
+    Append a chunk (raw request body) to file `index` of an upload.
+    The X-Upload-Offset header gives the position of the chunk in the file, it has to
+    match the received bytes; otherwise 409 with the current offset.
+    -> the body is streamed to disk, not read into memory
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid request'}, status=400)
+    if not request.session.get('access_granted'):
+        return JsonResponse({'error': 'Access denied'}, status=403)
+    workspace = request_workspace(request)
+    manifest = load_upload(workspace, upload_id)
+    if manifest is None:
+        return JsonResponse({'error': 'Unknown upload'}, status=404)
+    try:
+        offset = int(request.headers.get('X-Upload-Offset', ''))
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        return JsonResponse({'error': 'Expected numeric X-Upload-Offset and Content-Length'}, status=400)
+
+    try:
+        with stage('write chunk', length):
+            offset = append_chunk(workspace, manifest, index, offset, request, length)
+    except UploadOffsetError as exc:
+        return JsonResponse({'error': str(exc), 'offset': exc.offset}, status=409)
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    return JsonResponse({'offset': offset})
+
+
+def upload_finalize(request, upload_id):
+    """
+    Complete an upload: checks all files, places them in the case workspace and
+    starts the conversion (same as upload, including the conversion cache).
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid request'}, status=400)
+    if not request.session.get('access_granted'):
+        return JsonResponse({'error': 'Access denied'}, status=403)
+    workspace = request_workspace(request)
+    manifest = load_upload(workspace, upload_id)
+    if manifest is None:
+        return JsonResponse({'error': 'Unknown upload'}, status=404)
+
+    archive = manifest['kind'] == 'dicom' and len(manifest['files']) == 1 and is_archive(manifest['files'][0]['name'])
+    if manifest['kind'] == 'nifti':
+        dest_dir = os.path.join(workspace, 'niftis')
+    else:
+        dest_dir = os.path.join(workspace, 'archives') if archive else os.path.join(workspace, 'dicoms', manifest['id'])
+    try:
+        with stage('finalize upload', sum(f['size'] for f in manifest['files'])):
+            placed = finalize_upload(workspace, manifest, dest_dir)
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+
+    if archive:
+        message, job_id = start_dicom_conversion(workspace, placed[0][0], [placed[0][1]])
+    elif manifest['kind'] == 'dicom':
+        message, job_id = start_dicom_conversion(workspace, dest_dir, [digest for _, digest in placed])
+    else:
+        message, job_id = start_nifti_conversion(workspace, *placed[0])
+    return JsonResponse({'log': [message], 'jobs': [job_id] if job_id else []})
 
 
 def list_media_files(request):
     """
-    Return a list of all files in the MEDIA_ROOT directory (used in upload tab.).
+    Return a list of all files in the workspace of this case (used in upload tab.).
     """
+    if not request.session.get('access_granted'):
+        return JsonResponse({'error': 'Access denied'}, status=403)
+    workspace = request_workspace(request)
     entries = []
-    for root, _, files in os.walk(settings.MEDIA_ROOT):
+    for root, _, files in os.walk(workspace):
         for f in files:
-            rel_path = os.path.relpath(os.path.join(root, f), settings.MEDIA_ROOT)
+            rel_path = os.path.relpath(os.path.join(root, f), workspace)
             entries.append(rel_path)
     return JsonResponse({'files': entries})
 
@@ -107,7 +323,7 @@ def viewer(request):
     """
     if not request.session.get('access_granted'):
         return redirect('login')
-    return render(request, 'interface/viewer.html')
+    return render(request, 'interface/viewer.html', {'media_base': workspace_url(get_case_id(request))})
 
 
 def segmarks(request):
@@ -116,19 +332,24 @@ def segmarks(request):
     """
     if not request.session.get('access_granted'):
         return redirect('login')
-    return render(request, 'interface/segmarks.html')
+    return render(request, 'interface/segmarks.html', {'media_base': workspace_url(get_case_id(request))})
 
 
 def reset_viewer(request):
     """
-    Empty the viewer in viewer tab and segmarks tab
+    Empty the viewer in viewer tab and segmarks tab (only the workspace of this case)
     """
     if request.method != 'POST':
         return JsonResponse({'status': 'invalid'}, status=405)
+    if not request.session.get('access_granted'):
+        return JsonResponse({'error': 'Access denied'}, status=403)
 
     try:
-        for filename in os.listdir(settings.MEDIA_ROOT):
-            path = os.path.join(settings.MEDIA_ROOT, filename)
+        workspace = request_workspace(request)
+        if not os.path.isdir(workspace):
+            return JsonResponse({'status': 'success'})
+        for filename in os.listdir(workspace):
+            path = os.path.join(workspace, filename)
             if os.path.isfile(path):
                 os.remove(path)
             else:
@@ -140,16 +361,19 @@ def reset_viewer(request):
 
 def run_segmentation(request):
     """
-    Process the segmentation NIfTI file and convert to binary format + meta.
+    Process the segmentation NIfTI file and convert to binary format + meta (background job).
     """
     if request.method != 'POST':
         return JsonResponse({'error': 'Invalid request'}, status=400)
+    if not request.session.get('access_granted'):
+        return JsonResponse({'error': 'Access denied'}, status=403)
 
     nifti_file = request.FILES.get('nifti_file')
     if nifti_file is None:
         return JsonResponse({'error': 'Missing NIfTI file'}, status=400)
 
-    upload_dir = os.path.join(settings.MEDIA_ROOT, 'niftis')
+    workspace = request_workspace(request, create=True)
+    upload_dir = os.path.join(workspace, 'niftis')
     os.makedirs(upload_dir, exist_ok=True)
     file_path = os.path.join(upload_dir, nifti_file.name)
 
@@ -157,30 +381,40 @@ def run_segmentation(request):
         for chunk in nifti_file.chunks():
             destination.write(chunk)
 
-    try:
-        output_file = os.path.join(settings.MEDIA_ROOT, 'segmentation_result.bin')
-        metadata_file = os.path.join(settings.MEDIA_ROOT, 'segmentation_result.meta.json')
-        reference_meta = os.path.join(settings.MEDIA_ROOT, 'volume_base.meta.json')
+    output_file = os.path.join(workspace, 'segmentation_result.bin')
+    metadata_file = os.path.join(workspace, 'segmentation_result.meta.json')
+    reference_meta = os.path.join(workspace, 'volume_base.meta.json')
 
-        convert_segnifti_to_binary(file_path, output_file, metadata_file, reference_meta)
+    full_resolution = settings.SEGMENTATION_FULL_RESOLUTION
+    outputs = ['segmentation_result_preview.bin']
+    if full_resolution:
+        outputs += ['segmentation_result.bin', 'segmentation_result.pyramid.json']
 
-        return JsonResponse({'message': 'Segmentation completed', 'output': output_file}, status=200)
-    except Exception as exc:
-        return JsonResponse({'error': f'Error during processing: {str(exc)}'}, status=500)
+    job_id = submit_job('Segmentation conversion', [
+        ('segmentation to binary', convert_segnifti_to_binary, (file_path, output_file, metadata_file, reference_meta),
+         {'full_resolution': full_resolution}),
+    ], outputs=outputs)
+
+    return JsonResponse({'message': 'Segmentation queued', 'job_id': job_id}, status=202)
 
 
 def run_landmarks(request):
     """
-    Process landmark files, transform and convert them to voxel space, and export as binary volume.
+    Process landmark files and transform them to voxel space.
+    The result is stored as a point set (landmarks_points.json), see landmark_points;
+    the voxelized volume is only generated on request, see landmark_volume.
     """
     if request.method != 'POST':
         return JsonResponse({'error': 'Invalid request'}, status=400)
+    if not request.session.get('access_granted'):
+        return JsonResponse({'error': 'Access denied'}, status=403)
 
     landmark_files = request.FILES.getlist('landmarks_file')
     if not landmark_files:
         return JsonResponse({'error': 'No landmark files uploaded.'}, status=400)
 
-    upload_dir = os.path.join(settings.MEDIA_ROOT, 'landmarks')
+    workspace = request_workspace(request, create=True)
+    upload_dir = os.path.join(workspace, 'landmarks')
     os.makedirs(upload_dir, exist_ok=True)
 
     for f in landmark_files:
@@ -193,7 +427,7 @@ def run_landmarks(request):
         landmarks = read_json_information(upload_dir)
 
         # Load reference metadata
-        ref_meta_path = os.path.join(settings.MEDIA_ROOT, 'volume_base.meta.json')
+        ref_meta_path = os.path.join(workspace, 'volume_base.meta.json')
         if not os.path.exists(ref_meta_path):
             return JsonResponse({'error': 'Reference metadata not found.'}, status=400)
 
@@ -207,13 +441,363 @@ def run_landmarks(request):
         # Apply axis transformation: z,y,x → x,y,z
         landmarks = apply_axis_permutation(landmarks, order=[2, 1, 0])
 
-        # Convert to voxel space and export
+        # Convert to voxel space and store as point set
         voxel_landmarks = transform_landmarks_to_voxel_space(landmarks, origin, spacing, dims)
-        bin_out = os.path.join(settings.MEDIA_ROOT, 'landmarks_volume.bin')
-        meta_out = os.path.join(settings.MEDIA_ROOT, 'landmarks_volume.meta.json')
-
-        convert_landmarks_to_volume_binary(voxel_landmarks, dims, spacing, origin, bin_out, meta_out)
+        point_set = landmarks_to_point_set(voxel_landmarks, dims, spacing, origin)
+        with open(os.path.join(workspace, 'landmarks_points.json'), 'w', encoding='utf-8') as f:
+            json.dump(point_set, f)
 
-        return JsonResponse({'message': 'Landmarks processed'}, status=200)
+        return JsonResponse({'message': 'Landmarks converted', 'count': len(point_set['ids'])})
     except Exception as exc:
         return JsonResponse({'error': str(exc)}, status=500)
+
+
+def landmark_points(request):
+    """
+    Return the landmark point set: ids, labels, voxel and world coordinates.
+
+    Query: ?format=json (default) or ?format=float32
+    float32 returns per landmark i, j, k, x, y, z as a binary buffer,
+    the X-Landmarks header holds ids, labels and the anatomy geometry.
+    """
+    if not request.session.get('access_granted'):
+        return JsonResponse({'error': 'Access denied'}, status=403)
+    points_path = os.path.join(request_workspace(request), 'landmarks_points.json')
+    if not os.path.exists(points_path):
+        return JsonResponse({'error': 'No landmarks converted.'}, status=404)
+
+    with open(points_path, encoding='utf-8') as f:
+        point_set = json.load(f)
+
+    output_format = request.GET.get('format', 'json')
+    if output_format == 'json':
+        return JsonResponse(point_set)
+    if output_format != 'float32':
+        return JsonResponse({'error': 'Expected format=json or format=float32'}, status=400)
+
+    response = HttpResponse(point_set_to_buffer(point_set), content_type='application/octet-stream')
+    response['X-Landmarks'] = json.dumps({k: v for k, v in point_set.items() if k not in ('voxel', 'world')})
+    return response
+
+
+def landmark_volume(request):
+    """
+    Generate the voxelized landmark volume (spheres) from the point set, as a background job.
+    Nothing is queued when the volume is already up to date.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid request'}, status=400)
+    if not request.session.get('access_granted'):
+        return JsonResponse({'error': 'Access denied'}, status=403)
+
+    points_path = os.path.join(request_workspace(request), 'landmarks_points.json')
+    if not os.path.exists(points_path):
+        return JsonResponse({'error': 'No landmarks converted.'}, status=404)
+
+    bin_out = os.path.join(os.path.dirname(points_path), 'landmarks_volume.bin')
+    meta_out = os.path.join(os.path.dirname(points_path), 'landmarks_volume.meta.json')
+    if os.path.exists(meta_out) and os.path.getmtime(meta_out) >= os.path.getmtime(points_path):
+        return JsonResponse({'message': 'Landmark volume ready', 'job_id': None})
+
+    with open(points_path, encoding='utf-8') as f:
+        point_set = json.load(f)
+
+    job_id = submit_job('Landmark conversion', [
+        ('landmarks to binary', convert_landmarks_to_volume_binary,
+         (point_set_to_landmarks(point_set), point_set['dims'], point_set['spacing'], point_set['origin'],
+          bin_out, meta_out), {}),
+    ], outputs=['landmarks_volume.bin', 'landmarks_volume_preview.bin', 'landmarks_volume.pyramid.json'])
+
+    return JsonResponse({'message': 'Landmark volume queued', 'job_id': job_id}, status=202)
+
+
+def segmentation_meshes(request):
+    """
+    Build the surface meshes of the segmentation labels from the full resolution labels, as a background job.
+    Nothing is queued when the meshes are up to date, the job restores a segmentation
+    that was meshed before from the conversion cache.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid request'}, status=400)
+    if not request.session.get('access_granted'):
+        return JsonResponse({'error': 'Access denied'}, status=403)
+
+    workspace = request_workspace(request)
+    bin_path = os.path.join(workspace, 'segmentation_result.bin')
+    meta_path = os.path.join(workspace, 'segmentation_result.meta.json')
+    if not os.path.exists(bin_path) or not os.path.exists(meta_path):
+        return JsonResponse({'error': 'No full resolution segmentation converted.'}, status=404)
+
+    mesh_out = os.path.join(workspace, 'segmentation_mesh.mesh')
+    if os.path.exists(mesh_index_path(mesh_out)) and os.path.getmtime(mesh_index_path(mesh_out)) >= os.path.getmtime(bin_path):
+        return JsonResponse({'message': 'Meshes ready', 'job_id': None})
+
+    job_id = submit_job('Segmentation meshes', [
+        ('labels to meshes', build_segmentation_meshes, (bin_path, meta_path, mesh_out),
+         {'cache_dir': settings.CONVERSION_CACHE_DIR, 'cache_max_bytes': settings.CONVERSION_CACHE_MAX_BYTES}),
+    ], outputs=['segmentation_mesh.mesh'])
+
+    return JsonResponse({'message': 'Meshes queued', 'job_id': job_id}, status=202)
+
+
+def fetch_meshes(request):
+    """
+    Return the surface meshes of the segmentation labels.
+
+    The body holds per label float32 vertices (x, y, z world) followed by uint32 triangles,
+    the X-Mesh header the index with per label counts and byte offsets.
+    The precompressed variant is sent when the client accepts it (Content-Encoding).
+    """
+    if not request.session.get('access_granted'):
+        return JsonResponse({'error': 'Access denied'}, status=403)
+    mesh_path = os.path.join(request_workspace(request), 'segmentation_mesh.mesh')
+    if not os.path.exists(mesh_index_path(mesh_path)):
+        return JsonResponse({'error': 'Meshes not found.'}, status=404)
+
+    with open(mesh_index_path(mesh_path), encoding='utf-8') as f:
+        index = json.load(f)
+    variant, encoding = choose_variant(mesh_path, request.headers.get('Accept-Encoding', ''))
+    response = FileResponse(open(variant or mesh_path, 'rb'), content_type='application/octet-stream')
+    if variant is not None:
+        response['Content-Encoding'] = encoding
+    response['X-Mesh'] = json.dumps(index)
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
+
+
+def fetch_bricks(request, volume_name):
+    """
+    Return one or more bricks of a converted volume for a pyramid level.
+
+    Query: ?level=0&brick=bx,by,bz[&brick=...]
+    The bricks are concatenated in the requested order, the X-Bricks header
+    lists per brick its coordinates, dims [x, y, z], byte offset and length,
+    with the dtype and the placement of the level (origin; offset and
+    reference_dims for a cropped overlay, in voxels of the level).
+    """
+    if not request.session.get('access_granted'):
+        return JsonResponse({'error': 'Access denied'}, status=403)
+    if not re.fullmatch(r'[A-Za-z0-9_\-]+', volume_name):
+        return JsonResponse({'error': 'Invalid volume name'}, status=400)
+
+    bin_path = os.path.join(request_workspace(request), f'{volume_name}.bin')
+    if not os.path.exists(bricks_index_path(bin_path)):
+        return JsonResponse({'error': 'Brick index not found.'}, status=404)
+
+    try:
+        level = int(request.GET.get('level', 0))
+        bricks = [tuple(int(v) for v in b.split(',')) for b in request.GET.getlist('brick')]
+    except ValueError:
+        return JsonResponse({'error': 'Invalid level or brick coordinates'}, status=400)
+
+    if not bricks or any(len(b) != 3 for b in bricks):
+        return JsonResponse({'error': 'Expected brick=bx,by,bz'}, status=400)
+    if len(bricks) > MAX_BRICKS_PER_REQUEST:
+        return JsonResponse({'error': f'At most {MAX_BRICKS_PER_REQUEST} bricks per request'}, status=400)
+
+    try:
+        result = read_bricks(bin_path, level, bricks)
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+
+    with open(bricks_index_path(bin_path), encoding='utf-8') as f:
+        index = json.load(f)
+    entry = next(e for e in index['levels'] if e['level'] == level)
+    header = {'level': level, 'dtype': index['dtype'], 'bricks': []}
+    if 'origin' in index:
+        header['origin'] = index['origin']
+    for key in ('offset', 'reference_dims'):
+        if key in entry:
+            header[key] = entry[key]
+
+    offset = 0
+    for brick in result:
+        header['bricks'].append({'brick': brick['brick'], 'dims': brick['dims'], 'offset': offset,
+                                 'length': len(brick['data'])})
+        offset += len(brick['data'])
+
+    response = HttpResponse(b''.join(b['data'] for b in result), content_type='application/octet-stream')
+    response['X-Bricks'] = json.dumps(header)
+    return response
+
+
+def fetch_mask(request, volume_name):
+    """
+    Return the run-length encoded mask of a segmentation or landmark volume
+    (e.g. segmentation_result or segmentation_result_preview).
+
+    The body holds starts (uint32), lengths (uint32) and values (uint8) of all runs,
+    the X-Mask header the index with dims, bounding box and number of runs.
+    """
+    if not request.session.get('access_granted'):
+        return JsonResponse({'error': 'Access denied'}, status=403)
+    if not re.fullmatch(r'[A-Za-z0-9_\-]+', volume_name):
+        return JsonResponse({'error': 'Invalid volume name'}, status=400)
+
+    bin_path = os.path.join(request_workspace(request), f'{volume_name}.bin')
+    if not os.path.exists(mask_index_path(bin_path)):
+        return JsonResponse({'error': 'Mask not found.'}, status=404)
+
+    with open(mask_index_path(bin_path), encoding='utf-8') as f:
+        index = json.load(f)
+    with open(mask_path(bin_path), 'rb') as f:
+        response = HttpResponse(f.read(), content_type='application/octet-stream')
+    response['X-Mask'] = json.dumps(index)
+    return response
+
+
+def stream_files(paths, chunk_size=1024 * 1024):
+    """
+    Yields the bytes of several files after each other, chunk by chunk.
+    """
+    for path in paths:
+        with open(path, 'rb') as f:
+            yield from iter(lambda: f.read(chunk_size), b'')
+
+
+def fetch_layers(request):
+    """
+    Return several layers (volume containers, e.g. volume_dicom_preview and
+    segmentation_result_preview) in one response, so opening a case costs one round trip.
+
+    Query: ?layer=<name>[&layer=...]
+    The containers are concatenated in the requested order, the X-Layers header
+    lists per layer its name, byte offset and length (of the decoded body). Missing
+    layers are skipped and listed under 'missing'. Crop offset, reference dims and
+    label index of an overlay travel inside its container (metadata block).
+    -> the precompressed variants written by the conversion are streamed when the
+       client accepts them (see choose_variants), nothing is compressed per request
+    """
+    if not request.session.get('access_granted'):
+        return JsonResponse({'error': 'Access denied'}, status=403)
+    names = request.GET.getlist('layer')
+    if not names:
+        return JsonResponse({'error': 'Expected layer=<name>'}, status=400)
+    if len(names) > MAX_LAYERS_PER_REQUEST:
+        return JsonResponse({'error': f'At most {MAX_LAYERS_PER_REQUEST} layers per request'}, status=400)
+    if not all(re.fullmatch(r'[A-Za-z0-9_\-]+', name) for name in names):
+        return JsonResponse({'error': 'Invalid layer name'}, status=400)
+
+    workspace = request_workspace(request)
+    layers, missing, paths = [], [], []
+    offset = 0
+    for name in names:
+        path = container_path(os.path.join(workspace, f'{name}.bin'))
+        if not os.path.exists(path):
+            missing.append(name)
+            continue
+        size = os.path.getsize(path)
+        layers.append({'name': name, 'offset': offset, 'length': size})
+        paths.append(path)
+        offset += size
+
+    if not layers:
+        return JsonResponse({'error': 'Layers not found.', 'missing': missing}, status=404)
+
+    files, encoding = choose_variants(paths, request.headers.get('Accept-Encoding', ''))
+    response = StreamingHttpResponse(stream_files(files), content_type='application/octet-stream')
+    response['Content-Length'] = sum(os.path.getsize(f) for f in files)
+    if encoding is not None:
+        response['Content-Encoding'] = encoding
+    response['X-Layers'] = json.dumps({'layers': layers, 'missing': missing})
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
+
+
+def window_volume(request, volume_name):
+    """
+    Return a pyramid level of a volume rendered with a window (center/level and width)
+    from its native precision store, as a uint8 volume container.
+
+    Query: ?center=40&width=400[&level=2]
+    """
+    if not request.session.get('access_granted'):
+        return JsonResponse({'error': 'Access denied'}, status=403)
+    if not re.fullmatch(r'[A-Za-z0-9_\-]+', volume_name):
+        return JsonResponse({'error': 'Invalid volume name'}, status=400)
+
+    try:
+        center = float(request.GET['center'])
+        width = float(request.GET['width'])
+        level = int(request.GET.get('level', PREVIEW_LEVEL))
+    except (KeyError, ValueError):
+        return JsonResponse({'error': 'Expected numeric center, width and level'}, status=400)
+    if width <= 0:
+        return JsonResponse({'error': 'Window width has to be positive'}, status=400)
+
+    bin_path = os.path.join(request_workspace(request), f'{volume_name}.bin')
+    try:
+        data = render_window(bin_path, level, center, width, settings.WINDOW_CACHE_MAX_BYTES)
+    except FileNotFoundError as exc:
+        return JsonResponse({'error': str(exc)}, status=404)
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+
+    return HttpResponse(data, content_type='application/octet-stream')
+
+
+def volume_stats(request, volume_name):
+    """
+    Return the intensity statistics of a converted volume (min/max, mean/std,
+    approximate percentiles, auto window and a histogram), computed during conversion.
+    """
+    if not request.session.get('access_granted'):
+        return JsonResponse({'error': 'Access denied'}, status=403)
+    if not re.fullmatch(r'[A-Za-z0-9_\-]+', volume_name):
+        return JsonResponse({'error': 'Invalid volume name'}, status=400)
+
+    manifest_path = pyramid_manifest_path(os.path.join(request_workspace(request), f'{volume_name}.bin'))
+    if not os.path.exists(manifest_path):
+        return JsonResponse({'error': 'Volume not found.'}, status=404)
+
+    with open(manifest_path, encoding='utf-8') as f:
+        stats = json.load(f).get('stats')
+    if stats is None:
+        return JsonResponse({'error': 'No statistics for this volume.'}, status=404)
+    return JsonResponse(stats)
+
+
+def job_status(request, job_id):
+    """
+    Return state, progress, output artifacts and stage timings of a conversion job.
+    The timings of a finished job are also added to the Server-Timing header.
+    """
+    if not request.session.get('access_granted'):
+        return JsonResponse({'error': 'Access denied'}, status=403)
+    job = get_job(job_id)
+    if job is None:
+        return JsonResponse({'error': 'Unknown job'}, status=404)
+    if job['state'] == 'done':
+        add_stages(job['timings'], prefix='job/')
+    return JsonResponse(job)
+
+
+def serve_media(request, file_path):
+    """
+    Serve a file from MEDIA_ROOT. When the client accepts one of the precompressed
+    variants written by the conversion (gzip, zstd, brotli), that variant is returned
+    with Content-Encoding, the browser decompresses it transparently.
+    """
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, file_path)
+    except SuspiciousFileOperation:
+        raise Http404('Invalid path')
+
+    # workspaces are only served to the session of their case
+    parts = file_path.split('/')
+    if parts[0] == CASES_DIR and (len(parts) < 3 or parts[1] != request.session.get('case_id')):
+        raise Http404('Unknown case')
+
+    variant = None
+    if os.path.isfile(full_path):
+        variant, encoding = choose_variant(full_path, request.headers.get('Accept-Encoding', ''))
+
+    if variant is None:
+        response = serve(request, file_path, document_root=settings.MEDIA_ROOT)
+    else:
+        content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+        response = FileResponse(open(variant, 'rb'), content_type=content_type, filename=os.path.basename(full_path))
+        response['Content-Encoding'] = encoding
+
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
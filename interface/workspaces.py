@@ -0,0 +1,77 @@
+import os
+import re
+import time
+import uuid
+import shutil
+
+from django.conf import settings
+
+# Workspaces live in MEDIA_ROOT/cases/<case id>/
+CASES_DIR = 'cases'
+
+
+def get_case_id(request):
+    """
+    Returns the case id of the session, a new one is created on first use.
+    """
+    case_id = request.session.get('case_id')
+    if not case_id or not re.fullmatch(r'[0-9a-f]{32}', case_id):
+        case_id = uuid.uuid4().hex
+        request.session['case_id'] = case_id
+    return case_id
+
+
+def workspace_dir(case_id, create=False):
+    """
+    Returns the folder of a case workspace. It is only created for a write (create=True),
+    requests that only read leave no folder behind.
+    A new workspace starts a cleanup of the expired ones, see remove_expired_workspaces.
+    """
+    path = os.path.join(settings.MEDIA_ROOT, CASES_DIR, case_id)
+    if create and not os.path.isdir(path):
+        os.makedirs(path, exist_ok=True)
+        remove_expired_workspaces()
+    return path
+
+
+def remove_expired_workspaces(max_age=None):
+    """
+    Removes the workspaces that were not used for max_age seconds (default CASE_RETENTION_SECONDS).
+    The last use of a workspace is the mtime of its folder, see request_workspace.
+
+    Returns:
+        list[str]: Removed case ids.
+    """
+    max_age = settings.CASE_RETENTION_SECONDS if max_age is None else max_age
+    cases_dir = os.path.join(settings.MEDIA_ROOT, CASES_DIR)
+    if not os.path.isdir(cases_dir):
+        return []
+
+    removed = []
+    expired = time.time() - max_age
+    for case_id in os.listdir(cases_dir):
+        path = os.path.join(cases_dir, case_id)
+        if os.path.isdir(path) and os.path.getmtime(path) < expired:
+            print(f"[INFO] removing expired case {case_id}")
+            shutil.rmtree(path, ignore_errors=True)
+            removed.append(case_id)
+    return removed
+
+
+def workspace_url(case_id):
+    """
+    Returns the media URL of a case workspace (ends with a slash).
+    """
+    return f'{settings.MEDIA_URL}{CASES_DIR}/{case_id}/'
+
+
+def request_workspace(request, create=False):
+    """
+    Returns the workspace folder of the case of this session (created with create=True).
+    All conversion outputs of a case are written here, so cases do not overwrite each other.
+    Every access marks the workspace as used, so active cases are not removed as expired.
+    """
+    path = workspace_dir(get_case_id(request), create=create)
+    if os.path.isdir(path):
+        os.utime(path)
+    return path
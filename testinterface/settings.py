@@ -34,6 +34,22 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 DATA_UPLOAD_MAX_NUMBER_FILES = 5000  # or higher if necessary
 
+# Conversion cache (outside MEDIA_ROOT, survives a reset of the media folder)
+CONVERSION_CACHE_DIR = os.path.join(BASE_DIR, 'cache')
+CONVERSION_CACHE_MAX_BYTES = 5 * 1024 ** 3  # least recently used entries are evicted above this size
+
+# Case workspaces (MEDIA_ROOT/cases/<case id>/) not used for this long are removed
+CASE_RETENTION_SECONDS = 24 * 60 * 60
+
+# Rendered windows kept in memory per process, least recently used windows are evicted above this size
+WINDOW_CACHE_MAX_BYTES = 256 * 1024 ** 2
+
+# DICOM uploads are converted to binary directly, set True to also keep an (uncompressed) volume_dicom.nii
+DICOM_NIFTI_EXPORT = False
+
+# The viewer shows the segmentation preview only, set False to skip the full resolution segmentation outputs
+SEGMENTATION_FULL_RESOLUTION = True
+
 # Application definition
 # Installed Django apps:
 INSTALLED_APPS = [
@@ -48,6 +64,7 @@ INSTALLED_APPS = [
 
 #middelware configuration
 MIDDLEWARE = [
+    "interface.middleware.ServerTimingMiddleware",  # Server-Timing header + JSON timing log (first, times the whole request)
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -15,17 +15,22 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 
+import re
+
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from django.conf import settings
-from django.conf.urls.static import static
+
+from interface.views import serve_media
 
 urlpatterns = [
     path('', include('interface.urls')),
     path('admin/', admin.site.urls),
 ]
 
-# Add media to directory
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+# Add media to directory, binaries are served precompressed when the client accepts it
+urlpatterns += [
+    re_path(r'^%s(?P<file_path>.*)$' % re.escape(settings.MEDIA_URL.lstrip('/')), serve_media, name='serve_media'),
+]
 
 